@@ -0,0 +1,388 @@
+"""
+Cooperative display loop for the Matrix Portal
+
+The display work is split into asyncio tasks (scroll, count down tick, feed poll and
+clock resync) so the subject keeps scrolling and the count down keeps ticking while the
+other tasks wait out the poll interval, the resync interval or an error backoff. On the
+device the network calls themselves still block while they run.
+
+Nothing here touches the hardware directly. The tasks only need a portal with the
+MatrixPortal text API and plain callables for the network, so they also run under
+CPython with stand-in display and network objects.
+"""
+import asyncio
+import time
+
+from breaker import CircuitBreaker, CircuitOpenError
+from countdown import CountDown
+from feed import ApptQueue
+from frames import compute_status
+from render import TextRenderer
+from scheduler import next_poll_secs
+from telemetry import Telemetry
+
+# how often the count down row is checked for a new second
+COUNT_DOWN_TICK = 0.1
+# how long an error message stays on the time row before the count down comes back
+ERROR_DISPLAY_SECS = 30
+# the error message color
+ERROR_COLOR = 0xFF0000
+
+
+def my_local_time(pad=0) -> str:
+    """Returns the local time as a string formatted HH:MM:SS
+    :param int pad: the number of spaced characters to prepend to the string to position on the RGB LED display. Default is 0
+    """
+    # now that we connected to the network to get the time,
+    # we can display the local time
+    curr_time_struct = time.localtime()
+    curr_time_str = '{sp}{lhrs:0>2}:{lmin:0>2}:{lsec:0>2}'.format(
+                sp=' '  * pad,
+                lhrs=curr_time_struct.tm_hour,
+                lmin=curr_time_struct.tm_min,
+                lsec=curr_time_struct.tm_sec)
+    return curr_time_str
+
+
+class NextMeetingApp:
+    """The display tasks for the next meeting
+
+    :param portal: the MatrixPortal, or a stand-in with set_text, set_text_color, set_background and scroll
+    :param FeedPoller poller: fetches and parses the appointment feed
+    :param sync_time: callable that sets the local time from the network
+    :param dict status_msg: the status row icon, color and text for each response status
+    :param TextRenderer renderer: the text box cache. Default is None to make one for the portal
+    :param IconCache icons: the status icon cache. Default is None to use the portal set_background
+    :param SubjectStrip strip: draws long subjects once and scrolls the bitmap. Default is None to scroll text box 0
+    :param sim: a simdata.sim to use instead of the feed. Default is None
+    :param FeedSubscriber push: receives feed changes over MQTT, polling only while it is disconnected. Default is None to always poll
+    :param DriftClock clock: drift corrected time and resync interval. Default is None to use time.time() and time_resync
+    :param dict error_text: exception type to time row message for the feed errors to show
+    :param Telemetry telemetry: the timers and counters. Default is None for disabled telemetry
+    :param publish_telemetry: callable sending the telemetry JSON, e.g. to its own feed. Default is None
+    :param int telemetry_secs: how often to publish, or print when debug, the telemetry. Default is 300
+    :param Snapshot snapshot: keeps the appointments and time across reboots for restore(). Default is None
+    :param CircuitBreaker fetch_breaker: backs off and stops the feed polls while they fail. Default is None for a CircuitBreaker('feed')
+    :param CircuitBreaker time_breaker: backs off and stops the time syncs while they fail. Default is None for a CircuitBreaker('time')
+    :param bool debug: print debug messages. Default is False
+    """
+
+    def __init__(self, portal, poller, sync_time, status_msg, renderer=None, icons=None, strip=None, sim=None,
+                 push=None, clock=None, error_text=None, telemetry=None, publish_telemetry=None, telemetry_secs=300,
+                 snapshot=None, fetch_breaker=None, time_breaker=None, debug=False, subject_scroll_limit=10, scroll_multiplier=3,
+                 scroll_delay=0.04, time_resync=300, sim_poll_secs=5, push_check_secs=0.5):
+        self.portal = portal
+        self.poller = poller
+        self.sync_time = sync_time
+        self.status_msg = status_msg
+        self.renderer = renderer or TextRenderer(portal)
+        self.icons = icons
+        self.strip = strip
+        self.sim = sim
+        self.push = push
+        self.push_check_secs = push_check_secs
+        self.clock = clock
+        self.error_text = error_text or {}
+        self.telemetry = telemetry or Telemetry(enabled=False)
+        self.publish_telemetry = publish_telemetry
+        self.telemetry_secs = telemetry_secs
+        self.snapshot = snapshot
+        self.fetch_breaker = fetch_breaker or CircuitBreaker('feed')
+        self.time_breaker = time_breaker or CircuitBreaker('time')
+        # the clock was set from the snapshot and has not synced since
+        self.time_estimated = False
+        self.debug = debug
+        self.subject_scroll_limit = subject_scroll_limit
+        self.scroll_multiplier = scroll_multiplier
+        self.scroll_delay = scroll_delay
+        self.time_resync = time_resync
+        self.sim_poll_secs = sim_poll_secs
+        self.queue = ApptQueue()
+        self.count_down = None
+        self._error_until = 0
+
+    def now(self) -> int:
+        """Returns the current time in seconds since the epoch, drift corrected when there is a clock"""
+        if self.clock:
+            return int(self.clock.now())
+        return int(time.time())
+
+    def show_error(self, text: str) -> None:
+        """Show an error message on the time row for ERROR_DISPLAY_SECS
+        :param str text: the message
+        """
+        self.renderer.set_text_color(ERROR_COLOR, 1)
+        self.renderer.set_text(text, 1)
+        self._error_until = time.monotonic() + ERROR_DISPLAY_SECS
+
+    def show_appt(self, appt_data: dict) -> None:
+        """Set the subject, status row and count down for a new appointment
+        :param dict appt_data: the decoded appointment
+        """
+        if self.debug:
+            print(f'appt_data: {appt_data}')
+        self.telemetry.count('appts')
+
+        if len(appt_data['subject']) > self.subject_scroll_limit:
+            if self.strip:
+                # drawn once here, so the whole subject can scroll
+                self.strip.set_text(appt_data['subject'].strip())
+            else:
+                self.renderer.set_text(appt_data['subject'].strip()[:self.subject_scroll_limit * self.scroll_multiplier], 0)
+            self.renderer.set_text(' ', 3)
+        else:
+            self.renderer.set_text(appt_data['subject'].strip(), 3)
+            if self.strip:
+                self.strip.clear()
+            else:
+                self.renderer.set_text(' ', 0)
+
+        # Set Response status text and icon, precomputed by the PC client in the frames encoding
+        status_display = appt_data.get('status') or compute_status(
+            appt_data['responseStatus'], appt_data['meeting_status'])
+        print(f'{my_local_time()} status_display: {status_display}')
+        self.renderer.set_text(self.status_msg[status_display]['text'], 2)
+        self.renderer.set_text_color(
+            self.status_msg[status_display]['color'], 2)
+        if self.icons:
+            # switches by reference and skips the display when the icon is the same
+            self.icons.show(self.status_msg[status_display]['icon'])
+        else:
+            self.portal.set_background(
+                self.status_msg[status_display]['icon'], [0, 21])
+
+        # work out the count down labels and color band edges once per appointment
+        self.count_down = CountDown(appt_data['start'], appt_data['responseStatus'],
+                                    appt_data.get('label'), appt_data.get('edges'))
+
+    def restore(self) -> bool:
+        """Show the appointments saved by the last run, before the network is up. Returns True
+        if there was a snapshot to show
+        """
+        if not self.snapshot or self.sim:
+            return False
+        try:
+            appts, saved_at = self.snapshot.load()
+        except Exception as e:
+            if self.debug:
+                print(f'{my_local_time()} snapshot load exception: {e}')
+            return False
+        if appts is None:
+            return False
+        if self.now() < saved_at:
+            # the clock started again from its reset time, go on from the saved time until it syncs
+            self.snapshot.set_time(saved_at)
+            self.time_estimated = True
+        self.queue.load(appts, self.now())
+        self.show_appt(self.queue.current)
+        self.tick()
+        return True
+
+    def time_synced(self) -> None:
+        """Note the clock was just set from the network, and save the time to the snapshot"""
+        self.time_estimated = False
+        if self.snapshot:
+            try:
+                self.snapshot.save_time(self.now())
+            except Exception as e:
+                if self.debug:
+                    print(f'{my_local_time()} snapshot save exception: {e}')
+
+    def save_snapshot(self) -> None:
+        """Save the feed appointments to the snapshot"""
+        if not self.snapshot or self.time_estimated:
+            return
+        try:
+            self.snapshot.save(self.poller.appts, self.now())
+        except Exception as e:
+            # keep going without the snapshot, e.g. a status it can not pack
+            if self.debug:
+                print(f'{my_local_time()} snapshot save exception: {e}')
+
+    def poll_once(self) -> int:
+        """Fetch the latest appointment and update the display if it changed.
+        Returns the number of seconds to wait before the next poll
+        """
+        if self.sim:
+            # appt_data = self.sim.get_sim_data(meet_stat='None', subject='Me too!!!', resp_stat='Not Responded', ttime=None)
+            self.queue.load([self.sim.get_sim_data()], self.now())
+            self.show_appt(self.queue.current)
+            return self.sim_poll_secs
+
+        try:
+            appt_changed = self.fetch_breaker.call(self.poller.poll)
+        except CircuitOpenError:
+            # no requests while the network is down, the last good appointment stays up
+            self.telemetry.count('fetch_rejected')
+            return self.fetch_breaker.retry_secs()
+        except Exception as e:
+            self.telemetry.count('fetch_errors')
+            for error_type, text in self.error_text.items():
+                if isinstance(e, error_type):
+                    self.show_error(text)
+                    break
+            retry_secs = self.fetch_breaker.retry_secs()
+            if self.debug:
+                print(f'{my_local_time()} Exception: {type(e).__name__} {e}, feed {self.fetch_breaker.state} '
+                      f'after {self.fetch_breaker.failures} failures, retry in {retry_secs:.0f} seconds')
+            return retry_secs
+        self.telemetry.sample_heap()
+
+        # only reconfigure the display when there is a different appointment
+        if appt_changed:
+            self.queue.load(self.poller.appts, self.now())
+            self.show_appt(self.queue.current)
+            self.save_snapshot()
+
+        # poll more often as the meeting gets closer
+        band = self.count_down.band_name(self.now()) if self.count_down else None
+        return next_poll_secs(band)
+
+    def accept_push(self, value: str) -> None:
+        """Update the display from a feed value pushed over MQTT
+        :param str value: the feed value
+        """
+        self.telemetry.count('pushes')
+        appts, queue = self.poller.appts, self.queue
+        shown = False
+        try:
+            if self.poller.update([{'value': value}]):
+                self.queue = ApptQueue()
+                self.queue.load(self.poller.appts, self.now())
+                shown = True
+                self.show_appt(self.queue.current)
+                self.save_snapshot()
+        except Exception as e:
+            # a value this code can not decode or show, keep the current appointment and wait
+            # for the next value or poll
+            self.telemetry.count('push_errors')
+            print(f'{my_local_time()} pushed value rejected: {type(e).__name__} {e}')
+            self.poller.appts = appts
+            self.poller.invalidate()
+            self.queue = queue
+            if shown:
+                self.show_appt(self.queue.current)
+
+    def tick(self) -> None:
+        """Move on to the next queued appointment when the current one ends and update the
+        count down row, leaving any error message up until it times out
+        """
+        now = self.now()
+        if self.queue.advance(now):
+            self.show_appt(self.queue.current)
+        if self.count_down is None or time.monotonic() < self._error_until:
+            return
+        # the renderer skips the label update unless the string or color changed
+        count_down_str, count_down_stat_color = self.count_down.update(now)
+        if self.time_estimated and self.count_down.label and count_down_str.startswith(self.count_down.label):
+            # the clock is off by however long the power was out, only show the start time
+            count_down_str = self.count_down.label
+        self.renderer.set_text_color(count_down_stat_color, 1)
+        self.renderer.set_text(count_down_str, 1)
+
+    async def scroll_task(self) -> None:
+        """Scroll the subject one pixel per frame"""
+        while True:
+            self.renderer.begin_frame()
+            if self.strip:
+                self.strip.scroll()
+            else:
+                self.portal.scroll()
+            self.renderer.end_frame()
+            self.telemetry.frame()
+            await asyncio.sleep(self.scroll_delay)
+
+    async def count_down_task(self) -> None:
+        """Keep the count down row current"""
+        while True:
+            self.tick()
+            await asyncio.sleep(COUNT_DOWN_TICK)
+
+    async def poll_task(self) -> None:
+        """Poll the feed, waiting the scheduled interval between polls. Does not poll while the
+        feed changes are pushed over MQTT
+        """
+        while True:
+            if self.push and self.push.connected:
+                await asyncio.sleep(self.push_check_secs)
+                continue
+            poll_secs = self.poll_once()
+            if self.debug:
+                print(f'{my_local_time()} {self.renderer.stats()}')
+                print(f'{my_local_time()} next poll in {poll_secs} seconds')
+            self.renderer.reset_stats()
+            self.telemetry.collect()
+            await asyncio.sleep(poll_secs)
+
+    async def push_task(self) -> None:
+        """Connect to the MQTT broker, retrying while disconnected, and show pushed feed values"""
+        while True:
+            if not self.push.connected:
+                if self.push.connect():
+                    if self.debug:
+                        print(f'{my_local_time()} MQTT connected to {self.push.topic}')
+                    # catch up on anything published while disconnected
+                    self.poll_once()
+            else:
+                value = self.push.loop()
+                if value is not None:
+                    self.accept_push(value)
+                elif not self.push.connected and self.debug:
+                    print(f'{my_local_time()} MQTT disconnected, polling over HTTP')
+            await asyncio.sleep(self.push_check_secs)
+
+    async def clock_task(self) -> None:
+        """Resync the clock every time_resync seconds, or when the drift corrected clock asks,
+        backing off while the syncs fail. The MatrixPortal clock seems to drift enough over long
+        periods that the meeting count down display is misleading
+        """
+        if self.time_breaker.degraded:
+            # the sync at boot failed
+            wait = self.time_breaker.retry_secs()
+        else:
+            wait = self.clock.next_sync_secs() if self.clock else self.time_resync
+        while True:
+            await asyncio.sleep(wait)
+            start = self.telemetry.start()
+            try:
+                if self.clock:
+                    self.time_breaker.call(self.clock.sync)
+                    if self.debug:
+                        print(f'{my_local_time()} clock error: {self.clock.last_error} rate: {self.clock.rate} next sync: {self.clock.interval}')
+                else:
+                    self.time_breaker.call(self.sync_time)
+                self.telemetry.stop('time_sync', start)
+                self.time_synced()
+                wait = self.clock.next_sync_secs() if self.clock else self.time_resync
+            except Exception as e:
+                if not isinstance(e, CircuitOpenError):
+                    self.telemetry.count('time_sync_errors')
+                wait = self.time_breaker.retry_secs()
+                if self.debug:
+                    print(f'{my_local_time()} get_local_time exception: {e}, retry in {wait:.0f} seconds')
+
+    async def telemetry_task(self) -> None:
+        """Publish the telemetry every telemetry_secs, and print it when debugging"""
+        while True:
+            await asyncio.sleep(self.telemetry_secs)
+            if self.debug:
+                self.telemetry.dump()
+            if self.publish_telemetry:
+                try:
+                    self.telemetry.publish(self.publish_telemetry)
+                except Exception as e:
+                    if self.debug:
+                        print(f'{my_local_time()} telemetry publish exception: {e}')
+
+    async def run(self) -> None:
+        """Run all the display tasks until interrupted"""
+        tasks = [
+            asyncio.create_task(self.scroll_task()),
+            asyncio.create_task(self.count_down_task()),
+            asyncio.create_task(self.poll_task()),
+            asyncio.create_task(self.clock_task())]
+        if self.push and not self.sim:
+            tasks.append(asyncio.create_task(self.push_task()))
+        if self.telemetry.enabled:
+            tasks.append(asyncio.create_task(self.telemetry_task()))
+        await asyncio.gather(*tasks)
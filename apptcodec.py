@@ -0,0 +1,156 @@
+"""
+Compact encoding of the appointment feed value
+
+Shared by the PC client (encode) and the Matrix Portal (decode). The packed value is
+base64 text, since AIO feed values are strings, of:
+
+    byte    schema version (PACKED_VERSION)
+    byte    number of appointments
+    then for each appointment:
+    uint32  start, unix epoch (big endian)
+    uint16  duration in minutes, NO_DURATION if not known
+    byte    responseStatus as an index into constants.ResponseStatus
+    byte    meeting_status as an index into constants.MeetingStatus
+    byte    length of the subject in bytes
+    bytes   subject, UTF-8
+
+Schema version FRAMES_VERSION adds the display ready fields from frames.make_frame() after
+each subject:
+
+    byte    status as an index into constants.DisplayStatus
+    uint32  the 5 count down band edges, unix epoch
+    byte    length of the start time label in bytes
+    bytes   label, UTF-8
+
+A value starting with '{' is JSON, either {"appts": [...]} or a single appointment
+from older clients, and is decoded with json.loads.
+"""
+import binascii
+import json
+import struct
+from constants import ResponseStatus, MeetingStatus, DisplayStatus
+
+PACKED_VERSION = 1
+FRAMES_VERSION = 2
+NO_DURATION = 0xFFFF
+# the subject length has to fit in a byte
+MAX_SUBJECT_BYTES = 255
+
+_HEADER = '>BB'
+_APPT = '>IHBBB'
+_APPT_SIZE = struct.calcsize(_APPT)
+_FRAME = '>BIIIIIB'
+_FRAME_SIZE = struct.calcsize(_FRAME)
+# the fields every JSON appointment has, and their types
+_APPT_FIELDS = (('start', int), ('subject', str), ('responseStatus', str),
+                ('meeting_status', str), ('duration', (int, type(None))))
+# what packing a value too big for its field raises, CircuitPython has no struct.error
+_PACK_ERRORS = (getattr(struct, 'error', ValueError), OverflowError)
+
+
+def pack_appts(appts: list, version=PACKED_VERSION) -> str:
+    """Returns the packed feed value for a list of appointments. Raises ValueError if a status
+    is not in constants.ResponseStatus, constants.MeetingStatus or constants.DisplayStatus, or
+    a value does not fit its field, e.g. a start before 1970 or a duration of NO_DURATION or more
+    :param list appts: dicts with start, subject, responseStatus, meeting_status and duration,
+        and status, label and edges for FRAMES_VERSION
+    :param int version: PACKED_VERSION or FRAMES_VERSION. Default is PACKED_VERSION
+    """
+    try:
+        buf = bytearray(struct.pack(_HEADER, version, len(appts)))
+        for appt in appts:
+            subject = appt['subject'].encode('utf-8')
+            if len(subject) > MAX_SUBJECT_BYTES:
+                # cut on a character boundary
+                subject = subject[:MAX_SUBJECT_BYTES].decode('utf-8', 'ignore').encode('utf-8')
+            duration = appt['duration']
+            if duration is not None and not 0 <= duration < NO_DURATION:
+                raise ValueError('duration {} out of range'.format(duration))
+            buf += struct.pack(_APPT,
+                               int(appt['start']),
+                               NO_DURATION if duration is None else duration,
+                               ResponseStatus.index(appt['responseStatus']),
+                               MeetingStatus.index(appt['meeting_status']),
+                               len(subject))
+            buf += subject
+            if version == FRAMES_VERSION:
+                label = appt['label'].encode('utf-8')
+                buf += struct.pack(_FRAME, DisplayStatus.index(appt['status']), *appt['edges'], len(label))
+                buf += label
+    except _PACK_ERRORS as e:
+        raise ValueError('appointment does not fit the packed format: {}'.format(e))
+    return binascii.b2a_base64(buf).decode('ascii').strip()
+
+
+def _status(table: list, index: int, name: str) -> str:
+    """Returns a status from its table index. Raises ValueError for an index outside the table"""
+    if index >= len(table):
+        raise ValueError('unknown {} {}'.format(name, index))
+    return table[index]
+
+
+def unpack_appts(value: str) -> list:
+    """Returns the list of appointments in a packed feed value. Raises ValueError for an
+    unknown schema version, a status outside its table or a truncated value
+    :param str value: the packed feed value
+    """
+    buf = binascii.a2b_base64(value)
+    if len(buf) < struct.calcsize(_HEADER):
+        raise ValueError('feed value too short')
+    version, count = struct.unpack_from(_HEADER, buf, 0)
+    if version not in (PACKED_VERSION, FRAMES_VERSION):
+        raise ValueError('unknown feed schema version {}'.format(version))
+    offset = struct.calcsize(_HEADER)
+    appts = []
+    for _ in range(count):
+        if len(buf) < offset + _APPT_SIZE:
+            raise ValueError('feed value too short')
+        start, duration, resp_stat, meeting_stat, subject_len = struct.unpack_from(_APPT, buf, offset)
+        offset += _APPT_SIZE
+        appt = {'start': start,
+                'subject': buf[offset:offset + subject_len].decode('utf-8'),
+                'responseStatus': _status(ResponseStatus, resp_stat, 'responseStatus'),
+                'meeting_status': _status(MeetingStatus, meeting_stat, 'meeting_status'),
+                'duration': None if duration == NO_DURATION else duration}
+        offset += subject_len
+        if version == FRAMES_VERSION:
+            if len(buf) < offset + _FRAME_SIZE:
+                raise ValueError('feed value too short')
+            fields = struct.unpack_from(_FRAME, buf, offset)
+            offset += _FRAME_SIZE
+            appt['status'] = _status(DisplayStatus, fields[0], 'status')
+            appt['edges'] = list(fields[1:6])
+            appt['label'] = buf[offset:offset + fields[6]].decode('utf-8')
+            offset += fields[6]
+        appts.append(appt)
+    return appts
+
+
+def _check_appt(appt) -> dict:
+    """Returns a JSON appointment. Raises ValueError if a field is missing or the wrong type"""
+    if not isinstance(appt, dict):
+        raise ValueError('appointment is not an object')
+    for key, types in _APPT_FIELDS:
+        if key not in appt:
+            raise ValueError('appointment has no {}'.format(key))
+        if not isinstance(appt[key], types) or isinstance(appt[key], bool):
+            raise ValueError('appointment {} is a {}'.format(key, type(appt[key]).__name__))
+    return appt
+
+
+def decode_appts(value: str) -> list:
+    """Returns the list of appointments in a feed value, packed or JSON. Raises ValueError for
+    a value that does not decode or a JSON appointment without the fields pack_appts() needs
+    :param str value: the feed value
+    """
+    if not value.startswith('{'):
+        return unpack_appts(value)
+    appts = json.loads(value)
+    if 'appts' in appts:
+        if not isinstance(appts['appts'], list):
+            raise ValueError('appts is not a list')
+        return [_check_appt(appt) for appt in appts['appts']]
+    # a single appointment from an older client
+    if appts.get('responseStatus') == 'No meeting':
+        return []
+    return [_check_appt(appts)]
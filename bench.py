@@ -0,0 +1,290 @@
+""" Benchmarks for the Matrix Portal hot paths, run under CPython.
+
+Drives the count down, status, clock string and feed decode code, and a full poll and
+frame of app.NextMeetingApp with a stub display and network, across every simdata start
+time band, subject, response status and meeting status. For each benchmark it reports the
+time per call and the heap high-water mark seen by tracemalloc, which stands in for the
+gc.mem_free() dips on the device.
+
+    python bench.py                   run and compare with the saved baseline
+    python bench.py --save-baseline   run and save the results as the baseline
+    python bench.py --emulator        use emulator.EmulatedMatrixPortal as the display
+
+A benchmark is flagged as a regression when its time is more than --threshold (default 50%)
+or its peak heap more than --heap-threshold (default 25%) over the baseline. Timings are
+noisy on a busy PC, the heap numbers are close to repeatable. The exit code is 1 if anything
+regressed.
+
+The baseline, bench_baseline.json next to this file, is not kept in git: the times depend on
+the PC and Python version it was saved with, so save one on your own machine before a change.
+"""
+from typing import Callable, Dict, List
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import simdata
+from app import NextMeetingApp, compute_status, my_local_time
+from apptcodec import FRAMES_VERSION, decode_appts, pack_appts
+from countdown import CountDown
+from feed import FeedPoller
+from frames import make_frame
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+# frames per simulated second of count down, about the scroll rate
+FRAMES_PER_SEC = 25
+
+STATUS_MSG = {status: {'icon': '', 'color': 0x808080, 'text': status}
+              for status in ['Accepted', 'Canceled', 'None', 'Not Responded', 'Organizer',
+                             'Tentative', 'No meeting']}
+
+
+class StubPortal:
+    """Display stand-in that only counts calls, so the timings are of the app code"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def set_text(self, val, index=0):
+        self.calls += 1
+
+    def set_text_color(self, color, index=0):
+        self.calls += 1
+
+    def set_background(self, file_or_color, position=None):
+        self.calls += 1
+
+    def scroll(self):
+        self.calls += 1
+
+
+def sim_appts() -> List[dict]:
+    """Returns an appointment for every simdata start time band, subject, response status
+    and meeting status combination
+    """
+    sim = simdata.sim()
+    appts = []
+    for ttime, subject, resp_stat, meet_stat in itertools.product(
+            sim.start_times, sim.subjects, sim.resp_statuses, sim.meeting_statuses):
+        appt = dict(sim.get_sim_data(subject=subject, resp_stat=resp_stat, meet_stat=meet_stat, ttime=ttime))
+        appt['start'] = int(appt['start'])
+        appt['duration'] = 30
+        appts.append(appt)
+    return appts
+
+
+def measure(func: Callable, calls: int, rounds: int = 5, round_secs: float = 0.05) -> Dict[str, float]:
+    """
+    Time func and measure its heap use
+
+    :param func: called with no arguments, does `calls` calls of the code being measured
+    :param int calls: the number of calls func makes, to report the time per call
+    :param int rounds: the number of timing rounds, the fastest round is reported to cut noise
+    :param float round_secs: run func repeatedly for at least this long in each round
+    :return: dict with us_per_call and peak_bytes
+    """
+    # timing without tracemalloc, which slows allocation down
+    best_ns = None
+    for _ in range(rounds):
+        runs = 0
+        start = time.perf_counter_ns()
+        while True:
+            func()
+            runs += 1
+            elapsed = time.perf_counter_ns() - start
+            if elapsed >= round_secs * 1e9:
+                break
+        if best_ns is None or elapsed / runs < best_ns:
+            best_ns = elapsed / runs
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'us_per_call': best_ns / calls / 1000, 'peak_bytes': peak - before}
+
+
+def bench_count_down(appts: List[dict]) -> Callable:
+    count_downs = [CountDown(appt['start'], appt['responseStatus']) for appt in appts]
+    now = int(time.time())
+
+    def run():
+        # a second of frames for every appointment
+        for count_down in count_downs:
+            for frame in range(FRAMES_PER_SEC):
+                count_down.update(now + frame // FRAMES_PER_SEC)
+    return run
+
+
+def bench_count_down_build(appts: List[dict]) -> Callable:
+    def run():
+        for appt in appts:
+            CountDown(appt['start'], appt['responseStatus'])
+    return run
+
+
+def bench_compute_status(appts: List[dict]) -> Callable:
+    def run():
+        for appt in appts:
+            compute_status(appt['responseStatus'], appt['meeting_status'])
+    return run
+
+
+def bench_my_local_time(appts: List[dict]) -> Callable:
+    def run():
+        for _ in appts:
+            my_local_time()
+    return run
+
+
+def bench_decode_json(appts: List[dict]) -> Callable:
+    values = [json.dumps(appt) for appt in appts]
+
+    def run():
+        for value in values:
+            decode_appts(value)
+    return run
+
+
+def bench_decode_packed(appts: List[dict]) -> Callable:
+    values = [pack_appts([appt]) for appt in appts]
+
+    def run():
+        for value in values:
+            decode_appts(value)
+    return run
+
+
+def bench_decode_frames(appts: List[dict]) -> Callable:
+    values = [pack_appts([make_frame(appt)], FRAMES_VERSION) for appt in appts]
+
+    def run():
+        for value in values:
+            decode_appts(value)
+    return run
+
+
+def make_app(portal, appts: List[dict]):
+    """Returns an app whose feed returns a different appointment on every poll"""
+    items = itertools.cycle(
+        [{'id': str(index), 'value': pack_appts([appt])} for index, appt in enumerate(appts)])
+    return NextMeetingApp(portal, FeedPoller(lambda: [next(items)]), lambda: None, STATUS_MSG)
+
+
+def bench_app_poll(appts: List[dict], portal_factory) -> Callable:
+    app = make_app(portal_factory(), appts)
+
+    def run():
+        for _ in appts:
+            app.poll_once()
+    return run
+
+
+def bench_app_frame(appts: List[dict], portal_factory) -> Callable:
+    app = make_app(portal_factory(), appts)
+    app.poll_once()
+
+    def run():
+        for _ in appts:
+            app.tick()
+            app.renderer.begin_frame()
+            app.portal.scroll()
+            app.renderer.end_frame()
+    return run
+
+
+def run_benchmarks(portal_factory) -> Dict[str, Dict[str, float]]:
+    """Returns the results of all the benchmarks by name"""
+    appts = sim_appts()
+    # the app prints the status on every new appointment, drop it so it is not measured
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return _run(appts, portal_factory)
+
+
+def _run(appts: List[dict], portal_factory) -> Dict[str, Dict[str, float]]:
+    benches = {
+        'count_down.update': (bench_count_down(appts), len(appts) * FRAMES_PER_SEC),
+        'count_down.build': (bench_count_down_build(appts), len(appts)),
+        'compute_status': (bench_compute_status(appts), len(appts)),
+        'my_local_time': (bench_my_local_time(appts), len(appts)),
+        'decode.json': (bench_decode_json(appts), len(appts)),
+        'decode.packed': (bench_decode_packed(appts), len(appts)),
+        'decode.frames': (bench_decode_frames(appts), len(appts)),
+        'app.poll_once': (bench_app_poll(appts, portal_factory), len(appts)),
+        'app.frame': (bench_app_frame(appts, portal_factory), len(appts)),
+    }
+    return {name: measure(func, calls) for name, (func, calls) in benches.items()}
+
+
+def compare(results: dict, baseline: dict, threshold: float, heap_threshold: float) -> List[str]:
+    """Print the results next to the baseline. Returns the names of the regressed benchmarks"""
+    regressed = []
+    print('{:<20}{:>12}{:>12}{:>12}{:>12}'.format('benchmark', 'us/call', 'base', 'peak B', 'base'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        flag = ''
+        if base:
+            # allow a little slack on the heap for small allocations
+            if result['us_per_call'] > base['us_per_call'] * (1 + threshold) \
+                    or result['peak_bytes'] > base['peak_bytes'] * (1 + heap_threshold) + 64:
+                flag = '  REGRESSION'
+                regressed.append(name)
+        print('{:<20}{:>12.3f}{:>12}{:>12}{:>12}{}'.format(
+            name, result['us_per_call'],
+            '{:.3f}'.format(base['us_per_call']) if base else '-',
+            result['peak_bytes'],
+            base['peak_bytes'] if base else '-',
+            flag))
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the Matrix Portal hot paths')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='the baseline file')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='fraction over the baseline time that counts as a regression')
+    parser.add_argument('--heap-threshold', type=float, default=0.25,
+                        help='fraction over the baseline peak heap that counts as a regression')
+    parser.add_argument('--emulator', action='store_true',
+                        help='use the NumPy display emulator instead of a stub display')
+    args = parser.parse_args()
+
+    if args.emulator:
+        from emulator import EmulatedMatrixPortal
+
+        def portal_factory():
+            portal = EmulatedMatrixPortal()
+            for _ in range(4):
+                portal.add_text(scrolling=not portal._text)
+            return portal
+    else:
+        portal_factory = StubPortal
+
+    results = run_benchmarks(portal_factory)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    regressed = compare(results, baseline, args.threshold, args.heap_threshold)
+    if not baseline and not args.save_baseline:
+        print('no baseline to compare with, run with --save-baseline first')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print('baseline saved to', args.baseline)
+    return 1 if regressed and not args.save_baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
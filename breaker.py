@@ -0,0 +1,83 @@
+"""
+Backoff and circuit breaker for the network calls
+
+When the Wi-Fi or Adafruit IO is down every poll and time sync fails, and retrying on the
+normal schedule keeps the radio busy making requests that can not work. The CircuitBreaker
+wraps a network call: after each failure the wait before the next try doubles, with jitter
+so several displays do not retry together, and after enough failures in a row the circuit
+opens and calls fail at once without touching the network until open_secs has passed. The
+next call is then let through as a trial, closing the circuit if it works.
+"""
+import random
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making the call while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Exponential backoff with jitter and a circuit breaker for one kind of network call
+
+    :param str name: the name for debug messages, e.g. 'feed'
+    :param int base_secs: the wait after the first failure. Default is 15
+    :param int max_secs: the longest wait between tries. Default is 900
+    :param float jitter: +/- fraction of the wait to spread the retries. Default is 0.25
+    :param int threshold: the failures in a row that open the circuit. Default is 5
+    :param int open_secs: how long the circuit stays open before a trial call. Default is 600
+    """
+
+    def __init__(self, name, base_secs=15, max_secs=900, jitter=0.25, threshold=5, open_secs=600):
+        self.name = name
+        self.base_secs = base_secs
+        self.max_secs = max_secs
+        self.jitter = jitter
+        self.threshold = threshold
+        self.open_secs = open_secs
+        self.state = CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+        self._open_until = 0
+
+    def call(self, func, *args):
+        """Returns func(*args), recording whether it worked. Raises CircuitOpenError without
+        calling func while the circuit is open, otherwise whatever func raises
+        """
+        if self.state == OPEN:
+            if time.monotonic() < self._open_until:
+                self.rejected += 1
+                raise CircuitOpenError('{} circuit open'.format(self.name))
+            self.state = HALF_OPEN
+        try:
+            result = func(*args)
+        except Exception:
+            self._failed()
+            raise
+        self.failures = 0
+        self.state = CLOSED
+        return result
+
+    def _failed(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            if self.state != OPEN:
+                self.opens += 1
+            self.state = OPEN
+            self._open_until = time.monotonic() + self.open_secs
+
+    @property
+    def degraded(self) -> bool:
+        """True after a failure, until a call works again"""
+        return self.failures > 0
+
+    def retry_secs(self) -> float:
+        """Returns the seconds to wait before trying again after a failure"""
+        if self.state == OPEN:
+            return max(self._open_until - time.monotonic(), 1)
+        wait = min(self.base_secs * 2 ** max(self.failures - 1, 0), self.max_secs)
+        return wait * (1 + random.uniform(-self.jitter, self.jitter))
@@ -0,0 +1,362 @@
+""" Calendar sources for the PC client.
+
+A calendar source returns the appointments in a time window as a list of dicts sorted by
+start time, so nextCalAppt.py does not need to know where they come from:
+
+    start           datetime the appointment starts
+    end             datetime the appointment ends
+    subject         str
+    resp_stat       str, one of constants.ResponseStatus
+    importance      str, one of Importance
+    meeting_status  str, one of constants.MeetingStatus
+    duration        int minutes
+
+OutlookSource keeps the MAPI session open and caches the restricted window between calls.
+FakeSource is an in-memory calendar for running the client without Outlook.
+"""
+from typing import List
+import datetime as dt
+import logging
+import time
+from constants import ResponseStatus, MeetingStatus
+
+# --- Some helpful Outlook constants ---
+
+# https://docs.microsoft.com/en-us/office/vba/api/outlook.olimportance
+Importance = ["Low", "Normal", "High"]
+
+# https://docs.microsoft.com/en-us/office/vba/api/outlook.oldefaultfolders
+OL_FOLDER_CALENDAR = 9
+
+# https://docs.microsoft.com/en-us/office/vba/api/outlook.olrecurrencetype
+OL_RECURS_DAILY = 0
+OL_RECURS_WEEKLY = 1
+OL_RECURS_MONTHLY = 2
+OL_RECURS_MONTH_NTH = 3
+OL_RECURS_YEARLY = 5
+OL_RECURS_YEAR_NTH = 6
+
+# the iCalendar weekday for each bit of the Outlook DayOfWeekMask, olSunday = 1
+WEEKDAYS = ["SU", "MO", "TU", "WE", "TH", "FR", "SA"]
+
+
+def naive(when: dt.datetime) -> dt.datetime:
+    """Drop the time zone so COM times and local datetimes compare. Outlook times are local time."""
+    return when.replace(tzinfo=None)
+
+
+def outlook_namespace():
+    """Returns the Outlook MAPI namespace, to share one Outlook session between OutlookSources"""
+    # only needed on Windows with Outlook installed
+    import win32com.client
+    return win32com.client.Dispatch('Outlook.Application').GetNamespace('MAPI')
+
+
+class CalendarSource:
+    """Base class for the calendar sources"""
+
+    def get_items(self, begin: dt.datetime, end: dt.datetime) -> List[dict]:
+        """
+        Return the appointments starting at or after begin and ending no later than end
+
+        :param datetime begin: the filter for appointments with start times after this time
+        :param datetime end: the filter appointments with end times no later than this time
+        :return: list of appointment dicts sorted by start
+        """
+        raise NotImplementedError
+
+    def poll(self) -> None:
+        """Give the source a chance to process change notifications. Called by the daemon loop."""
+
+
+class _ItemsEvents:
+    """Outlook Items collection events, marks the OutlookSource cache dirty"""
+    source = None
+
+    def OnItemAdd(self, item):
+        self.source.dirty = True
+
+    def OnItemChange(self, item):
+        self.source.dirty = True
+
+    def OnItemRemove(self):
+        self.source.dirty = True
+
+
+class OutlookSource(CalendarSource):
+    """
+    Appointments from the local Outlook client through COM
+
+    The MAPI session stays open for the life of the object. Each scan restricts the calendar
+    to a window window_slack longer than asked for, so later calls are answered from the
+    cached window until it slides past the end, the calendar changes or rescan_secs passes.
+
+    :param timedelta window_slack: how much further ahead than asked for to scan. Default is 1 hour
+    :param int rescan_secs: scan again after this many seconds even without a change event. Default is 3600
+    :param str owner: the name or address of a shared calendar's owner, e.g. a room. Default is None for your own calendar
+    :param namespace: the MAPI namespace from outlook_namespace() to share. Default is None to open one
+    :param bool expand_series: expand the recurring series here, caching each series until it
+        changes, instead of having Outlook expand every series on every scan. Default is True
+    """
+
+    def __init__(self, window_slack: dt.timedelta = dt.timedelta(hours=1), rescan_secs: int = 3600,
+                 owner: str = None, namespace=None, expand_series: bool = True):
+        # only needed on Windows with Outlook installed
+        import win32com.client
+
+        self.window_slack = window_slack
+        self.rescan_secs = rescan_secs
+        self.owner = owner
+        namespace = namespace or outlook_namespace()
+        if owner:
+            # https://docs.microsoft.com/en-us/office/vba/api/outlook.namespace.getshareddefaultfolder
+            recipient = namespace.CreateRecipient(owner)
+            recipient.Resolve()
+            self._folder = namespace.GetSharedDefaultFolder(recipient, OL_FOLDER_CALENDAR)
+        else:
+            self._folder = namespace.GetDefaultFolder(OL_FOLDER_CALENDAR)
+        # keep a reference to the watched Items collection or the events stop
+        self._watched = self._folder.Items
+        self._events = win32com.client.WithEvents(self._watched, _ItemsEvents)
+        self._events.source = self
+        self.dirty = True
+        self.scans = 0
+        self.expand_series = expand_series
+        # series EntryID -> (LastModificationTime, begin, end, occurrences)
+        self._series = {}
+        self.series_hits = 0
+        self.series_misses = 0
+        self._cache = []
+        self._cache_begin = None
+        self._cache_end = None
+        self._scanned_at = 0
+
+    def poll(self) -> None:
+        # deliver any queued Outlook events to _ItemsEvents
+        import pythoncom
+        pythoncom.PumpWaitingMessages()
+
+    @staticmethod
+    def _restriction(begin: dt.datetime, end: dt.datetime) -> str:
+        # https://docs.microsoft.com/en-us/office/vba/api/outlook.items.restrict
+        # important to add the AM/PM format code %p otherwise the API seems to not handle the time right
+        # https://strftime.org/
+        return "[Start] >= '" + begin.strftime('%m/%d/%Y %I:%M %p') + "' AND [END] <= '" + end.strftime(
+            '%m/%d/%Y %I:%M %p') + "'"
+
+    @staticmethod
+    def _item(item, start=None, end=None) -> dict:
+        return {"start": item.start if start is None else start,
+                "end": item.end if end is None else end,
+                "subject": item.subject,
+                "resp_stat": ResponseStatus[item.responseStatus],
+                "importance": Importance[item.Importance],
+                "meeting_status": MeetingStatus[item.MeetingStatus],
+                "duration": item.duration}
+
+    def _scan(self, begin: dt.datetime, end: dt.datetime) -> None:
+        if self.expand_series:
+            self._cache = self._scan_series(begin, end)
+        else:
+            calendar = self._folder.Items
+            calendar.IncludeRecurrences = True
+            calendar.Sort('[Start]')
+            restriction = self._restriction(begin, end)
+            logging.debug("Scan restriction: %s", restriction)
+
+            # It appears that you need to load calendar appointments COM Object into a list since the
+            # calendar object does not seem to behave like a real list
+            self._cache = [self._item(item) for item in calendar.Restrict(restriction)]
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for item in self._cache:
+                logging.debug("Appt--> %s|%s|%s|%s|%s", item["start"], item["subject"],
+                              item["resp_stat"], item["importance"], item["meeting_status"])
+
+        self._cache_begin = begin
+        self._cache_end = end
+        self._scanned_at = time.monotonic()
+        self.dirty = False
+        self.scans += 1
+        logging.debug("Scanned %d appts from %s, scan count %d", len(self._cache),
+                      self.owner or "own calendar", self.scans)
+
+    def _scan_series(self, begin: dt.datetime, end: dt.datetime) -> List[dict]:
+        """Returns the single appointments in the window from Outlook, and the occurrences of the
+        recurring series from the series cache, expanding only the new or changed series
+        """
+        # the single appointments, without Outlook expanding every series
+        calendar = self._folder.Items
+        calendar.IncludeRecurrences = False
+        restriction = self._restriction(begin, end) + " AND [IsRecurring] = False"
+        logging.debug("Scan restriction: %s", restriction)
+        items = [self._item(item) for item in calendar.Restrict(restriction)]
+
+        hits = misses = 0
+        seen = set()
+        unmapped = set()
+        # the series that start after the window have no occurrences in it
+        masters = "[IsRecurring] = True AND [Start] <= '" + end.strftime('%m/%d/%Y %I:%M %p') + "'"
+        for master in self._folder.Items.Restrict(masters):
+            entry_id = master.EntryID
+            modified = master.LastModificationTime
+            seen.add(entry_id)
+            cached = self._series.get(entry_id)
+            if cached and cached[0] == modified and cached[1] <= begin and end <= cached[2]:
+                hits += 1
+            else:
+                misses += 1
+                pattern = master.GetRecurrencePattern()
+                if not pattern.NoEndDate and naive(pattern.PatternEndDate).date() < begin.date():
+                    # ended before the window, which only moves later, so it stays a hit
+                    cached = (modified, begin, dt.datetime.max, [])
+                else:
+                    try:
+                        cached = (modified, begin, end + self.window_slack,
+                                  self._expand_series(master, pattern, begin, end + self.window_slack))
+                    except ValueError as error:
+                        logging.info("Outlook expands series %s: %s", master.subject, error)
+                        unmapped.add(entry_id)
+                        continue
+                self._series[entry_id] = cached
+            items.extend(item for item in cached[3]
+                         if naive(item["start"]) >= begin and naive(item["end"]) <= end)
+        # forget the deleted series
+        for entry_id in set(self._series) - seen:
+            del self._series[entry_id]
+        if unmapped:
+            # the occurrences Outlook expands carry the EntryID of their series
+            calendar = self._folder.Items
+            calendar.IncludeRecurrences = True
+            calendar.Sort('[Start]')
+            items.extend(self._item(item) for item in
+                         calendar.Restrict(self._restriction(begin, end) + " AND [IsRecurring] = True")
+                         if item.EntryID in unmapped)
+
+        self.series_hits += hits
+        self.series_misses += misses
+        logging.info("Series cache: %d hits, %d misses this scan, %d hits, %d misses in all",
+                     hits, misses, self.series_hits, self.series_misses)
+        items.sort(key=lambda item: naive(item["start"]))
+        return items
+
+    @staticmethod
+    def _series_rule(pattern) -> dict:
+        """Returns the RRULE parts for an Outlook recurrence pattern, with Outlook's rules for
+        the days a month does not have. Raises ValueError for a pattern it can not map
+        """
+        # https://docs.microsoft.com/en-us/office/vba/api/outlook.recurrencepattern
+        interval = max(1, pattern.Interval)
+        recurrence = pattern.RecurrenceType
+        days = ",".join(WEEKDAYS[bit] for bit in range(7) if pattern.DayOfWeekMask & (1 << bit))
+        if recurrence in (OL_RECURS_YEARLY, OL_RECURS_YEAR_NTH):
+            # the same month every year, Outlook versions differ on giving the interval in months or years
+            interval = 12 * (interval // 12 if interval >= 12 else interval)
+        if recurrence == OL_RECURS_DAILY:
+            # every weekday is a daily pattern with a day mask
+            rule = {"FREQ": "WEEKLY", "BYDAY": days} if days else {"FREQ": "DAILY", "INTERVAL": interval}
+        elif recurrence == OL_RECURS_WEEKLY:
+            rule = {"FREQ": "WEEKLY", "INTERVAL": interval, "BYDAY": days}
+        elif recurrence in (OL_RECURS_MONTHLY, OL_RECURS_YEARLY):
+            day = pattern.DayOfMonth
+            if not 1 <= day <= 31:
+                raise ValueError("day of month {}".format(day))
+            rule = {"FREQ": "MONTHLY", "INTERVAL": interval, "BYMONTHDAY": str(day)}
+            if day > 28:
+                # Outlook moves the 29th to 31st to the last day of the shorter months
+                rule["BYMONTHDAY"] = ",".join(str(day) for day in range(28, day + 1))
+                rule["BYSETPOS"] = "-1"
+        elif recurrence in (OL_RECURS_MONTH_NTH, OL_RECURS_YEAR_NTH):
+            if not days or not 1 <= pattern.Instance <= 5:
+                raise ValueError("instance {} of day mask {}".format(pattern.Instance, pattern.DayOfWeekMask))
+            # the nth of the days in the mask, e.g. the last weekday or the first weekend day
+            rule = {"FREQ": "MONTHLY", "INTERVAL": interval, "BYDAY": days,
+                    "BYSETPOS": str(-1 if pattern.Instance == 5 else pattern.Instance)}
+        else:
+            raise ValueError("recurrence type {}".format(recurrence))
+        if not pattern.NoEndDate:
+            rule["UNTIL"] = naive(pattern.PatternEndDate).strftime("%Y%m%d")
+        return rule
+
+    def _expand_series(self, master, pattern, begin: dt.datetime, end: dt.datetime) -> List[dict]:
+        """Returns the occurrences of a recurring series from begin to end, worked out from its
+        recurrence pattern and exceptions rather than by Outlook. Raises ValueError for a
+        pattern that can not be mapped to a recurrence rule
+        """
+        from icssource import expand_rrule
+
+        rule = self._series_rule(pattern)
+        first = dt.datetime.combine(naive(pattern.PatternStartDate).date(), naive(pattern.StartTime).time())
+        length = dt.timedelta(minutes=pattern.Duration)
+
+        exceptions = {}
+        for exception in pattern.Exceptions:
+            exceptions[naive(exception.OriginalDate)] = None if exception.Deleted else exception.AppointmentItem
+
+        # the master item times carry the Outlook time zone marking, keep it on the occurrences
+        zone = master.start.tzinfo
+        occurrences = []
+        for start in expand_rrule(first, rule, end, begin=begin):
+            if start in exceptions:
+                continue
+            if start >= begin:
+                occurrences.append(self._item(master, start.replace(tzinfo=zone),
+                                              (start + length).replace(tzinfo=zone)))
+        for item in exceptions.values():
+            if item is not None and begin <= naive(item.start) <= end:
+                occurrences.append(self._item(item))
+        return occurrences
+
+    def get_items(self, begin: dt.datetime, end: dt.datetime) -> List[dict]:
+        if self.dirty or self._cache_begin is None \
+                or begin < self._cache_begin or end > self._cache_end \
+                or time.monotonic() - self._scanned_at > self.rescan_secs:
+            self._scan(begin, end + self.window_slack)
+        else:
+            logging.debug("Using cached window %s to %s", self._cache_begin, self._cache_end)
+        return [item for item in self._cache
+                if naive(item["start"]) >= begin and naive(item["end"]) <= end]
+
+
+def make_item(start: dt.datetime, duration: int, subject: str, resp_stat: str = "Accepted",
+              meeting_status: str = "Meeting", importance: str = "Normal") -> dict:
+    """
+    Build an appointment dict for FakeSource
+
+    :param datetime start: the start time
+    :param int duration: the length in minutes
+    :param str subject: the subject
+    :return: the appointment dict
+    """
+    return {"start": start,
+            "end": start + dt.timedelta(minutes=duration),
+            "subject": subject,
+            "resp_stat": resp_stat,
+            "importance": importance,
+            "meeting_status": meeting_status,
+            "duration": duration}
+
+
+class FakeSource(CalendarSource):
+    """
+    In-memory calendar for running and testing the client without Outlook
+
+    :param list items: appointment dicts, see make_item()
+    """
+
+    def __init__(self, items: List[dict] = None):
+        self.items = sorted(items or [], key=lambda item: item["start"])
+        self.scans = 0
+
+    def add(self, item: dict) -> None:
+        """Add an appointment, see make_item()"""
+        self.items.append(item)
+        self.items.sort(key=lambda item: item["start"])
+
+    def remove(self, subject: str) -> None:
+        """Remove the appointments with the subject"""
+        self.items = [item for item in self.items if item["subject"] != subject]
+
+    def get_items(self, begin: dt.datetime, end: dt.datetime) -> List[dict]:
+        self.scans += 1
+        return [item for item in self.items
+                if naive(item["start"]) >= begin and naive(item["end"]) <= end]
@@ -0,0 +1,74 @@
+"""
+Drift corrected local clock
+
+The Matrix Portal clock drifts enough that the count down goes wrong, and every resync
+with get_local_time() is a blocking network call that freezes the display. The DriftClock
+measures the clock rate against time.monotonic_ns() across successive syncs, corrects the
+time in between, and doubles the time to the next sync each time the prediction was within
+tolerance, so a settled clock only needs a sync every few hours.
+"""
+import time
+
+
+class DriftClock:
+    """Local time from the last network sync and the measured clock rate
+
+    :param sync: callable that sets the local time from the network, e.g. get_local_time
+    :param int min_interval: the seconds to the next sync to start with and after a miss. Default is 300
+    :param int max_interval: the longest the seconds to the next sync grow to. Default is 21600
+    :param float tolerance: the prediction error in seconds that still counts as a hit. Default is 1.5
+    :param float max_drift: the largest believable rate error, to reject a bad sync. Default is 0.005
+    """
+
+    def __init__(self, sync, min_interval=300, max_interval=21600, tolerance=1.5, max_drift=0.005):
+        self._sync = sync
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tolerance = tolerance
+        self.max_drift = max_drift
+        # network time per device second, measured across the syncs
+        self.rate = 1.0
+        self.interval = min_interval
+        self.syncs = 0
+        self.last_error = None
+        self._epoch = None
+        self._mono_ns = 0
+        # the device seconds the rate has been measured over
+        self._measured = 0
+
+    def now(self) -> float:
+        """Returns the drift corrected time in seconds since the epoch"""
+        if self._epoch is None:
+            return time.time()
+        return self._epoch + (time.monotonic_ns() - self._mono_ns) / 1000000000 * self.rate
+
+    def next_sync_secs(self) -> int:
+        """Returns the seconds to wait before the next sync"""
+        return self.interval
+
+    def sync(self) -> None:
+        """Set the time from the network and update the rate and the next sync interval.
+        Raises whatever the sync callable raises, after dropping back to min_interval
+        """
+        try:
+            self._sync()
+        except Exception:
+            self.interval = self.min_interval
+            raise
+        mono_ns = time.monotonic_ns()
+        epoch = time.time()
+        self.syncs += 1
+        if self._epoch is not None:
+            elapsed = (mono_ns - self._mono_ns) / 1000000000
+            self.last_error = epoch - (self._epoch + elapsed * self.rate)
+            measured = (epoch - self._epoch) / elapsed if elapsed > 0 else self.rate
+            if abs(measured - 1) <= self.max_drift:
+                # longer intervals give a better rate, so weight each one by its length
+                self._measured += elapsed
+                self.rate += (measured - self.rate) * elapsed / self._measured
+            if abs(self.last_error) <= self.tolerance:
+                self.interval = min(self.interval * 2, self.max_interval)
+            else:
+                self.interval = self.min_interval
+        self._epoch = epoch
+        self._mono_ns = mono_ns
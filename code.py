@@ -3,19 +3,36 @@ Display your next meeting's information on a Matrix Portal
 """
 # local imports
 import simdata
-from constants import time_display_colors
+from app import NextMeetingApp, my_local_time
+from breaker import CircuitBreaker
+from clock import DriftClock
+from feed import FeedPoller
+from glyphfont import GlyphFont
+from icons import IconCache
+from marquee import SubjectStrip
+from push import FeedSubscriber
+from render import TextRenderer
+from snapshot import Snapshot
+from telemetry import Telemetry
 
 # libraries
 from adafruit_matrixportal.matrixportal import MatrixPortal
 from adafruit_matrixportal.network import Network
+import adafruit_minimqtt.adafruit_minimqtt as MQTT
+from adafruit_esp32spi import adafruit_esp32spi
+import adafruit_esp32spi.adafruit_esp32spi_socket as socket
+import asyncio
 import board
-import json
+import busio
+from digitalio import DigitalInOut
+import microcontroller
 import time
-import gc
 
 # Display imports
 import terminalio
+from adafruit_display_text.label import Label
 from adafruit_io.adafruit_io import AdafruitIO_RequestError
+from adafruit_requests import OutOfRetries
 
 # Some critical but private settings are in the secrets.py file
 try:
@@ -25,24 +42,72 @@ except ImportError:
     raise
 
 # --- Configuration Settings ---
-# repoll time in seconds
-POLL_SECS = 60
-# time resync every hour to limit clock drift
-TIME_RESYNC = 300 
+# repoll time comes from the time to the next meeting, see poll_schedule in constants.py
+# the first time resync is after TIME_RESYNC seconds. The clock measures its drift across
+# the resyncs and doubles the wait while it keeps time, up to MAX_TIME_RESYNC seconds
+TIME_RESYNC = 300
+MAX_TIME_RESYNC = 6 * 60 * 60
 
 # How many characters in the appointment subject before needing to scroll the text
 SUBJECT_SCROLL_LIMIT = 10
 # To limit extremely long subjects, set the number of scroll panels are allowed
+# Only used when USE_SUBJECT_STRIP is False
 SCROLL_MULTIPLIER = 3
+# Draw long subjects into a bitmap once and scroll the bitmap instead of the text box label
+USE_SUBJECT_STRIP = True
+
+# the font for the time and status rows. TIME_FONT_SUBSET is the glyph subset of it compiled
+# with fontsubset.py, loaded in one read at boot. None to parse the BDF font on the device
+TIME_FONT = 'fonts/Minecraftia-Regular-8-mod.bdf'
+TIME_FONT_SUBSET = 'fonts/Minecraftia-Regular-8-mod.glf'
 
 # set the scroll text delay. More than 0.4 looks jerkie to me
 SCROLL_DELAY = 0.04
 
+# approximate bytes of status icons to keep in RAM. The icons are about 340 bytes each
+ICON_CACHE_BYTES = 4096
+
 # Display debug messages --------
 DEBUG = True
 MATRIX_DEBUG = True
 # -------------------------------
 
+# Snapshot ----------------------
+# keep the appointments and the time in NVM so a reboot shows them straight away instead of
+# waiting for the network. The time on its own is saved at most every SNAPSHOT_TIME_SECS
+# to spare the flash
+USE_SNAPSHOT = True
+SNAPSHOT_TIME_SECS = 3600
+# -------------------------------
+
+# Push updates ------------------
+# subscribe to the feed over MQTT so changes show within a second and an idle display makes
+# no requests. The feed is polled over HTTP while the connection is down.
+# The broker is Adafruit IO unless secrets has mqtt_host and mqtt_port
+USE_MQTT = True
+MQTT_RETRY_SECS = 30
+# how long each check for a pushed value may block the scrolling
+MQTT_SOCKET_TIMEOUT = 0.01
+# -------------------------------
+
+# Network errors ----------------
+# a failed feed poll or time sync is tried again after RETRY_BASE_SECS, doubling up to
+# RETRY_MAX_SECS. After BREAKER_FAILURES failures in a row no requests are made for
+# BREAKER_OPEN_SECS while the last good appointment stays on the display
+RETRY_BASE_SECS = 15
+RETRY_MAX_SECS = 900
+BREAKER_FAILURES = 5
+BREAKER_OPEN_SECS = 600
+# -------------------------------
+
+# Telemetry ---------------------
+# record fetch and parse times, frame rate, minimum free heap and GC count
+TELEMETRY = DEBUG
+# AIO feed key to publish the telemetry to, None to only print it when DEBUG
+TELEMETRY_FEED = None
+TELEMETRY_SECS = 300
+# -------------------------------
+
 # fetch info --------------------
 _HEADER = {'X-AIO-Key': secrets['aio_key']}
 _PATH = ['value']
@@ -56,93 +121,11 @@ Use these setting to simulate AIO responses locally debug the display look and f
 """
 sim = simdata.sim()
 USE_SIM_DATA = False
+# shorten the poll time to make the test go quicker
+SIM_POLL_SECS = 5
 # -------------------------------
 
 
-def my_local_time(pad=0) -> str:
-    """Returns the local time as a string formatted HH:MM:SS
-    :param int pad: the number of spaced characters to prepend to the string to position on the RGB LED display. Default is 0 
-    """
-    # now that we connected to the network to get the time,
-    # we can display the local time
-    curr_time_struct = time.localtime()
-    curr_time_str = '{sp}{lhrs:0>2}:{lmin:0>2}:{lsec:0>2}'.format(
-                sp=' '  * pad,
-                lhrs=curr_time_struct.tm_hour,
-                lmin=curr_time_struct.tm_min,
-                lsec=curr_time_struct.tm_sec)
-    return curr_time_str
-
-
-def compute_status(resp_status: str, meeting_status: str) -> str:
-    """Compute the status row values for icon and message.
-    :param str resp_status: the reponse status value for the appointment
-    :param str meeting_status: the meeting status for the meeting
-    Returns the status line icon, text and text color as a dict
-    """
-    # if the meeting status is canceled, ignore the response status
-    if meeting_status.lower().find('canceled') > -1:
-        return('Canceled')
-    # elif resp_status == 'None':
-    #     return('XXXX')
-    else:
-        return(resp_status)
-
-
-def get_count_down(start: str, resp_status: str) -> tuple(str, int):
-    """ Calcuates the count down value and the color. Returns the count down string and the RGB color
-        :param int start: unix epoch start time for the appointment
-        :param str resp_status: Text to display as the response status
-    """
-    # handle the no meeting scenario
-    if resp_status == 'No meeting':
-        cd_status = time_display_colors['No meeting']['color']
-        status_string = 'No meetings'
-    else:
-        # calculate the start_time string to return
-        # figure out if the start time is AM or PM
-        start_hour = time.localtime(start).tm_hour
-        suffix = 'p' if int(start_hour / 12) > 0 else 'a'
-
-        start_time = '{lhrs:0>2}:{lmin:0>2}{sfx}'.format(
-            lhrs=start_hour % 12 or 12, lmin=time.localtime(start).tm_min, sfx=suffix)
-
-        # https://stackoverflow.com/questions/14904814/nameerror-global-name-long-is-not-defined
-        # get the number of seconds for the countdown
-        count_down_val = int(int(start)-time.mktime(time.localtime()))
-
-        # calcuate the count down string
-        # https://stackoverflow.com/questions/775049/how-do-i-convert-seconds-to-hours-minutes-and-seconds
-        xmins, secs = divmod(count_down_val, 60)
-        hrs, mins = divmod(count_down_val/60, 60)
-        count_down_str = '{lmin:0>2}:{lsec:0>2}'.format(
-            lmin=int(mins), lsec=int(secs))
-
-        # set the status_string to the majority default
-        status_string = '{st}  {cd}'.format(st=start_time, cd=count_down_str)
-
-        if (count_down_val <= time_display_colors['in progress']['trigger']):
-            cd_status = time_display_colors['in progress']['color']
-            status_string = 'In progress'
-        elif count_down_val <= time_display_colors['alert']['trigger']:
-            cd_status = time_display_colors['alert']['color']
-        elif (count_down_val <= time_display_colors['warning']['trigger']):
-            cd_status = time_display_colors['warning']['color']
-        elif (count_down_val <= time_display_colors['normal']['trigger']):
-            cd_status = time_display_colors['normal']['color']
-        elif (count_down_val > time_display_colors['normal']['trigger'] and count_down_val <= time_display_colors['gt 1day']['trigger']):
-            cd_status = time_display_colors['gt 1hr']['color']
-            status_string = '{st}  >1 hr'.format(st=start_time)
-        elif (count_down_val > time_display_colors['gt 1day']['trigger']):
-            cd_status = time_display_colors['gt 1day']['color']
-            status_string = '> 1 day away'
-
-        if DEBUG:
-            print(f'{my_local_time()} start: {int(start)} local time: {time.mktime(time.localtime())} count_down_val: {count_down_val}')
-
-    return status_string, cd_status
-
-
 # icon bitmap
 # https://icon-library.net/icon/icon-pixels-6.html
 # in GIMP export to BMP after chaning Image mode to Indexed and Generate Optimum pallet
@@ -168,8 +151,29 @@ status_msg = {
                 }
 
 # --- Display setup ---
+# the WiFi co-processor is set up here so the MQTT client can share it with the MatrixPortal
+spi = busio.SPI(board.SCK, board.MOSI, board.MISO)
+esp = adafruit_esp32spi.ESP_SPIcontrol(
+    spi, DigitalInOut(board.ESP_CS), DigitalInOut(board.ESP_BUSY), DigitalInOut(board.ESP_RESET))
 matrixportal = MatrixPortal(
-    bit_depth=4, status_neopixel=board.NEOPIXEL, debug=MATRIX_DEBUG)
+    esp=esp, external_spi=spi, bit_depth=4, status_neopixel=board.NEOPIXEL, debug=MATRIX_DEBUG)
+
+# add_text only loads a font from its path, so the time and status rows get their own labels
+# drawn with the glyph subset font. Their text boxes below are still added to keep the indexes
+time_labels = {}
+if TIME_FONT_SUBSET:
+    try:
+        time_font = GlyphFont(TIME_FONT_SUBSET, fallback=TIME_FONT)
+        for index, color, position in ((1, 0x262022, (0, 16)), (2, 0x808080, (12, 27))):
+            time_labels[index] = Label(time_font, text=' ', color=color,
+                                       anchor_point=(0, 0.5), anchored_position=position)
+            matrixportal.splash.append(time_labels[index])
+    except (OSError, ValueError) as e:
+        if DEBUG:
+            print(f'Glyph subset font not loaded, using {TIME_FONT}: {e}')
+
+# only push text box changes to the display
+renderer = TextRenderer(matrixportal, labels=time_labels)
 
 
 # --- Set up the text areas ---
@@ -180,24 +184,24 @@ matrixportal.add_text(
     text_position=(0, 4),
     scrolling=True,
 )
-matrixportal.set_text(' ', 0)
+renderer.set_text(' ', 0)
 
 # Create a new textbox 1 time
 matrixportal.add_text(
-    text_font='fonts/Minecraftia-Regular-8-mod.bdf',
+    text_font=TIME_FONT,
     text_color=0x262022,
     text_position=(0, 16)
 )
-matrixportal.set_text(' ', 1)
+renderer.set_text(' ', 1)
 
 
 # Create a new textbox 2 response status
 matrixportal.add_text(
-    text_font='fonts/Minecraftia-Regular-8-mod.bdf',
+    text_font=TIME_FONT,
     text_position=(12, 27),
     text_color=0x808080
 )
-matrixportal.set_text(' ', 2)
+renderer.set_text(' ', 2)
 
 
 # Create a new textbox 3 for non-scrolling Subject
@@ -206,163 +210,103 @@ matrixportal.add_text(
     text_color=0x9b67fc,
     text_position=(0, 4)
 )
-matrixportal.set_text(' ', 3)
+renderer.set_text(' ', 3)
 
-matrixportal.set_text('Setting time...', 1)
+# Need to set the clock to local time
+clock = DriftClock(lambda: matrixportal.get_local_time(location=secrets['timezone']),
+                   min_interval=TIME_RESYNC, max_interval=MAX_TIME_RESYNC)
+
+# long subjects are drawn once per appointment and scrolled by moving the bitmap
+strip = SubjectStrip(matrixportal.splash, terminalio.FONT, 0x9b67fc, position=(0, 4)) if USE_SUBJECT_STRIP else None
+
+# load each status icon from flash once, on first use
+icons = IconCache(matrixportal.splash, position=(0, 21), budget=ICON_CACHE_BYTES)
+
+telemetry = Telemetry(enabled=TELEMETRY)
+
+push = None
+if USE_MQTT:
+    MQTT.set_socket(socket, esp)
+    # TLS unless secrets.py turns it off for a local broker
+    mqtt_secure = secrets.get('mqtt_secure', True)
+    push = FeedSubscriber(
+        MQTT.MQTT(broker=secrets.get('mqtt_host', 'io.adafruit.com'),
+                  port=secrets.get('mqtt_port', 8883 if mqtt_secure else 1883),
+                  is_ssl=mqtt_secure,
+                  username=secrets['aio_username'],
+                  password=secrets['aio_key'],
+                  socket_timeout=MQTT_SOCKET_TIMEOUT),
+        '{}/feeds/{}'.format(secrets['aio_username'], secrets['aio_feed']),
+        retry_secs=MQTT_RETRY_SECS, loop_timeout=MQTT_SOCKET_TIMEOUT)
+
+# only parse the feed and reconfigure the display when the appointment changes
+poller = FeedPoller(lambda: matrixportal.get_io_data(secrets['aio_feed']), telemetry=telemetry)
+
+# the scroll, count down, feed poll and clock resync run as cooperative tasks
+app = NextMeetingApp(
+    matrixportal,
+    poller,
+    lambda: matrixportal.get_local_time(location=secrets['timezone']),
+    status_msg,
+    renderer=renderer,
+    icons=icons,
+    strip=strip,
+    sim=sim if USE_SIM_DATA else None,
+    push=push,
+    clock=clock,
+    error_text={AdafruitIO_RequestError: 'Feed error', OutOfRetries: 'OutOfRetries'},
+    telemetry=telemetry,
+    publish_telemetry=(lambda value: matrixportal.push_to_io(TELEMETRY_FEED, value)) if TELEMETRY_FEED else None,
+    telemetry_secs=TELEMETRY_SECS,
+    snapshot=Snapshot(microcontroller.nvm, time_secs=SNAPSHOT_TIME_SECS) if USE_SNAPSHOT else None,
+    fetch_breaker=CircuitBreaker('feed', base_secs=RETRY_BASE_SECS, max_secs=RETRY_MAX_SECS,
+                                 threshold=BREAKER_FAILURES, open_secs=BREAKER_OPEN_SECS),
+    time_breaker=CircuitBreaker('time', base_secs=RETRY_BASE_SECS, max_secs=RETRY_MAX_SECS,
+                                threshold=BREAKER_FAILURES, open_secs=BREAKER_OPEN_SECS),
+    debug=DEBUG,
+    subject_scroll_limit=SUBJECT_SCROLL_LIMIT,
+    scroll_multiplier=SCROLL_MULTIPLIER,
+    scroll_delay=SCROLL_DELAY,
+    time_resync=TIME_RESYNC,
+    sim_poll_secs=SIM_POLL_SECS)
+
+
+# show the appointments from before the reboot while the network warms up
+restored = app.restore()
+if not restored:
+    renderer.set_text('Setting time...', 1)
 
 # try doing an AIO call before getting time and avoid bug
 # https://github.com/adafruit/Adafruit_CircuitPython_MatrixPortal/issues/51
 before_time = time.monotonic()
 try:
     matrixportal.get_io_feed(secrets['aio_feed'])
-except RuntimeError as e:
+except Exception as e:
+    # carry on to the display tasks, which retry with backoff, rather than crash and reboot
     if DEBUG:
-        print(f'{my_local_time()} RuntimeError: {e}')
+        print(f'{my_local_time()} {type(e).__name__}: {e}')
 if DEBUG:
     print(f'AIO get_io_feed response time: {time.monotonic() - before_time}')
 
-# Need to set the clock to local time
 before_time = time.monotonic()
 try:
-    matrixportal.get_local_time(location=secrets['timezone'])
-except RuntimeError as e:
+    app.time_breaker.call(clock.sync)
+    app.time_synced()
+except Exception as e:
     if DEBUG:
-        print(f'{my_local_time()} RuntimeError: {e}')
-# set variable to manage time resync period
-last_time_sync = time.monotonic()
+        print(f'{my_local_time()} {type(e).__name__}: {e}')
 
 # now that we connected to the network to get the time,
 # we can display the local time
 curr_time = my_local_time(6)
-matrixportal.set_text_color(0x6666FF, 1)
-
-matrixportal.set_text(curr_time, 1)
+if not restored:
+    renderer.set_text_color(0x6666FF, 1)
+    renderer.set_text(curr_time, 1)
 
 if DEBUG:
     print(f'AIO get_local_time response time: {time.monotonic() - before_time}')
     print(f'time.localtime: {curr_time}')
 
 
-def main():
-    # because this get changed for simulated data, declare it as global
-    global POLL_SECS
-
-    # for testing
-    if USE_SIM_DATA:
-        if DEBUG:
-            before_mem = gc.mem_free()
-            gc.collect()
-            print(
-                f'Simulating data, Available Heap before: {before_mem} after: {gc.mem_free()}')
-        POLL_SECS = 5  # shorten the poll time to make the test go quicker
-        # appt_data = sim.get_sim_data(meet_stat='None', subject='Me too!!!', resp_stat='Not Responded', ttime=None)
-        appt_data = sim.get_sim_data()
-
-    # Typical path to get the latet appointment from AIO
-    else:
-        # check to see if the feed exists
-        before_time = time.monotonic()
-        if DEBUG:
-            print(f'{my_local_time()} right before get_io_data()')
-        try:
-            ol_event_feed = matrixportal.get_io_data(secrets['aio_feed'])
-            # you can also use fetch_data()
-            # ol_event_feed = matrixportal.network.fetch_data(
-            #     _RECENT_DATA_URL, headers=_HEADER, json_path=(_PATH,))
-        except AdafruitIO_RequestError:
-            matrixportal.set_text_color(0xFF0000, 1)
-            matrixportal.set_text('Feed error', 1)
-            time.sleep(30)
-        except OutOfRetries:
-            matrixportal.set_text_color(0xFF0000, 1)
-            matrixportal.set_text('OutOfRetries', 1)
-            time.sleep(30)
-            # continue
-        except Exception as e:
-            if DEBUG:
-                print(f'{my_local_time()} Exception: {type(e).__name__} {e}')
-            # continue
-        else: # no exception so there should be an ol_event_feed object
-            if DEBUG:
-                print(f'{my_local_time()} Available Heap: {gc.mem_free()}')
-                print(
-                    f'{my_local_time()} AIO get_io_data response time: {time.monotonic() - before_time}')
-            # handle no data on AIO
-            if len(ol_event_feed) == 0:
-                # set all appt_data fields for nothing to display
-                if DEBUG:
-                    print(f'{my_local_time()} No meetings to display')
-                appt_data = {}
-                appt_data['subject'] = ''
-                appt_data['responseStatus'] = 'No meeting'
-                appt_data['meeting_status'] = ' '
-                # make up a start time
-                appt_data['start'] = time.mktime(time.localtime())
-
-            else:
-                # use this with get_io_data()
-                appt_data = json.loads(ol_event_feed[0]['value'])
-                # use this with network.fetch_data()
-                # appt_data = json.loads(ol_event_feed[0])
-
-                if DEBUG:
-                    print(f'appt_data: {appt_data}')
-                    print(f'appt_data["subject"]: {appt_data["subject"]}')
-                    print(f'appt_data["start"]: {appt_data["start"]}')
-
-    if DEBUG:
-        before_mem = gc.mem_free()
-        gc.collect()
-        print(f'{my_local_time()} Available Heap before: {before_mem} after: {gc.mem_free()}')
-        foo = appt_data['subject'].strip()
-        before_mem = gc.mem_free()
-        gc.collect()
-        print(f'{my_local_time()} Available Heap before: {before_mem} after strip: {gc.mem_free()}')
-
-    if len(appt_data['subject']) > SUBJECT_SCROLL_LIMIT:
-        matrixportal.set_text(appt_data['subject'].strip()[:SUBJECT_SCROLL_LIMIT * SCROLL_MULTIPLIER], 0)
-        matrixportal.set_text(' ', 3)
-    else:
-        matrixportal.set_text(appt_data['subject'].strip(), 3)
-        matrixportal.set_text(' ', 0)
-
-    # Set Response status text and icon
-    status_display = compute_status(appt_data['responseStatus'],appt_data['meeting_status'])
-    print(f'{my_local_time()} status_display: {status_display}')
-    matrixportal.set_text(status_msg[status_display]['text'], 2)
-    matrixportal.set_text_color(
-        status_msg[status_display]['color'], 2)
-    matrixportal.set_background(
-        status_msg[status_display]['icon'], [0, 21])
-    
-
-    # to set up for the re-poll time, get the last update time
-    last = time.time()
-    # Need to loop to allow the scrolling text to be continuously displayed
-    # Loop until the re-poll time is over
-    while time.time() - last < POLL_SECS:
-        # calculate the time row contents
-        count_down_str, count_down_stat_color = get_count_down(
-            appt_data['start'], appt_data['responseStatus'])
-        matrixportal.set_text_color(count_down_stat_color, 1)
-        matrixportal.set_text(count_down_str, 1)
-        # scroll the text
-        matrixportal.scroll_text(SCROLL_DELAY)
-    
-    gc.collect()
-    if DEBUG:
-        print(f'{my_local_time()} Available Heap: {gc.mem_free()}')
-
-
 if __name__ == '__main__':
-    while True:
-        # check for time resync. The MatrixPortal clock seems to drift enough over long 
-        # periods that the meeting count down display is misleading
-        if (time.monotonic() - last_time_sync > TIME_RESYNC):
-            last_time_sync = time.monotonic()
-            try:
-                matrixportal.get_local_time(location=secrets['timezone'])
-            except Exception as e:
-                if DEBUG:
-                    print(f'{my_local_time()} get_local_time exception: {e}')
-        main()
+    asyncio.run(app.run())
@@ -8,4 +8,32 @@ time_display_colors = {
     "alert":        {"color": 0xCC0000, "trigger": 300},    # 5 min
     "in progress":  {"color": 0x0000FF, "trigger": 0},
     "No meeting":   {"color": 0x035400, "trigger": 0}
-}
\ No newline at end of file
+}
+
+# define the adaptive poll interval in seconds for each time display band
+poll_schedule = {
+    "min":      15,
+    "max":      900,
+    "jitter":   0.1,    # +/- fraction of the interval to spread the polls from several displays
+    "bands": {
+        "gt 1day":      900,
+        "gt 1hr":       300,
+        "normal":       120,
+        "warning":      60,
+        "alert":        30,
+        "in progress":  300,    # the display moves on to the next queued meeting by itself
+        "No meeting":   600
+    }
+}
+
+# --- Some helpful Outlook constants, shared by the client and the feed encoding ---
+
+# https://docs.microsoft.com/en-us/office/vba/api/outlook.olresponsestatus
+ResponseStatus = ["None", "Organizer", "Tentative",
+                  "Accepted", "Declined", "Not Responded"]
+
+# https://docs.microsoft.com/en-us/office/vba/api/outlook.olmeetingstatus
+MeetingStatus = ["None", "Meeting", "", "Received", "", "Canceled", "", "Received/Canceled"]
+
+# the status_msg keys the display can show, see frames.compute_status()
+DisplayStatus = ResponseStatus + ["Canceled", "No meeting"]
@@ -0,0 +1,141 @@
+"""
+Count down row state for the next appointment
+
+The start time label and the absolute epoch boundaries of each color band in
+constants.time_display_colors are worked out once per appointment. After that
+each frame is a comparison against the next boundary, and the MM:SS string is
+only rebuilt when the second changes.
+"""
+import time
+from constants import time_display_colors
+
+# text shown in the bands that do not count down
+IN_PROGRESS_STR = 'In progress'
+NO_MEETING_STR = 'No meetings'
+GT_1DAY_STR = '> 1 day away'
+
+
+# the time_display_colors keys of the bands after the first, in edge order
+EDGE_NAMES = ('gt 1hr', 'normal', 'warning', 'alert', 'in progress')
+
+
+def start_label(start: int, localtime=time.localtime) -> str:
+    """Returns the appointment start time formatted HH:MMa or HH:MMp (12 hour time)
+    :param int start: unix epoch start time for the appointment
+    :param localtime: converts the epoch to a struct_time. Default is time.localtime
+    """
+    start_struct = localtime(start)
+    # figure out if the start time is AM or PM
+    suffix = 'p' if start_struct.tm_hour >= 12 else 'a'
+    return '{lhrs:0>2}:{lmin:0>2}{sfx}'.format(
+        lhrs=start_struct.tm_hour % 12 or 12, lmin=start_struct.tm_min, sfx=suffix)
+
+
+def band_edges(start: int, colors=time_display_colors) -> list:
+    """Returns the unix epoch edges of the EDGE_NAMES bands for an appointment
+    :param int start: unix epoch start time for the appointment
+    :param dict colors: the color and trigger library. Default is constants.time_display_colors
+    """
+    start = int(start)
+    # the count down is start - now, so a trigger of N seconds becomes the edge start - N.
+    # The 'gt 1hr' band starts at the 'gt 1day' trigger
+    return [start - colors['gt 1day']['trigger'],
+            start - colors['normal']['trigger'],
+            start - colors['warning']['trigger'],
+            start - colors['alert']['trigger'],
+            start - colors['in progress']['trigger']]
+
+
+def bands_from_edges(edges: list, label: str, colors=time_display_colors) -> list:
+    """Returns the display bands for band_edges() and a start_label(), see build_bands()
+    :param list edges: the unix epoch edges of the EDGE_NAMES bands
+    :param str label: the start time label
+    :param dict colors: the color and trigger library. Default is constants.time_display_colors
+    """
+    texts = ('{st}  >1 hr'.format(st=label), None, None, None, IN_PROGRESS_STR)
+    bands = [(0, colors['gt 1day']['color'], GT_1DAY_STR, 'gt 1day')]
+    for edge, name, text in zip(edges, EDGE_NAMES, texts):
+        bands.append((edge, colors[name]['color'], text, name))
+    return bands
+
+
+def build_bands(start: int, resp_status: str, colors=time_display_colors, localtime=time.localtime) -> list:
+    """Returns the display bands for an appointment as a list of (edge, color, text, name) tuples
+    sorted by edge. A band applies from its edge (unix epoch, inclusive) until the next band's
+    edge. A text of None means the band shows the start time and the MM:SS count down. The
+    name is the time_display_colors key for the band.
+    :param int start: unix epoch start time for the appointment
+    :param str resp_status: the response status, 'No meeting' when there is nothing to show
+    :param dict colors: the color and trigger library. Default is constants.time_display_colors
+    :param localtime: converts the epoch to a struct_time for the label. Default is time.localtime
+    """
+    if resp_status == 'No meeting':
+        return [(0, colors['No meeting']['color'], NO_MEETING_STR, 'No meeting')]
+    return bands_from_edges(band_edges(start, colors), start_label(int(start), localtime), colors)
+
+
+class CountDown:
+    """Count down row text and color for one appointment
+
+    :param int start: unix epoch start time for the appointment
+    :param str resp_status: the response status, 'No meeting' when there is nothing to show
+    :param str label: the start time label precomputed by the PC client. Default is None to work it out
+    :param list edges: the band edges precomputed by the PC client. Default is None to work them out
+    """
+
+    def __init__(self, start: int, resp_status: str, label=None, edges=None):
+        self.start = int(start)
+        if resp_status == 'No meeting':
+            self.label = ''
+            self.bands = build_bands(self.start, resp_status)
+        elif label is not None and edges is not None:
+            self.label = label
+            self.bands = bands_from_edges(edges, label)
+        else:
+            self.label = start_label(self.start)
+            self.bands = bands_from_edges(band_edges(self.start), self.label)
+        self._band = -1
+        self._band_edge = 0
+        self._next_edge = 0
+        self._text = ''
+        self._color = 0
+        self._last_secs = None
+
+    def _locate(self, now: int) -> None:
+        """Find the band for now. Only needed when crossing an edge or after a clock resync"""
+        band = 0
+        while band + 1 < len(self.bands) and now >= self.bands[band + 1][0]:
+            band += 1
+        self._band = band
+        self._band_edge = self.bands[band][0]
+        self._next_edge = self.bands[band + 1][0] if band + 1 < len(self.bands) else float('inf')
+        self._color = self.bands[band][1]
+        self._text = self.bands[band][2]
+        self._last_secs = None
+
+    def update(self, now: int) -> tuple:
+        """Returns the count down string and the RGB color for the time now
+        :param int now: the current unix epoch time
+        """
+        # the band edge check catches the clock being set backwards by a time resync
+        if now >= self._next_edge or now < self._band_edge:
+            self._locate(now)
+
+        if self.bands[self._band][2] is None:
+            count_down_val = self.start - now
+            # only rebuild the string when the second changes
+            if count_down_val != self._last_secs:
+                self._last_secs = count_down_val
+                mins, secs = divmod(count_down_val, 60)
+                self._text = '{st}  {lmin:0>2}:{lsec:0>2}'.format(
+                    st=self.label, lmin=mins % 60, lsec=secs)
+
+        return self._text, self._color
+
+    def band_name(self, now: int) -> str:
+        """Returns the time_display_colors key of the band for the time now
+        :param int now: the current unix epoch time
+        """
+        if now >= self._next_edge or now < self._band_edge:
+            self._locate(now)
+        return self.bands[self._band][3]
@@ -0,0 +1,311 @@
+""" Headless stand-in for the MatrixPortal display API.
+
+Renders the 64x32 panel into a NumPy framebuffer under CPython so the display code in
+app.py can be run, captured and measured off the device. It supports the MatrixPortal
+calls the display code uses:
+
+    add_text, set_text, set_text_color, set_background, scroll, scroll_text,
+    get_io_data, get_local_time
+
+Text is drawn with the real BDF font from fonts/ and icons with the real BMPs from images/.
+terminalio.FONT is built into CircuitPython and not available here, so text boxes asking for
+it are drawn with the BDF font too. Label placement follows displayio (text_position is the
+left edge and vertical middle of the text) closely enough to see the layout, not pixel exact.
+
+Every refresh counts label updates and the pixels that changed, and times the render:
+
+    portal = EmulatedMatrixPortal()
+    app = NextMeetingApp(portal, ...)
+    ...
+    print(portal.stats())
+    portal.save_ppm('frame.ppm')
+"""
+from typing import Dict, List, Tuple
+import os
+import struct
+import time
+
+import numpy as np
+
+from fontsubset import read_bdf
+
+WIDTH = 64
+HEIGHT = 32
+DEFAULT_FONT = 'fonts/Minecraftia-Regular-8-mod.bdf'
+
+
+def rgb(color: int) -> Tuple[int, int, int]:
+    """Returns a 0xRRGGBB color as an (r, g, b) tuple"""
+    return (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF
+
+
+class BDFFont:
+    """
+    Glyphs from a BDF font file
+
+    :param str path: the BDF file
+    """
+
+    def __init__(self, path: str):
+        # code point -> (bitmap rows as a bool array, x offset, y offset, advance)
+        self.glyphs = {}
+        for code, (advance, (width, height, x_off, y_off), rows) in read_bdf(path)[1].items():
+            bits = np.array([[bool(row & (1 << (width - 1 - col))) for col in range(width)] for row in rows],
+                            dtype=bool).reshape(height, width)
+            self.glyphs[code] = (bits, x_off, y_off, advance)
+        tops = [glyph[0].shape[0] + glyph[2] for glyph in self.glyphs.values()]
+        bottoms = [glyph[2] for glyph in self.glyphs.values()]
+        self.ascent = max(tops) if tops else 0
+        self.descent = -min(bottoms) if bottoms else 0
+
+    def width(self, text: str) -> int:
+        """Returns the width of the text in pixels"""
+        return sum(self.glyphs[ord(char)][3] for char in text if ord(char) in self.glyphs)
+
+
+def load_bmp(path: str) -> np.ndarray:
+    """
+    Load an uncompressed or bit field BMP as a height x width x 3 uint8 array
+
+    Handles 1, 4 and 8 bit palette images and 16, 24 and 32 bit true color images,
+    like the R5 G5 B5 icons in images/.
+
+    :param str path: the BMP file
+    """
+    with open(path, 'rb') as bmp:
+        data = bmp.read()
+    pixel_offset = struct.unpack_from('<I', data, 10)[0]
+    header_size, width, height, _, bits, compression = struct.unpack_from('<IiiHHI', data, 14)
+    bottom_up = height > 0
+    height = abs(height)
+    row_size = ((width * bits + 31) // 32) * 4
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+
+    palette = []
+    if bits <= 8:
+        colors = struct.unpack_from('<I', data, 46)[0] or (1 << bits)
+        for index in range(colors):
+            blue, green, red, _ = struct.unpack_from('<BBBB', data, 14 + header_size + index * 4)
+            palette.append((red, green, blue))
+
+    if bits == 16:
+        if compression == 3:
+            # the red, green and blue masks follow the 40 byte part of the info header
+            masks = struct.unpack_from('<III', data, 54)
+        else:
+            masks = (0x7C00, 0x03E0, 0x001F)
+
+    for row in range(height):
+        offset = pixel_offset + row * row_size
+        y = height - 1 - row if bottom_up else row
+        for x in range(width):
+            if bits <= 8:
+                byte = data[offset + (x * bits) // 8]
+                shift = 8 - bits - (x * bits) % 8
+                image[y, x] = palette[(byte >> shift) & ((1 << bits) - 1)]
+            elif bits == 16:
+                value = struct.unpack_from('<H', data, offset + x * 2)[0]
+                pixel = []
+                for mask in masks:
+                    shift = (mask & -mask).bit_length() - 1
+                    pixel.append(((value & mask) >> shift) * 255 // (mask >> shift))
+                image[y, x] = pixel
+            else:
+                blue, green, red = data[offset + x * bits // 8:offset + x * bits // 8 + 3]
+                image[y, x] = (red, green, blue)
+    return image
+
+
+class EmulatedMatrixPortal:
+    """
+    CPython stand-in for adafruit_matrixportal.matrixportal.MatrixPortal
+
+    :param str root: the directory font and image paths are relative to. Default is this file's directory
+    :param bool capture: keep a copy of every rendered frame in frames. Default is False
+    """
+
+    def __init__(self, root: str = None, capture: bool = False):
+        self.root = root or os.path.dirname(os.path.abspath(__file__))
+        self.capture = capture
+        self.framebuffer = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        self.frames = []
+        self.feeds = {}
+        self._fonts = {}
+        self._text = []
+        self._background = None
+        self._images = {}
+        self._scrolling_index = None
+        self._dirty = True
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Clear the call, pixel and time counters"""
+        self.counts = {'set_text': 0, 'set_text_color': 0, 'set_background': 0,
+                       'scroll': 0, 'refresh': 0, 'render': 0}
+        self.pixels_changed = 0
+        self.render_ns = []
+
+    def _path(self, path: str) -> str:
+        return path if os.path.isabs(path) else os.path.join(self.root, path)
+
+    def _font(self, font) -> BDFFont:
+        # terminalio.FONT and anything else that is not a file name get the default BDF font
+        path = font if isinstance(font, str) else DEFAULT_FONT
+        if path not in self._fonts:
+            self._fonts[path] = BDFFont(self._path(path))
+        return self._fonts[path]
+
+    # --- MatrixPortal text API ---
+
+    def add_text(self, text_position=(0, 0), text_font=None, text_color=0x808080,
+                 scrolling=False, **kwargs) -> int:
+        """Add a text box. Returns the index of the text box"""
+        self._text.append({'position': text_position,
+                           'font': self._font(text_font),
+                           'color': text_color,
+                           'scrolling': scrolling,
+                           'text': '',
+                           'x': text_position[0]})
+        self._dirty = True
+        return len(self._text) - 1
+
+    def set_text(self, val: str, index: int = 0) -> None:
+        """Set the text of a text box"""
+        self.counts['set_text'] += 1
+        text_box = self._text[index]
+        text_box['text'] = str(val)
+        if text_box['scrolling']:
+            # scrolling text starts off the right edge like the MatrixPortal
+            text_box['x'] = WIDTH
+        self._dirty = True
+
+    def set_text_color(self, color: int, index: int = 0) -> None:
+        """Set the color of a text box"""
+        self.counts['set_text_color'] += 1
+        self._text[index]['color'] = color
+        self._dirty = True
+
+    def set_background(self, file_or_color, position=None) -> None:
+        """Set the background to an image file or a color. An empty value clears it"""
+        self.counts['set_background'] += 1
+        if not file_or_color and file_or_color != 0:
+            self._background = None
+        elif isinstance(file_or_color, str):
+            if file_or_color not in self._images:
+                self._images[file_or_color] = load_bmp(self._path(file_or_color))
+            self._background = (self._images[file_or_color], tuple(position or (0, 0)))
+        else:
+            self._background = (rgb(file_or_color), None)
+        self._dirty = True
+
+    def _next_scrolling_index(self):
+        indexes = [index for index, text_box in enumerate(self._text) if text_box['scrolling']]
+        if not indexes:
+            return None
+        if self._scrolling_index not in indexes:
+            return indexes[0]
+        return indexes[(indexes.index(self._scrolling_index) + 1) % len(indexes)]
+
+    def scroll(self) -> None:
+        """Scroll the scrolling text by one pixel and refresh the display"""
+        self.counts['scroll'] += 1
+        if self._scrolling_index is None:
+            self._scrolling_index = self._next_scrolling_index()
+        if self._scrolling_index is not None:
+            text_box = self._text[self._scrolling_index]
+            text_box['x'] -= 1
+            if text_box['x'] < -text_box['font'].width(text_box['text']):
+                text_box['x'] = WIDTH
+                self._scrolling_index = self._next_scrolling_index()
+            self._dirty = True
+        self.refresh()
+
+    def scroll_text(self, frame_delay: float = 0.02) -> None:
+        """Scroll the current scrolling text all the way across"""
+        start_index = self._scrolling_index = self._next_scrolling_index()
+        if start_index is None:
+            return
+        while self._scrolling_index == start_index:
+            self.scroll()
+            time.sleep(frame_delay)
+
+    # --- MatrixPortal network API stand-ins ---
+
+    def get_io_data(self, feed_key: str) -> List[dict]:
+        """Returns the items in feeds[feed_key], newest first"""
+        return self.feeds.get(feed_key, [])
+
+    def get_io_feed(self, feed_key: str) -> dict:
+        return {'key': feed_key}
+
+    def get_local_time(self, location=None) -> None:
+        """The host clock is already right"""
+
+    # --- rendering ---
+
+    def _draw_text(self, frame: np.ndarray, text_box: dict) -> None:
+        font = text_box['font']
+        color = rgb(text_box['color'])
+        x = text_box['x']
+        # text_position y is the vertical middle of the text
+        baseline = text_box['position'][1] + (font.ascent - font.descent) // 2
+        for char in text_box['text']:
+            glyph = font.glyphs.get(ord(char))
+            if glyph is None:
+                continue
+            rows, x_off, y_off, advance = glyph
+            top = baseline - y_off - rows.shape[0]
+            left = x + x_off
+            # clip the glyph to the panel
+            y0, y1 = max(top, 0), min(top + rows.shape[0], HEIGHT)
+            x0, x1 = max(left, 0), min(left + rows.shape[1], WIDTH)
+            if y0 < y1 and x0 < x1:
+                mask = rows[y0 - top:y1 - top, x0 - left:x1 - left]
+                frame[y0:y1, x0:x1][mask] = color
+            x += advance
+
+    def render(self) -> np.ndarray:
+        """Draw the background and text boxes into a new frame"""
+        frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        if self._background is not None:
+            image, position = self._background
+            if position is None:
+                frame[:, :] = image
+            else:
+                x, y = position
+                height = min(image.shape[0], HEIGHT - y)
+                width = min(image.shape[1], WIDTH - x)
+                frame[y:y + height, x:x + width] = image[:height, :width]
+        for text_box in self._text:
+            self._draw_text(frame, text_box)
+        return frame
+
+    def refresh(self) -> None:
+        """Render the panel if anything changed and count the pixels that changed"""
+        self.counts['refresh'] += 1
+        if not self._dirty:
+            return
+        start = time.perf_counter_ns()
+        frame = self.render()
+        self.render_ns.append(time.perf_counter_ns() - start)
+        self.counts['render'] += 1
+        self.pixels_changed += int(np.count_nonzero((frame != self.framebuffer).any(axis=2)))
+        self.framebuffer = frame
+        self._dirty = False
+        if self.capture:
+            self.frames.append(frame.copy())
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the call counts, changed pixels and render times"""
+        result = dict(self.counts)
+        result['pixels_changed'] = self.pixels_changed
+        result['render_ms_avg'] = sum(self.render_ns) / len(self.render_ns) / 1e6 if self.render_ns else 0
+        result['render_ms_max'] = max(self.render_ns) / 1e6 if self.render_ns else 0
+        return result
+
+    def save_ppm(self, path: str, scale: int = 8) -> None:
+        """Save the framebuffer as a PPM image, scaled up so the pixels are visible"""
+        image = self.framebuffer.repeat(scale, axis=0).repeat(scale, axis=1)
+        with open(path, 'wb') as ppm:
+            ppm.write('P6 {} {} 255\n'.format(image.shape[1], image.shape[0]).encode())
+            ppm.write(image.tobytes())
@@ -0,0 +1,142 @@
+""" A local fake of the Adafruit IO REST API feed data calls.
+
+Enough of the v2 API for nextCalAppt.py and the Matrix Portal to talk to, keeping the feed
+data in memory and recording every request so request counts can be checked:
+
+    GET    /api/v2/{username}/feeds/{feed}
+    GET    /api/v2/{username}/feeds/{feed}/data
+    GET    /api/v2/{username}/feeds/{feed}/data/last
+    POST   /api/v2/{username}/feeds/{feed}/data
+    DELETE /api/v2/{username}/feeds/{feed}/data/{id}
+
+Use it from Python:
+
+    server = FakeAIO()
+    server.start()
+    aio = Client("user", "key", base_url=server.base_url)
+    ...
+    server.stop()
+
+or run it from the command line with `python fakeaio.py [port]` and set aio_base_url in
+secrets.py to http://localhost:port.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+import datetime as dt
+import json
+import sys
+import threading
+import uuid
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Handles the requests for the FakeAIO in self.server.fake"""
+
+    def log_message(self, format, *args):
+        # keep test output quiet, the requests are recorded on the FakeAIO
+        pass
+
+    def _reply(self, status: int, body=None) -> None:
+        payload = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _route(self) -> Tuple[str, List[str]]:
+        parts = self.path.split("?")[0].strip("/").split("/")
+        # api, v2, username, feeds, feed, ...
+        if len(parts) < 5 or parts[:2] != ["api", "v2"] or parts[3] != "feeds":
+            return "", []
+        return parts[4], parts[5:]
+
+    def _handle(self, method: str) -> None:
+        fake = self.server.fake
+        fake.requests.append((method, self.path))
+        feed, rest = self._route()
+        body = None
+        if method == "POST":
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        with fake.lock:
+            status, reply = fake.handle(method, feed, rest, body)
+        self._reply(status, reply)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class FakeAIO:
+    """
+    In-memory Adafruit IO feed data server
+
+    :param int port: the local port to listen on. Default is 0 for any free port
+    """
+
+    def __init__(self, port: int = 0):
+        self.feeds = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """The URL to pass to the Adafruit_IO Client as base_url"""
+        return "http://127.0.0.1:{0}".format(self._httpd.server_address[1])
+
+    def count(self, method: str = None) -> int:
+        """Returns the number of requests received, optionally only for one HTTP method"""
+        return len([req for req in self.requests if method is None or req[0] == method])
+
+    def handle(self, method: str, feed: str, rest: List[str], body: dict) -> Tuple[int, object]:
+        """Returns the HTTP status and JSON reply for a request"""
+        if not feed:
+            return 404, {"error": "not found"}
+        data = self.feeds.setdefault(feed, [])
+        if not rest and method == "GET":
+            return 200, {"key": feed, "name": feed}
+        if rest == ["data"] and method == "GET":
+            # newest first like AIO
+            return 200, list(reversed(data))
+        if rest == ["data", "last"] and method == "GET":
+            if not data:
+                return 404, {"error": "not found"}
+            return 200, data[-1]
+        if rest == ["data"] and method == "POST":
+            item = {"id": uuid.uuid4().hex,
+                    "value": body.get("value"),
+                    "feed_key": feed,
+                    "created_at": dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+            item["updated_at"] = item["created_at"]
+            data.append(item)
+            return 200, item
+        if len(rest) == 2 and rest[0] == "data" and method == "DELETE":
+            before = len(data)
+            data[:] = [item for item in data if item["id"] != rest[1]]
+            return (200, None) if len(data) < before else (404, {"error": "not found"})
+        return 404, {"error": "not found"}
+
+    def start(self) -> None:
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving requests"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+if __name__ == "__main__":
+    server = FakeAIO(int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
+    print("Fake AIO at", server.base_url)
+    server._httpd.serve_forever()
@@ -0,0 +1,205 @@
+""" A local MQTT broker for testing the push updates without a network.
+
+Enough of MQTT 3.1.1 for nextCalAppt.py and the Matrix Portal to talk through: connect,
+subscribe with + and # wildcards, publish at QoS 0 and 1, retained messages, ping and
+disconnect. There is no authentication, any username and key are accepted. Every publish
+is recorded so message counts can be checked.
+
+Use it from Python:
+
+    broker = FakeMQTT()
+    broker.start()
+    ...
+    broker.stop()
+
+or run it from the command line with `python fakemqtt.py [port]` and set mqtt_host and
+mqtt_port in secrets.py to point at it, with mqtt_secure False.
+"""
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from typing import Tuple
+import struct
+import sys
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """Returns True if a topic matches a subscription pattern with + and # wildcards"""
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts) or (part != "+" and part != topic_parts[index]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+def _string(data: bytes, offset: int) -> Tuple[str, int]:
+    length = struct.unpack_from(">H", data, offset)[0]
+    return data[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+def _packet(kind: int, flags: int, body: bytes) -> bytes:
+    header = bytearray([(kind << 4) | flags])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+
+class _Handler(StreamRequestHandler):
+    """One client connection to the FakeMQTT in self.server.fake"""
+
+    def _read_packet(self):
+        first = self.rfile.read(1)
+        if not first:
+            return None, 0, b""
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self.rfile.read(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return first[0] >> 4, first[0] & 0x0F, self.rfile.read(length)
+
+    def send(self, data: bytes) -> None:
+        with self.lock:
+            self.wfile.write(data)
+
+    def handle(self):
+        fake = self.server.fake
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        with fake.lock:
+            fake.clients.append(self)
+        try:
+            while True:
+                kind, flags, body = self._read_packet()
+                if kind is None or kind == DISCONNECT:
+                    break
+                if kind == CONNECT:
+                    fake.connects += 1
+                    self.send(_packet(CONNACK, 0, b"\x00\x00"))
+                elif kind == PUBLISH:
+                    topic, offset = _string(body, 0)
+                    qos = (flags >> 1) & 3
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        self.send(_packet(PUBACK, 0, packet_id))
+                    fake.publish(topic, body[offset:], retain=bool(flags & 1))
+                elif kind == SUBSCRIBE:
+                    packet_id, offset = body[:2], 2
+                    granted = bytearray()
+                    patterns = []
+                    while offset < len(body):
+                        pattern, offset = _string(body, offset)
+                        offset += 1
+                        patterns.append(pattern)
+                        granted.append(0)
+                    self.subscriptions.extend(patterns)
+                    self.send(_packet(SUBACK, 0, packet_id + bytes(granted)))
+                    for pattern in patterns:
+                        fake.send_retained(self, pattern)
+                elif kind == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        pattern, offset = _string(body, offset)
+                        if pattern in self.subscriptions:
+                            self.subscriptions.remove(pattern)
+                    self.send(_packet(UNSUBACK, 0, body[:2]))
+                elif kind == PINGREQ:
+                    self.send(_packet(PINGRESP, 0, b""))
+        except (OSError, IndexError):
+            pass
+        finally:
+            with fake.lock:
+                fake.clients.remove(self)
+
+
+class FakeMQTT:
+    """
+    In-memory MQTT broker
+
+    :param int port: the local port to listen on. Default is 0 for any free port
+    """
+
+    def __init__(self, port: int = 0):
+        self.clients = []
+        self.published = []
+        self.retained = {}
+        self.connects = 0
+        self.lock = threading.Lock()
+        ThreadingTCPServer.allow_reuse_address = True
+        self._server = ThreadingTCPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        """The port to connect to"""
+        return self._server.server_address[1]
+
+    def count(self, topic: str = None) -> int:
+        """Returns the number of messages published, optionally only to one topic"""
+        return len([msg for msg in self.published if topic is None or msg[0] == topic])
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        """Deliver a message to the subscribed clients, as if a client had published it"""
+        with self.lock:
+            self.published.append((topic, payload))
+            if retain:
+                self.retained[topic] = payload
+            clients = [client for client in self.clients
+                       if any(topic_matches(pattern, topic) for pattern in client.subscriptions)]
+        data = _packet(PUBLISH, 0, struct.pack(">H", len(topic)) + topic.encode() + payload)
+        for client in clients:
+            try:
+                client.send(data)
+            except OSError:
+                pass
+
+    def send_retained(self, client, pattern: str) -> None:
+        """Send the retained messages matching a new subscription"""
+        with self.lock:
+            retained = [(topic, payload) for topic, payload in self.retained.items()
+                        if topic_matches(pattern, topic)]
+        for topic, payload in retained:
+            client.send(_packet(PUBLISH, 1, struct.pack(">H", len(topic)) + topic.encode() + payload))
+
+    def drop_clients(self) -> None:
+        """Close every client connection, to test reconnecting"""
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.connection.shutdown(2)
+            except OSError:
+                pass
+
+    def start(self) -> None:
+        """Serve clients on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving clients"""
+        self.drop_clients()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    broker = FakeMQTT(int(sys.argv[1]) if len(sys.argv) > 1 else 1883)
+    print("Fake MQTT broker on port", broker.port)
+    broker._server.serve_forever()
@@ -0,0 +1,142 @@
+"""
+Poll the Adafruit IO appointment feed with change detection
+
+Most polls return the same appointment. The FeedPoller remembers the last feed
+item seen (its id and updated_at, or the raw value when those are missing) so an
+unchanged appointment is not parsed again and the display is not reconfigured.
+
+The feed value holds the next few appointments, packed or as JSON (see apptcodec.py).
+The ApptQueue moves on to the next appointment by
+itself when the current one ends, without waiting for a poll.
+"""
+import time
+from apptcodec import decode_appts
+
+
+def no_meeting_appt() -> dict:
+    """Returns the appointment data fields for nothing to display"""
+    return {'subject': '',
+            'responseStatus': 'No meeting',
+            'meeting_status': ' ',
+            # make up a start time
+            'start': time.mktime(time.localtime())}
+
+
+def item_key(item: dict):
+    """Returns the change detection key for an AIO feed data item
+    :param dict item: a data item as returned by get_io_data()
+    """
+    if item.get('id') is None:
+        # no metadata to go on so compare the content
+        return item['value']
+    return (item['id'], item.get('updated_at'))
+
+
+def appt_end(appt: dict):
+    """Returns the unix epoch end time of an appointment, None if the duration is not known
+    :param dict appt: the appointment
+    """
+    if not appt.get('duration'):
+        return None
+    return int(appt['start']) + appt['duration'] * 60
+
+
+class ApptQueue:
+    """The upcoming appointments, current one first"""
+
+    def __init__(self):
+        self.appts = []
+        self.current = no_meeting_appt()
+        self._next_change = float('inf')
+
+    def load(self, appts: list, now: int) -> None:
+        """Replace the queue with a new list of appointments
+        :param list appts: the appointments in start time order
+        :param int now: the current unix epoch time
+        """
+        self.appts = list(appts)
+        self._drop_ended(now)
+
+    def _drop_ended(self, now: int) -> None:
+        while self.appts:
+            end = appt_end(self.appts[0])
+            if end is None and len(self.appts) > 1:
+                # no duration, so the appointment lasts until the next one starts
+                end = int(self.appts[1]['start'])
+            if end is None or now < end:
+                break
+            self.appts.pop(0)
+
+        if self.appts:
+            self.current = self.appts[0]
+            end = appt_end(self.current)
+            if end is None and len(self.appts) > 1:
+                end = int(self.appts[1]['start'])
+            self._next_change = float('inf') if end is None else end
+        else:
+            self.current = no_meeting_appt()
+            self._next_change = float('inf')
+
+    def advance(self, now: int) -> bool:
+        """Move on to the next appointment if the current one is over. Returns True if the
+        current appointment changed
+        :param int now: the current unix epoch time
+        """
+        if now < self._next_change:
+            return False
+        self._drop_ended(now)
+        return True
+
+
+class FeedPoller:
+    """Fetch the feed and only parse it when the latest item changed
+
+    :param fetch: callable returning the list of feed data items, e.g. get_io_data
+    :param Telemetry telemetry: records the fetch and parse times. Default is None
+    """
+
+    def __init__(self, fetch, telemetry=None):
+        self._fetch = fetch
+        self._telemetry = telemetry
+        self._last_key = None
+        self.appts = None
+        self.polls = 0
+        self.changes = 0
+
+    def invalidate(self) -> None:
+        """Forget the last item so the next poll always parses the feed"""
+        self._last_key = None
+
+    def poll(self) -> bool:
+        """Fetch the feed and update appts. Returns True if the appointments changed.
+        Exceptions from the fetch are passed through and leave appts as they were.
+        """
+        start = self._telemetry.start() if self._telemetry else 0
+        ol_event_feed = self._fetch()
+        self.polls += 1
+        if self._telemetry:
+            self._telemetry.stop('fetch', start)
+            self._telemetry.count('polls')
+        return self.update(ol_event_feed)
+
+    def update(self, ol_event_feed: list) -> bool:
+        """Update appts from feed data items fetched or pushed some other way. Returns True if
+        the appointments changed
+        :param list ol_event_feed: the feed data items, latest first
+        """
+        # handle no data on AIO
+        key = item_key(ol_event_feed[0]) if len(ol_event_feed) > 0 else ''
+        if key == self._last_key:
+            return False
+
+        start = self._telemetry.start() if self._telemetry else 0
+        if len(ol_event_feed) == 0:
+            self.appts = []
+        else:
+            self.appts = decode_appts(ol_event_feed[0]['value'])
+        self._last_key = key
+        self.changes += 1
+        if self._telemetry:
+            self._telemetry.stop('parse', start)
+            self._telemetry.count('changes')
+        return True
@@ -0,0 +1,150 @@
+""" Compile a BDF font into a glyph subset file for the Matrix Portal.
+
+The Matrix Portal parses the BDF font text on the device, searching the file again each
+time a label needs glyphs it has not loaded yet. This build step keeps only the characters
+the display draws with the font and writes them as one fixed cell tile sheet that
+glyphfont.GlyphFont reads into a single bitmap at boot:
+
+    python fontsubset.py fonts/Minecraftia-Regular-8-mod.bdf
+
+writes fonts/Minecraftia-Regular-8-mod.glf next to the BDF. Copy both to the device, the
+BDF is still used for any character missing from the subset. Add characters with --chars
+or --text when the time or status rows show new text.
+
+File layout, big endian:
+
+    header  '>4sbbbbbbBBbbH'  magic, font bounding box w h x y, ascent, descent,
+                              cell width, cell height, cell x and y offset, glyph count
+    glyphs  '>HB' each        code point and advance, in tile order
+    sheet   cell height rows of count * cell width pixels, 1 bit per pixel, most
+            significant bit first, each row padded to a whole byte
+"""
+from typing import Dict, Iterable, Tuple
+import argparse
+import struct
+
+MAGIC = b"GLF1"
+HEADER = ">4sbbbbbbBBbbH"
+GLYPH = ">HB"
+
+# the text drawn with the font on the time and status rows, see countdown.py and code.py
+DISPLAY_TEXT = (
+    "0123456789 :ap",
+    "In progress", "No meetings", "> 1 day away", ">1 hr",
+    "Accepted", "Canceled", "Not Resp", "Organizer", "Tentative",
+    "Setting time...", "Feed error", "OutOfRetries",
+)
+
+
+def display_chars(extra: Iterable[str] = ()) -> str:
+    """Returns the sorted characters of DISPLAY_TEXT and any extra text"""
+    return "".join(sorted(set("".join(DISPLAY_TEXT) + "".join(extra))))
+
+
+def read_bdf(path: str) -> Tuple[dict, Dict[int, tuple]]:
+    """
+    Returns the font properties and the glyphs of a BDF file
+
+    The glyphs are a dict of code point to (advance, (width, height, x, y), rows), where
+    rows are the bitmap rows as ints with the leftmost pixel in the highest bit of width bits.
+
+    :param str path: the BDF file
+    """
+    props = {}
+    glyphs = {}
+    with open(path) as bdf:
+        lines = iter(bdf.read().splitlines())
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] in ("FONTBOUNDINGBOX", "FONT_ASCENT", "FONT_DESCENT"):
+            props[fields[0]] = tuple(int(field) for field in fields[1:])
+        elif fields[0] == "STARTCHAR":
+            code, advance, bbx = None, 0, (0, 0, 0, 0)
+            for line in lines:
+                fields = line.split()
+                if not fields:
+                    continue
+                if fields[0] == "ENCODING":
+                    code = int(fields[1])
+                elif fields[0] == "DWIDTH":
+                    advance = int(fields[1])
+                elif fields[0] == "BBX":
+                    bbx = tuple(int(field) for field in fields[1:5])
+                elif fields[0] == "BITMAP":
+                    width, height = bbx[0], bbx[1]
+                    padding = ((width + 7) // 8) * 8 - width
+                    rows = [int(next(lines), 16) >> padding for _ in range(height)]
+                    if code is not None and code >= 0:
+                        glyphs[code] = (advance, bbx, rows)
+                elif fields[0] == "ENDCHAR":
+                    break
+    return props, glyphs
+
+
+def compile_subset(props: dict, glyphs: Dict[int, tuple], chars: str) -> bytes:
+    """
+    Returns the glyph subset file for the characters of a font, see the module docs
+
+    :param dict props: the font properties from read_bdf()
+    :param dict glyphs: the glyphs from read_bdf()
+    :param str chars: the characters to keep, the ones the font does not have are skipped
+    """
+    codes = sorted(code for code in set(map(ord, chars)) if code in glyphs)
+    if not codes:
+        raise ValueError("none of the characters are in the font")
+    # one cell that holds every glyph at its offset, so the sheet has equal tiles
+    boxes = [glyphs[code][1] for code in codes]
+    left = min(box[2] for box in boxes)
+    bottom = min(box[3] for box in boxes)
+    cell_width = max(max(box[2] + box[0] for box in boxes) - left, 1)
+    top = max(box[3] + box[1] for box in boxes)
+    cell_height = max(top - bottom, 1)
+
+    sheet_width = cell_width * len(codes)
+    sheet = [0] * cell_height
+    for tile, code in enumerate(codes):
+        _, (width, height, x_off, y_off), rows = glyphs[code]
+        first_row = top - (y_off + height)
+        shift = sheet_width - tile * cell_width - (x_off - left) - width
+        for row, bits in enumerate(rows):
+            sheet[first_row + row] |= bits << shift
+
+    box = props.get("FONTBOUNDINGBOX", (cell_width, cell_height, left, bottom))
+    ascent = props.get("FONT_ASCENT", (top,))[0]
+    descent = props.get("FONT_DESCENT", (-bottom,))[0]
+    data = bytearray(struct.pack(HEADER, MAGIC, box[0], box[1], box[2], box[3], ascent, descent,
+                                 cell_width, cell_height, left, bottom, len(codes)))
+    for code in codes:
+        data += struct.pack(GLYPH, code, glyphs[code][0])
+    row_bytes = (sheet_width + 7) // 8
+    padding = row_bytes * 8 - sheet_width
+    for bits in sheet:
+        data += (bits << padding).to_bytes(row_bytes, "big")
+    return bytes(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile a BDF font into a glyph subset file")
+    parser.add_argument("bdf", help="the BDF font file")
+    parser.add_argument("-o", "--output", help="the subset file. Default is the BDF name with .glf")
+    parser.add_argument("--chars", default="", help="more characters to keep")
+    parser.add_argument("--text", action="append", default=[], help="more text to keep the characters of")
+    args = parser.parse_args()
+
+    props, glyphs = read_bdf(args.bdf)
+    chars = display_chars([args.chars] + args.text)
+    missing = [char for char in chars if ord(char) not in glyphs]
+    if missing:
+        print("Not in the font: {!r}".format("".join(missing)))
+    data = compile_subset(props, glyphs, chars)
+    output = args.output or args.bdf.rsplit(".", 1)[0] + ".glf"
+    with open(output, "wb") as glf:
+        glf.write(data)
+    print("{} glyphs of {}, {} bytes to {}".format(
+        struct.unpack_from(HEADER, data)[-1], len(glyphs), len(data), output))
+
+
+if __name__ == "__main__":
+    main()
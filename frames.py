@@ -0,0 +1,86 @@
+"""
+Display ready appointment frames
+
+Shared by the PC client and the Matrix Portal so both work out the status row and the
+count down bands the same way. In the "frames" FEED_ENCODING the PC client adds to each
+appointment:
+
+    status  the status_msg key for the status row and icon, see compute_status()
+    label   the start time label, see countdown.start_label()
+    edges   the unix epoch edges of the count down bands, see countdown.band_edges()
+
+and the display only looks these up instead of working them out. The Matrix Portal clock
+runs on local time with no time zone, so the PC works out the label with time.gmtime to
+match it.
+
+TEST_VECTORS pin the shared behaviour and self_check() runs them, on either side.
+"""
+import time
+from constants import time_display_colors
+from countdown import CountDown, band_edges, start_label
+
+
+def compute_status(resp_status: str, meeting_status: str) -> str:
+    """Compute the status row values for icon and message.
+    :param str resp_status: the reponse status value for the appointment
+    :param str meeting_status: the meeting status for the meeting
+    Returns the status line icon, text and text color as a dict
+    """
+    # if the meeting status is canceled, ignore the response status
+    if meeting_status.lower().find('canceled') > -1:
+        return('Canceled')
+    # elif resp_status == 'None':
+    #     return('XXXX')
+    else:
+        return(resp_status)
+
+
+def make_frame(appt: dict, localtime=time.gmtime) -> dict:
+    """Returns a copy of a feed entry with the status, label and edges added
+    :param dict appt: the feed entry with start, subject, responseStatus, meeting_status and duration
+    :param localtime: converts the epoch to the display's struct_time. Default is time.gmtime
+    """
+    frame = dict(appt)
+    frame['status'] = compute_status(appt['responseStatus'], appt['meeting_status'])
+    frame['label'] = start_label(int(appt['start']), localtime)
+    frame['edges'] = band_edges(appt['start'])
+    return frame
+
+
+# (start, responseStatus, meeting_status, now, status, count down text, band name)
+# with the label worked out in time.gmtime, like the Matrix Portal clock
+TEST_VECTORS = [
+    (1700000000, 'Accepted', 'Meeting', 1700000000 - 90000, 'Accepted', '> 1 day away', 'gt 1day'),
+    (1700000000, 'Accepted', 'Meeting', 1700000000 - 86400, 'Accepted', '10:13p  >1 hr', 'gt 1hr'),
+    (1700000000, 'Tentative', 'Meeting', 1700000000 - 3599, 'Tentative', '10:13p  59:59', 'normal'),
+    (1700000000, 'Organizer', 'None', 1700000000 - 600, 'Organizer', '10:13p  10:00', 'warning'),
+    (1700000000, 'Not Responded', 'Received', 1700000000 - 61, 'Not Responded', '10:13p  01:01', 'alert'),
+    (1700000000, 'Accepted', 'Canceled', 1700000000, 'Canceled', 'In progress', 'in progress'),
+    (1700000000, 'None', 'Received/Canceled', 1700000000 + 1800, 'Canceled', 'In progress', 'in progress'),
+    (1699920000, 'Accepted', 'Meeting', 1699920000 - 300, 'Accepted', '12:00a  05:00', 'alert'),
+    (1699963200, 'Accepted', 'Meeting', 1699963200 - 7200, 'Accepted', '12:00p  >1 hr', 'gt 1hr'),
+]
+
+
+def self_check(localtime=time.gmtime) -> list:
+    """Run TEST_VECTORS through make_frame() and CountDown. Returns a list of the failures,
+    empty when everything matches
+    :param localtime: converts the epoch to a struct_time. Default is time.gmtime
+    """
+    failures = []
+    for start, resp_status, meeting_status, now, status, text, name in TEST_VECTORS:
+        frame = make_frame({'start': start, 'subject': '', 'responseStatus': resp_status,
+                            'meeting_status': meeting_status, 'duration': 30}, localtime)
+        count_down = CountDown(start, resp_status, frame['label'], frame['edges'])
+        got = (frame['status'],) + count_down.update(now) + (count_down.band_name(now),)
+        want = (status, text, time_display_colors[name]['color'], name)
+        if got != want:
+            failures.append('{} {} at {}: {} != {}'.format(start, resp_status, now, got, want))
+    return failures
+
+
+if __name__ == '__main__':
+    problems = self_check()
+    for problem in problems:
+        print(problem)
+    print('{} of {} vectors failed'.format(len(problems), len(TEST_VECTORS)))
@@ -0,0 +1,85 @@
+"""
+Glyph subset font
+
+Loads a font compiled by fontsubset.py. All the glyphs are in one tile sheet that is read
+into a single bitmap at boot, instead of the BDF text being parsed on the device and
+searched again whenever a label needs a glyph that is not loaded yet. Characters that are
+not in the subset come from the BDF font, loaded the first time one is needed.
+"""
+import struct
+
+MAGIC = b'GLF1'
+HEADER = '>4sbbbbbbBBbbH'
+GLYPH = '>HB'
+
+
+class GlyphFont:
+    """A font for labels and the SubjectStrip, from a glyph subset file
+
+    :param str path: the glyph subset file written by fontsubset.py
+    :param str fallback: the BDF font for characters not in the subset. Default is None to show nothing for them
+    """
+
+    def __init__(self, path, fallback=None):
+        import displayio
+        from fontio import Glyph
+        self._fallback = fallback
+        self._fallback_font = None
+        with open(path, 'rb') as glf:
+            header = glf.read(struct.calcsize(HEADER))
+            (magic, box_w, box_h, box_x, box_y, self.ascent, self.descent,
+             cell_w, cell_h, cell_x, cell_y, count) = struct.unpack(HEADER, header)
+            if magic != MAGIC:
+                raise ValueError('Not a glyph subset file: {}'.format(path))
+            self._box = (box_w, box_h, box_x, box_y)
+            glyph_size = struct.calcsize(GLYPH)
+            table = glf.read(glyph_size * count)
+            self.bitmap = displayio.Bitmap(cell_w * count, cell_h, 2)
+            self._read_sheet(glf)
+        self._glyphs = {}
+        for tile in range(count):
+            code, advance = struct.unpack_from(GLYPH, table, tile * glyph_size)
+            self._glyphs[code] = Glyph(self.bitmap, tile, cell_w, cell_h, cell_x, cell_y, advance, 0)
+
+    def _read_sheet(self, glf):
+        """Read the 1 bit tile sheet into the bitmap"""
+        try:
+            import bitmaptools
+            bitmaptools.readinto(self.bitmap, glf, bits_per_pixel=1, element_size=1)
+            return
+        except ImportError:
+            pass
+        row_bytes = (self.bitmap.width + 7) // 8
+        for y in range(self.bitmap.height):
+            row = glf.read(row_bytes)
+            for x in range(self.bitmap.width):
+                if row[x >> 3] & (0x80 >> (x & 7)):
+                    self.bitmap[x, y] = 1
+
+    def get_bounding_box(self):
+        """Returns the font bounding box of the BDF font as (width, height, x offset, y offset)"""
+        return self._box
+
+    def load_glyphs(self, code_points):
+        """The subset glyphs are all loaded, load any others from the fallback font"""
+        if isinstance(code_points, int):
+            code_points = (code_points,)
+        elif isinstance(code_points, str):
+            code_points = [ord(char) for char in code_points]
+        missing = [code for code in code_points if code not in self._glyphs]
+        if not missing:
+            return
+        if self._fallback and self._fallback_font is None:
+            from adafruit_bitmap_font import bitmap_font
+            self._fallback_font = bitmap_font.load_font(self._fallback)
+        if self._fallback_font:
+            self._fallback_font.load_glyphs(missing)
+        for code in missing:
+            # remember the characters neither font has too
+            self._glyphs[code] = self._fallback_font.get_glyph(code) if self._fallback_font else None
+
+    def get_glyph(self, code_point):
+        """Returns the glyph for a code point, None if neither font has it"""
+        if code_point not in self._glyphs:
+            self.load_glyphs(code_point)
+        return self._glyphs.get(code_point)
@@ -0,0 +1,95 @@
+"""
+Status icon bitmap cache
+
+MatrixPortal.set_background() re-opens and decodes the BMP from flash every time it
+is called. The IconCache loads each status icon once into RAM, keeps a TileGrid for it
+and switches icons by swapping the TileGrid in a display group. Icons are loaded on first
+use and the least recently used icon is dropped when the memory budget is exceeded.
+"""
+import os
+
+
+def load_icon(path: str):
+    """Load a BMP into RAM and return it as a TileGrid. Falls back to an OnDiskBitmap
+    if adafruit_imageload can not decode the file
+    :param str path: the BMP file
+    """
+    import displayio
+    try:
+        import adafruit_imageload
+        bitmap, palette = adafruit_imageload.load(
+            path, bitmap=displayio.Bitmap, palette=displayio.Palette)
+    except (ImportError, NotImplementedError, ValueError, RuntimeError):
+        bitmap = displayio.OnDiskBitmap(path)
+        palette = bitmap.pixel_shader
+    return displayio.TileGrid(bitmap, pixel_shader=palette)
+
+
+class IconCache:
+    """Show one icon at a time from an in-memory cache
+
+    :param group: the display group to add the icon layer to, e.g. MatrixPortal.splash
+    :param tuple position: the x, y position of the icon. Default is (0, 21)
+    :param int budget: the approximate number of bytes of icons to keep. Default is 4096
+    :param loader: callable returning a TileGrid for a path. Default is load_icon
+    """
+
+    def __init__(self, group, position=(0, 21), budget=4096, loader=load_icon):
+        import displayio
+        self._layer = displayio.Group(x=position[0], y=position[1])
+        # insert under the text so the icon acts as a background like set_background
+        group.insert(0, self._layer)
+        self._budget = budget
+        self._loader = loader
+        # path -> (tile grid, size), with the paths kept least recently used first
+        self._cache = {}
+        self._order = []
+        self._used = 0
+        self.current = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _size(path: str) -> int:
+        # the BMP file size is close enough to the decoded size for small icons
+        return os.stat(path)[6]
+
+    def _get(self, path: str):
+        entry = self._cache.get(path)
+        if entry is None:
+            self.misses += 1
+            entry = (self._loader(path), self._size(path))
+            self._cache[path] = entry
+            self._used += entry[1]
+        else:
+            self.hits += 1
+            self._order.remove(path)
+        self._order.append(path)
+        # drop the least recently used icons, never the one asked for or being shown
+        for old_path in self._order[:-1]:
+            if self._used <= self._budget:
+                break
+            if old_path != self.current:
+                self._order.remove(old_path)
+                self._used -= self._cache.pop(old_path)[1]
+        return entry[0]
+
+    def preload(self, paths) -> None:
+        """Load icons ahead of use, within the budget
+        :param paths: iterable of BMP file names, empty names are skipped
+        """
+        for path in paths:
+            if path and path not in self._cache and self._used + self._size(path) <= self._budget:
+                self._get(path)
+
+    def show(self, path: str) -> None:
+        """Show the icon, or nothing for an empty path. Does nothing if it is already showing
+        :param str path: the BMP file
+        """
+        if path == self.current:
+            return
+        while len(self._layer):
+            self._layer.pop()
+        if path:
+            self._layer.append(self._get(path))
+        self.current = path
@@ -0,0 +1,437 @@
+""" iCalendar calendar source for the PC client.
+
+Reads the events from an .ics file or URL, e.g. a calendar subscription link or a CalDAV
+collection on a server that exports the collection as iCalendar, so the client also runs on
+machines without Outlook. Recurring events are expanded over the asked for window and the
+occurrences are kept in a start time sorted index, so finding the appointments after now
+is a bisect rather than a scan of the whole calendar.
+
+Supported: VEVENT with DTSTART, DTEND or DURATION, SUMMARY, STATUS, PRIORITY, ORGANIZER,
+ATTENDEE PARTSTAT, all-day events, TZID time zones known to zoneinfo, RRULE with FREQ
+DAILY/WEEKLY/MONTHLY/YEARLY, INTERVAL, COUNT, UNTIL, BYDAY, BYMONTHDAY and BYSETPOS, EXDATE and
+RECURRENCE-ID overrides. Other rule parts are logged and ignored.
+
+Like Outlook the start and end are local wall clock times marked as UTC, so the epoch sent
+to the display matches the display clock, which runs on local time.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+import calendar
+import datetime as dt
+import logging
+import os
+import time
+from calsource import CalendarSource, naive
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python before 3.9, TZID times are taken as local time
+    ZoneInfo = None
+
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+# https://datatracker.ietf.org/doc/html/rfc5545#section-3.2.12
+PARTSTAT_RESPONSE = {"ACCEPTED": "Accepted",
+                     "TENTATIVE": "Tentative",
+                     "DECLINED": "Declined",
+                     "NEEDS-ACTION": "Not Responded"}
+
+
+def unfold(text: str) -> List[str]:
+    """Returns the content lines of an iCalendar text with the folded lines joined"""
+    lines = []
+    for line in text.replace("\r\n", "\n").split("\n"):
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        elif line:
+            lines.append(line)
+    return lines
+
+
+def parse_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """Returns the name, parameters and value of a content line"""
+    # the value starts at the first colon outside a quoted parameter value
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            break
+    else:
+        return line.upper(), {}, ""
+    head, value = line[:index], line[index + 1:]
+    parts = head.split(";")
+    params = {}
+    for part in parts[1:]:
+        key, _, param = part.partition("=")
+        params[key.upper()] = param.strip('"')
+    return parts[0].upper(), params, value
+
+
+def unescape(value: str) -> str:
+    """Returns a TEXT value with the iCalendar escapes replaced"""
+    return value.replace("\\n", " ").replace("\\N", " ").replace("\\,", ",") \
+        .replace("\\;", ";").replace("\\\\", "\\")
+
+
+def parse_time(value: str, params: Dict[str, str]) -> Tuple[dt.datetime, Optional[dt.tzinfo], bool]:
+    """
+    Parse a DATE or DATE-TIME value
+
+    :return: tuple of the wall clock time in its time zone (naive), the time zone (None for
+        floating or local time) and True if it is a DATE
+    """
+    value = value.strip()
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return dt.datetime.strptime(value[:8], "%Y%m%d"), None, True
+    wall = dt.datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        return wall, dt.timezone.utc, False
+    tzid = params.get("TZID")
+    if tzid and ZoneInfo is not None:
+        try:
+            return wall, ZoneInfo(tzid), False
+        except (KeyError, ValueError, OSError):
+            # e.g. Windows zone names in Outlook exports
+            logging.debug("Unknown TZID %s, using local time", tzid)
+    return wall, None, False
+
+
+def to_local(wall: dt.datetime, tz: Optional[dt.tzinfo]) -> dt.datetime:
+    """Returns a wall clock time in a time zone as the local wall clock time (naive)"""
+    if tz is None:
+        return wall
+    return wall.replace(tzinfo=tz).astimezone().replace(tzinfo=None)
+
+
+def from_local(local: dt.datetime, tz: Optional[dt.tzinfo]) -> dt.datetime:
+    """Returns a local wall clock time (naive) as the wall clock time in a time zone"""
+    if tz is None:
+        return local
+    return local.astimezone(tz).replace(tzinfo=None)
+
+
+def parse_duration(value: str) -> dt.timedelta:
+    """Returns the timedelta for a DURATION value such as PT1H30M or P1D"""
+    sign = -1 if value.startswith("-") else 1
+    value = value.lstrip("+-").lstrip("P")
+    total = dt.timedelta()
+    number = ""
+    in_time = False
+    for char in value:
+        if char == "T":
+            in_time = True
+        elif char.isdigit():
+            number += char
+        else:
+            amount = int(number or 0)
+            number = ""
+            if char == "W":
+                total += dt.timedelta(weeks=amount)
+            elif char == "D":
+                total += dt.timedelta(days=amount)
+            elif char == "H" and in_time:
+                total += dt.timedelta(hours=amount)
+            elif char == "M" and in_time:
+                total += dt.timedelta(minutes=amount)
+            elif char == "S" and in_time:
+                total += dt.timedelta(seconds=amount)
+    return sign * total
+
+
+def parse_rrule(value: str) -> Dict[str, str]:
+    """Returns the parts of an RRULE value"""
+    rule = {}
+    for part in value.split(";"):
+        key, _, part_value = part.partition("=")
+        rule[key.upper()] = part_value.upper()
+    return rule
+
+
+def _byday(rule: Dict[str, str]) -> List[Tuple[int, int]]:
+    """Returns the BYDAY part as (ordinal, weekday) pairs, ordinal 0 for every such weekday"""
+    days = []
+    for day in filter(None, rule.get("BYDAY", "").split(",")):
+        ordinal = int(day[:-2]) if len(day) > 2 else 0
+        days.append((ordinal, WEEKDAYS.index(day[-2:])))
+    return days
+
+
+def _month_days(year: int, month: int, rule: Dict[str, str], start: dt.datetime) -> List[int]:
+    """Returns the days of a month a MONTHLY rule occurs on, sorted"""
+    last = calendar.monthrange(year, month)[1]
+    days = set()
+    if "BYMONTHDAY" in rule:
+        for day in rule["BYMONTHDAY"].split(","):
+            day = int(day)
+            day = day if day > 0 else last + 1 + day
+            if 1 <= day <= last:
+                days.add(day)
+    elif "BYDAY" in rule:
+        for ordinal, weekday in _byday(rule):
+            matches = [day for day in range(1, last + 1) if calendar.weekday(year, month, day) == weekday]
+            if ordinal == 0:
+                days.update(matches)
+            elif -len(matches) <= ordinal <= len(matches) and ordinal != 0:
+                days.add(matches[ordinal - 1 if ordinal > 0 else ordinal])
+    elif start.day <= last:
+        days.add(start.day)
+    return sorted(days)
+
+
+def expand_rrule(start: dt.datetime, rule: Dict[str, str], until: dt.datetime,
+                 tz: Optional[dt.tzinfo] = None, begin: Optional[dt.datetime] = None) -> List[dt.datetime]:
+    """
+    Returns the occurrence starts of a recurrence rule up to and including until
+
+    :param datetime start: DTSTART as a wall clock time in the event time zone (naive)
+    :param dict rule: the RRULE parts from parse_rrule()
+    :param datetime until: the end of the expansion, wall clock time in the event time zone
+    :param tzinfo tz: the event time zone, None for local time. Default is None
+    :param datetime begin: skip the periods before the one holding begin, wall clock time in
+        the event time zone, so a years old series is not expanded from its start. Ignored
+        with COUNT, which counts from the start. Default is None to expand from start
+    """
+    freq = rule.get("FREQ")
+    interval = int(rule.get("INTERVAL", 1))
+    count = int(rule["COUNT"]) if "COUNT" in rule else None
+    if "UNTIL" in rule:
+        rule_until, until_tz, until_date = parse_time(rule["UNTIL"], {})
+        if until_tz is not None:
+            # UTC, compare as wall clock time in the event time zone
+            rule_until = from_local(to_local(rule_until, until_tz), tz)
+        elif until_date:
+            rule_until += dt.timedelta(days=1, seconds=-1)
+        until = min(until, rule_until)
+    for part in rule:
+        if part not in ("FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "BYMONTHDAY", "BYSETPOS", "WKST"):
+            logging.debug("Ignoring RRULE part %s", part)
+    if freq not in ("DAILY", "WEEKLY", "MONTHLY", "YEARLY"):
+        logging.warning("Unsupported RRULE FREQ %s, using the first occurrence only", freq)
+        return [start]
+    positions = [int(pos) for pos in rule["BYSETPOS"].split(",")] if rule.get("BYSETPOS") else []
+
+    occurrences = []
+    period = 0
+    if begin is not None and count is None and begin > start:
+        if freq == "DAILY":
+            period = (begin - start).days // interval
+        elif freq == "WEEKLY":
+            period = (begin - start + dt.timedelta(days=start.weekday())).days // 7 // interval
+        else:
+            months = (begin.year - start.year) * 12 + begin.month - start.month
+            period = months // interval if freq == "MONTHLY" else months // 12 // interval
+        # one period early, in case begin and start differ across a time zone change
+        period = max(0, period - 1)
+    while True:
+        if freq == "DAILY":
+            period_start = start + dt.timedelta(days=period * interval)
+            candidates = [period_start]
+        elif freq == "WEEKLY":
+            period_start = start - dt.timedelta(days=start.weekday()) + dt.timedelta(weeks=period * interval)
+            weekdays = sorted(weekday for _, weekday in _byday(rule)) or [start.weekday()]
+            candidates = [period_start + dt.timedelta(days=weekday) for weekday in weekdays]
+        elif freq == "MONTHLY":
+            month_index = start.month - 1 + period * interval
+            year, month = start.year + month_index // 12, month_index % 12 + 1
+            period_start = start.replace(year=year, month=month, day=1)
+            candidates = [period_start.replace(day=day) for day in _month_days(year, month, rule, start)]
+        else:
+            year = start.year + period * interval
+            period_start = start.replace(year=year, month=1, day=1)
+            # no Feb 29 in the other years
+            candidates = [start.replace(year=year)] \
+                if start.day <= calendar.monthrange(year, start.month)[1] else []
+        if period_start > until:
+            return occurrences
+        if positions:
+            # e.g. BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1 for the last weekday of the month
+            candidates = sorted(set(candidates[pos - 1 if pos > 0 else pos] for pos in positions
+                                    if -len(candidates) <= pos <= len(candidates) and pos != 0))
+        for candidate in candidates:
+            if candidate < start:
+                continue
+            if candidate > until or (count is not None and len(occurrences) >= count):
+                return occurrences
+            occurrences.append(candidate)
+        period += 1
+
+
+def parse_events(text: str) -> List[dict]:
+    """Returns the VEVENTs of an iCalendar text as dicts of property name to a list of
+    (parameters, value) pairs
+    """
+    events = []
+    event = None
+    depth = 0
+    for line in unfold(text):
+        name, params, value = parse_line(line)
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and event is None:
+                event = {}
+                depth = 0
+            elif event is not None:
+                # e.g. a VALARM inside the event
+                depth += 1
+        elif name == "END":
+            if event is not None and depth:
+                depth -= 1
+            elif event is not None and value.upper() == "VEVENT":
+                events.append(event)
+                event = None
+        elif event is not None and not depth:
+            event.setdefault(name, []).append((params, value))
+    return events
+
+
+class ICSSource(CalendarSource):
+    """
+    Appointments from an iCalendar file or URL
+
+    A file is read again when it changes and a URL every rescan_secs. The recurring events
+    are expanded again only when asked for a window outside the expanded one.
+
+    :param str location: the .ics file path or http(s) URL
+    :param str owner: your address in the calendar, to find your response to meetings. Default is None
+    :param int rescan_secs: how often to fetch a URL again. Default is 300
+    :param dt.timedelta window_slack: how much further ahead than asked for to expand. Default is 1 day
+    :param auth: (username, password) for the URL. Default is None
+    """
+
+    def __init__(self, location: str, owner: str = None, rescan_secs: int = 300,
+                 window_slack: dt.timedelta = dt.timedelta(days=1), auth: Tuple[str, str] = None):
+        self.location = location
+        self.owner = owner.lower() if owner else None
+        self.rescan_secs = rescan_secs
+        self.window_slack = window_slack
+        self.auth = auth
+        self.scans = 0
+        self._events = []
+        self._version = None
+        self._fetched_at = 0
+        self._begin = None
+        self._end = None
+        # the start time sorted index of the occurrences
+        self._starts = []
+        self._items = []
+
+    def _is_url(self) -> bool:
+        return self.location.startswith(("http://", "https://"))
+
+    def _load(self) -> bool:
+        """Read the calendar if it changed. Returns True if it was read"""
+        if self._is_url():
+            if self._events and time.monotonic() - self._fetched_at < self.rescan_secs:
+                return False
+            import requests
+            response = requests.get(self.location, auth=self.auth, timeout=30)
+            response.raise_for_status()
+            text = response.text
+            version = hash(text)
+            self._fetched_at = time.monotonic()
+        else:
+            version = os.stat(self.location).st_mtime_ns
+            if version == self._version:
+                return False
+            with open(self.location, encoding="utf-8") as ics:
+                text = ics.read()
+        if version == self._version:
+            return False
+        self._events = parse_events(text)
+        self._version = version
+        logging.debug("Read %d events from %s", len(self._events), self.location)
+        return True
+
+    def _response(self, event: dict) -> Tuple[str, str]:
+        """Returns the response status and meeting status of an event"""
+        attendees = event.get("ATTENDEE", [])
+        cancelled = event.get("STATUS", [({}, "")])[0][1].upper() == "CANCELLED"
+        meeting_status = "Canceled" if cancelled else ("Meeting" if attendees else "None")
+        if not attendees:
+            return "None", meeting_status
+        organizer = event.get("ORGANIZER", [({}, "")])[0][1].lower()
+        if self.owner and organizer.endswith(self.owner):
+            return "Organizer", meeting_status
+        for params, value in attendees:
+            if self.owner and value.lower().endswith(self.owner):
+                return PARTSTAT_RESPONSE.get(params.get("PARTSTAT", "NEEDS-ACTION").upper(),
+                                             "Not Responded"), meeting_status
+        return "Accepted", meeting_status
+
+    def _fields(self, event: dict) -> dict:
+        """Returns the appointment fields that are the same for every occurrence of an event"""
+        priority = int(event.get("PRIORITY", [({}, "0")])[0][1] or 0)
+        resp_stat, meeting_status = self._response(event)
+        return {"subject": unescape(event.get("SUMMARY", [({}, "")])[0][1]),
+                "resp_stat": resp_stat,
+                "importance": "Normal" if priority in (0, 5) else ("High" if priority < 5 else "Low"),
+                "meeting_status": meeting_status}
+
+    def _expand(self, begin: dt.datetime, end: dt.datetime) -> None:
+        """Build the index of the occurrences starting from begin to end, local wall clock time"""
+        overrides = {}
+        for event in self._events:
+            if "RECURRENCE-ID" in event:
+                params, value = event["RECURRENCE-ID"][0]
+                wall, tz, _ = parse_time(value, params)
+                overrides[(event.get("UID", [({}, "")])[0][1], to_local(wall, tz))] = event
+
+        occurrences = []
+        for event in self._events:
+            if "DTSTART" not in event:
+                continue
+            params, value = event["DTSTART"][0]
+            wall, tz, all_day = parse_time(value, params)
+            if "DTEND" in event:
+                end_params, end_value = event["DTEND"][0]
+                end_wall, end_tz, _ = parse_time(end_value, end_params)
+                length = to_local(end_wall, end_tz) - to_local(wall, tz)
+            elif "DURATION" in event:
+                length = parse_duration(event["DURATION"][0][1])
+            else:
+                length = dt.timedelta(days=1) if all_day else dt.timedelta()
+
+            if "RRULE" not in event or "RECURRENCE-ID" in event:
+                starts = [to_local(wall, tz)]
+            else:
+                excluded = set()
+                for ex_params, ex_value in event.get("EXDATE", []):
+                    for one in ex_value.split(","):
+                        ex_wall, ex_tz, _ = parse_time(one, ex_params)
+                        excluded.add(to_local(ex_wall, ex_tz))
+                uid = event.get("UID", [({}, "")])[0][1]
+                # expand in the event time zone so the wall clock time holds across DST
+                starts = [start for start in
+                          (to_local(occurrence, tz) for occurrence in
+                           expand_rrule(wall, parse_rrule(event["RRULE"][0][1]), from_local(end, tz), tz,
+                                        from_local(begin, tz)))
+                          if start not in excluded and (uid, start) not in overrides]
+            fields = None
+            for start in starts:
+                if begin <= start <= end:
+                    fields = fields or self._fields(event)
+                    item = dict(fields)
+                    # local wall clock time marked as UTC like Outlook, see the module docstring
+                    item["start"] = start.replace(tzinfo=dt.timezone.utc)
+                    item["end"] = item["start"] + length
+                    item["duration"] = int(length.total_seconds() // 60)
+                    occurrences.append((start, item))
+
+        occurrences.sort(key=lambda occurrence: occurrence[0])
+        self._starts = [occurrence[0] for occurrence in occurrences]
+        self._items = [occurrence[1] for occurrence in occurrences]
+        self._begin = begin
+        self._end = end
+        self.scans += 1
+        logging.debug("Indexed %d occurrences from %s to %s", len(self._items), begin, end)
+
+    def get_items(self, begin: dt.datetime, end: dt.datetime) -> List[dict]:
+        if self._load() or self._begin is None or begin < self._begin or end > self._end:
+            self._expand(begin, end + self.window_slack)
+        items = []
+        for index in range(bisect_left(self._starts, begin), len(self._starts)):
+            if self._starts[index] > end:
+                break
+            if naive(self._items[index]["end"]) <= end:
+                items.append(self._items[index])
+        return items
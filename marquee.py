@@ -0,0 +1,131 @@
+"""
+Pre-rendered scrolling subject strip
+
+A scrolling MatrixPortal text box moves its label one pixel per scroll() call, and the
+label lays out every glyph as its own tile. The SubjectStrip draws the whole subject
+into one bitmap once per appointment and scrolls it by moving the TileGrid, so each
+frame is a position change and the cost does not depend on the subject length.
+"""
+
+
+def _copy_glyph(bitmap, glyph, x, y) -> None:
+    """Copy the set pixels of a font glyph into the strip bitmap at x, y"""
+    source = glyph.bitmap
+    # built in fonts keep all the glyphs in one tile sheet, BDF glyphs have their own bitmap
+    columns = source.width // glyph.width if glyph.width else 1
+    left = (glyph.tile_index % columns) * glyph.width
+    top = (glyph.tile_index // columns) * glyph.height
+    right = left + glyph.width
+    bottom = top + glyph.height
+    # CircuitPython 9 has bitmaptools.blit, 8 has Bitmap.blit with the older keyword
+    try:
+        import bitmaptools
+        blit = getattr(bitmaptools, 'blit', None)
+    except ImportError:
+        blit = None
+    try:
+        if blit:
+            blit(bitmap, source, x, y, x1=left, y1=top, x2=right, y2=bottom, skip_source_index=0)
+            return
+        if hasattr(bitmap, 'blit'):
+            bitmap.blit(x, y, source, x1=left, y1=top, x2=right, y2=bottom, skip_index=0)
+            return
+    except (AttributeError, TypeError):
+        pass
+    for row in range(glyph.height):
+        for col in range(glyph.width):
+            if source[left + col, top + row]:
+                bitmap[x + col, y + row] = 1
+
+
+class SubjectStrip:
+    """Scroll one line of text drawn once into a bitmap
+
+    :param group: the display group to add the strip to, e.g. MatrixPortal.splash
+    :param font: the font, e.g. terminalio.FONT or an adafruit_bitmap_font font
+    :param int color: the text color
+    :param tuple position: the x and vertical center y of the text, like MatrixPortal add_text. Default is (0, 4)
+    :param int width: the display width the strip scrolls in from. Default is 64
+    :param int max_width: the widest strip in pixels, to bound the bitmap heap use. Default is 2048
+    """
+
+    def __init__(self, group, font, color, position=(0, 4), width=64, max_width=2048):
+        import displayio
+        self._font = font
+        self._width = width
+        self._max_width = max_width
+        box = font.get_bounding_box()
+        self._height = box[1]
+        # BDF bounding boxes have a y offset below the baseline, the built in font does not
+        self._ascent = box[1] + (box[3] if len(box) > 3 else 0)
+        self._palette = displayio.Palette(2)
+        self._palette.make_transparent(0)
+        self._palette[1] = color
+        self._layer = displayio.Group(x=position[0], y=position[1] - self._height // 2)
+        group.append(self._layer)
+        self._grid = None
+        self.text = None
+        self.strip_width = 0
+
+    def _fit(self, text: str) -> tuple:
+        """Returns the text cut to the characters that fit in max_width, and its width"""
+        width = 0
+        for index, char in enumerate(text):
+            glyph = self._font.get_glyph(ord(char))
+            if glyph:
+                if width + glyph.shift_x > self._max_width:
+                    return text[:index], width
+                width += glyph.shift_x
+        return text, width
+
+    def set_text(self, text: str) -> None:
+        """Draw the text into a new strip and start scrolling it from the right edge.
+        Does nothing if the text is the same
+        :param str text: the text to scroll
+        """
+        if text == self.text:
+            return
+        import displayio
+        self.clear()
+        self.text = text
+        # drop characters past max_width rather than run out of heap
+        text, width = self._fit(text)
+        self.strip_width = max(1, width)
+        bitmap = displayio.Bitmap(self.strip_width, self._height, 2)
+        cursor = 0
+        for char in text:
+            glyph = self._font.get_glyph(ord(char))
+            if not glyph:
+                continue
+            left = cursor + glyph.dx
+            top = self._ascent - glyph.height - glyph.dy
+            # skip the odd glyph that overhangs the strip rather than clip it
+            if glyph.width and glyph.height and left >= 0 and top >= 0 \
+                    and left + glyph.width <= self.strip_width and top + glyph.height <= self._height:
+                _copy_glyph(bitmap, glyph, left, top)
+            cursor += glyph.shift_x
+        self._grid = displayio.TileGrid(bitmap, pixel_shader=self._palette, x=self._width)
+        self._layer.append(self._grid)
+
+    def set_color(self, color: int) -> None:
+        """Change the text color without drawing the strip again"""
+        self._palette[1] = color
+
+    def clear(self) -> None:
+        """Remove the strip and free its bitmap"""
+        if self._grid is not None:
+            self._layer.remove(self._grid)
+            self._grid = None
+        self.text = None
+        self.strip_width = 0
+
+    def scroll(self, step=1) -> None:
+        """Move the strip left, starting again from the right edge once it has gone by
+        :param int step: the pixels to move. Default is 1
+        """
+        if self._grid is None:
+            return
+        x = self._grid.x - step
+        if x < -self.strip_width:
+            x = self._width
+        self._grid.x = x
@@ -16,5 +16,14 @@ secrets = {
     'timezone'  : 'America/New_York',
     'aio_key' : "your AIO key",
     'aio_username' : "your AIO username",
-    'aio_feed' : 'appts'
+    'aio_feed' : 'appts',
+    # optional, only to point the PC client at a local fakeaio.py server
+    # 'aio_base_url' : 'http://localhost:8080'
+    # optional, to send several calendars to several displays from one PC client
+    # 'feeds' : [{'feed': 'appts', 'calendar': None},
+    #            {'feed': 'room-1', 'calendar': 'room1@example.com'}],
+    # optional, only to use a local MQTT broker such as fakemqtt.py or mosquitto
+    # 'mqtt_host' : 'localhost',
+    # 'mqtt_port' : 1883,
+    # 'mqtt_secure' : False,    # port 1883 without TLS, for the PC client and the Matrix Portal
 }
\ No newline at end of file
@@ -1,27 +1,72 @@
-""" Poll the local Outlook client and send the most recent appointment to an AIO feed.
+""" Poll the local Outlook client and send the next appointments to an AIO feed.
+
+Run with --daemon to keep the Outlook session open and poll every POLL_SECS instead of
+being restarted by send_appts.bat.
 
 Mostly based on https://pythoninoffice.com/get-outlook-calendar-meeting-data-using-python/
 
 Outlook AppointmentItem object COM reference:
     https://docs.microsoft.com/en-us/office/vba/api/outlook.appointmentitem
 """
-from json.decoder import JSONDecodeError
-from typing import Tuple
-from Adafruit_IO import Client, RequestError
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from Adafruit_IO import Client, Data, MQTTClient, MQTTError, RequestError, ThrottlingError
+import argparse
+import calendar
 import time
 import json
 import logging
-import win32com.client
-import win32com
+import os
+import threading
 from datetime import datetime
 import datetime as dt
+from apptcodec import pack_appts, decode_appts, FRAMES_VERSION
+from frames import make_frame
+from calsource import CalendarSource, OutlookSource, outlook_namespace
+from icssource import ICSSource
 
 MINUTES_BACK = 5
 DAYS_AHEAD = 2
+# seconds between calendar checks in daemon mode
+POLL_SECS = 60
+# number of upcoming appointments to publish so the display can move on by itself
+APPTS_AHEAD = 3
+# keep the feed value within the AIO data value size limit
+MAX_PAYLOAD_BYTES = 1024
+# "packed" for the compact encoding in apptcodec.py, "frames" to also send the status, start
+# time label and count down band edges worked out here (see frames.py), or "json" for displays
+# with older code
+FEED_ENCODING = "packed"
+
+# "rest" to send with the AIO HTTP API or "mqtt" to publish to the feed topic, so a display
+# subscribed over MQTT shows the change within a second. Falls back to "rest" if MQTT fails
+FEED_TRANSPORT = "rest"
+# seconds to wait for the MQTT broker to answer
+MQTT_TIMEOUT_SECS = 10
 
 UPLOAD = True  # prevent AIO posts during debugging
+# local record of the last value sent, so an unchanged appointment needs no AIO request
+STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "last_published.json")
+# delete the previously sent item after a send so the feed keeps a single item
+DELETE_OLD = True
+# send again after this many seconds even when nothing changed, in case the feed was edited
+REPUBLISH_SECS = 3600
 MULTIPLE_APPTS_STR = "*** Multiple ***"
 
+# AIO allows this many requests a minute per account, 30 on a free account and 60 with IO+.
+# Every receive, send and delete for all the feeds takes a token from one bucket, and waits
+# up to RATE_WAIT_SECS for one before putting the send off to the next check. The bucket
+# level is kept in STATE_FILE under RATE_STATE_KEY so the limit carries over between runs
+AIO_RATE_PER_MIN = 30
+RATE_WAIT_SECS = 20
+RATE_STATE_KEY = "_aio_rate"
+# hold a changed value until it has not changed for DEBOUNCE_SECS, so several edits in a row
+# go out as one send, but no longer than DEBOUNCE_MAX_SECS after the first change. A change
+# to a meeting starting within URGENT_SECS is sent straight away
+DEBOUNCE_SECS = 45
+DEBOUNCE_MAX_SECS = 300
+URGENT_SECS = 900
+
 # import Adafruit IO key and feed name
 try:
     from secrets import secrets
@@ -29,208 +74,569 @@ except ImportError:
     print('AIO secrets are kept in secrets.py, please add them there!')
     raise
 
-# --- Some helpful Outlook constants ---
-
-# https://docs.microsoft.com/en-us/office/vba/api/outlook.olresponsestatus
-ResponseStatus = ["None", "Organizer", "Tentative",
-                  "Accepted", "Declined", "Not Responded"]
-
-# https://docs.microsoft.com/en-us/office/vba/api/outlook.olimportance
-Importance = ["Low", "Normal", "High"]
-
-# https://docs.microsoft.com/en-us/office/vba/api/outlook.olmeetingstatus
-MeetingStatus = ["None", "Meeting", "", "Received", "", "Canceled", "", "Received/Canceled"]
+# the displays to send to, one AIO feed each. "calendar" is the owner of a shared Outlook
+# calendar, e.g. a room mailbox, or None for your own. Or "ics" is an iCalendar file or URL,
+# with "owner" your address in it and "username" and "password" for the URL if it needs them.
+# Set "feeds" in secrets.py to override
+FEEDS = secrets.get("feeds", [{"feed": secrets.get("feed_name", secrets.get("aio_feed")), "calendar": None}])
+# the most feeds to send to at the same time
+PUBLISH_THREADS = 4
 
 # --- Logging if you want ---
 logging.basicConfig(
     format='%(asctime)s %(funcName)s - %(message)s', level=logging.DEBUG)
 
 # Connect to the AIO Feed
-aio = Client(secrets["aio_username"], secrets["aio_key"])
+aio = Client(secrets["aio_username"], secrets["aio_key"],
+             base_url=secrets.get("aio_base_url", "https://io.adafruit.com"))
+# connected on first use when FEED_TRANSPORT is "mqtt"
+mqtt = None
+# the feeds are sent on several threads but share the one MQTT connection
+mqtt_lock = threading.Lock()
+
+
+class RateLimitError(Exception):
+    """No AIO request token came free within RATE_WAIT_SECS"""
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket refilled at a steady rate
+
+    :param float rate_per_min: the tokens added a minute
+    :param int capacity: the most tokens kept, the largest burst. Default is None for rate_per_min
+    """
+
+    def __init__(self, rate_per_min: float, capacity: int = None):
+        self.rate = rate_per_min / 60
+        self.capacity = capacity or rate_per_min
+        self.tokens = float(self.capacity)
+        # takes and drains, to tell whether the level needs saving
+        self.changes = 0
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._at) * self.rate)
+        self._at = now
+
+    def take(self, timeout: float) -> bool:
+        """
+        Take a token, waiting for one to come free
+
+        :param float timeout: the longest to wait in seconds
+        :return: True if a token was taken, False if none came free in time
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.changes += 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def drain(self, secs: float) -> None:
+        """Empty the bucket so no token comes free for secs, e.g. after AIO throttled a request"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, -secs * self.rate)
+            self.changes += 1
+
+    def save(self) -> dict:
+        """
+        Returns the bucket level to keep for the next run. A drained bucket has a level below
+        zero, so the time until the next token is kept too
+
+        :return: dict with the tokens and the epoch time they were counted at
+        """
+        with self._lock:
+            self._refill()
+            return {"tokens": round(self.tokens, 3), "at": time.time()}
+
+    def restore(self, saved: dict) -> None:
+        """
+        Carry on from a level returned by save(), refilled for the time since. The bucket keeps
+        its own level if that is lower, e.g. in --daemon mode after a check that was not saved
+
+        :param dict saved: the saved level, None to keep the bucket as it is
+        """
+        if not saved:
+            return
+        with self._lock:
+            self._refill()
+            elapsed = max(0.0, time.time() - saved["at"])
+            self.tokens = min(self.tokens, saved["tokens"] + elapsed * self.rate)
+
+
+# shared by all the AIO requests of every feed
+aio_bucket = TokenBucket(AIO_RATE_PER_MIN)
+# changes merged into a later value, dropped because the calendar went back to the value
+# already sent, and sends put off by the rate limit, since the script started
+queue_stats = {"merged": 0, "dropped": 0, "deferred": 0}
+
+
+def aio_request(func, *args):
+    """
+    Make an AIO request once the rate limit allows
+
+    :param func: the Client method or publish function to call
+    :return: what func returns
+    :raise RateLimitError: if no token came free within RATE_WAIT_SECS
+    """
+    if not aio_bucket.take(RATE_WAIT_SECS):
+        raise RateLimitError("no AIO request allowed within {} seconds".format(RATE_WAIT_SECS))
+    try:
+        return func(*args)
+    except ThrottlingError:
+        # another client on the account is using the requests up, stop for a minute
+        aio_bucket.drain(60)
+        raise
 
 
-def get_outlook_appts(begin: datetime, end: datetime) -> Tuple[str, int, str, str, int]:
+def appt_entry(items: list) -> dict:
     """
-    Retrieve the next Outlook appointment details
+    Build the feed entry for the appointments starting at the same time
+
+    If there is more than one appointment, the subject is set to MULTIPLE_APPTS_STR and the
+    duration is the longest of them so the display knows when they are all over.
 
-    Return the next Outlook appointment subject, start time, and response status. The start time is
-    Unix Epoch local time to help calculations. If there are more than one appointments scheduled at the start time,
-    the subject is set to MULTIPLE_APPTS_STR
+    :param list items: the appointment dicts from a CalendarSource with the same start
+    :return: dict with start, subject, responseStatus, meeting_status and duration
+    """
+    if len(items) > 1:
+        return {"start": int(items[0]["start"].timestamp()),
+                "subject": MULTIPLE_APPTS_STR,
+                "responseStatus": "None",
+                "meeting_status": "None",
+                "duration": max(item["duration"] for item in items)}
+    return {"start": int(items[0]["start"].timestamp()),
+            # strip the subject in case a subject has trailing spaces
+            "subject": items[0]["subject"].strip(),
+            "responseStatus": items[0]["resp_stat"],
+            "meeting_status": items[0]["meeting_status"],
+            "duration": items[0]["duration"]}
+
+
+def get_appt_list(source: CalendarSource, begin: datetime, end: datetime,
+                  max_appts: int = APPTS_AHEAD) -> List[dict]:
+    """
+    Retrieve the next appointments from a calendar source
 
+    Return up to max_appts feed entries in start time order. Appointments with the same start time
+    are combined into one entry, see appt_entry().
+
+    :param CalendarSource source: where to get the appointments, e.g. OutlookSource
     :param datetime begin: the filter for appointments with start times after this time
     :param datetime end: the filter appointments with start times no later than this time
-    :return: tuple of subject, start time, response status, meeting status, duration
+    :param int max_appts: the maximum number of entries to return
+    :return: list of dicts with start, subject, responseStatus, meeting_status and duration
     """
     logging.debug("begin: %s end: %s", begin, end)
 
-    outlook = win32com.client.Dispatch(
-        'Outlook.Application').GetNamespace('MAPI')
-    calendar = outlook.getDefaultFolder(9).Items
-    calendar.IncludeRecurrences = True
-    calendar.Sort('[Start]')
-
-    # https://docs.microsoft.com/en-us/office/vba/api/outlook.items.restrict
-    # important to add the AM/PM format code %p otherwise the API seems to not handle the time right
-    # https://strftime.org/
-    restriction = "[Start] >= '" + begin.strftime('%m/%d/%Y %I:%M %p') + "' AND [END] <= '" + end.strftime(
-        '%m/%d/%Y %I:%M %p') + "'"
-    logging.debug("Initial restriction: %s", restriction)
-    calendar = calendar.Restrict(restriction)
-
-    # for debugging
-    for item in calendar:
-        logging.debug("Appt--> %s|%s|%s|%s|%s", item.start, item.subject,
-                      ResponseStatus[item.responseStatus], Importance[item.Importance], MeetingStatus[item.MeetingStatus])
-
-    # check to see if there are any appointments returned
+    # group the appointments by start time, the items are sorted by start
+    groups = []
+    for cal_item in source.get_items(begin, end):
+        if groups and groups[-1][0]["start"] == cal_item["start"]:
+            groups[-1].append(cal_item)
+        elif len(groups) < max_appts:
+            groups.append([cal_item])
+        else:
+            break
+    logging.debug("Appts list size %d", len(groups))
+
+    return [appt_entry(group) for group in groups]
+
+
+def encode_appts(appts: List[dict]) -> str:
+    """
+    Build the feed value for a list of appointments
+
+    The value uses the FEED_ENCODING format. Statuses the packed format does not know about fall
+    back to compact JSON. Appointments are dropped from the end of the list until the value fits
+    in MAX_PAYLOAD_BYTES.
+
+    :param list appts: the feed entries from get_appt_list()
+    :return: the string to send to AIO
+    """
+    if FEED_ENCODING == "frames":
+        appts = [make_frame(appt) for appt in appts]
+    else:
+        appts = list(appts)
+    while True:
+        upload = None
+        if FEED_ENCODING in ("packed", "frames"):
+            try:
+                upload = pack_appts(appts) if FEED_ENCODING == "packed" else pack_appts(appts, FRAMES_VERSION)
+            except ValueError as e:
+                logging.warning("Can not pack appointments, sending JSON: %s", e)
+        if upload is None:
+            upload = json.dumps({"appts": appts}, separators=(',', ':'))
+        if len(upload.encode()) <= MAX_PAYLOAD_BYTES or len(appts) <= 1:
+            return upload
+        appts.pop()
+
+
+def load_published() -> dict:
+    """
+    Read the record of the last value sent to each feed
+
+    :return: dict of feed key to a dict with value, id and sent_at, and the AIO rate limit
+        bucket level under RATE_STATE_KEY. Empty if there is no record
+    """
     try:
-        # to detect multiple appointements at the same time, filter again
-        # assume calendar[0] has the earliest start time to filter on
-        restriction = "[Start] = '" + \
-            calendar[0].start.strftime('%m/%d/%Y %I:%M %p') + "'"
-        logging.debug("Multiple appts restriction: %s", restriction)
-        calendar = calendar.Restrict(restriction)
-    except IndexError:
-        logging.debug("No appointments returned")
-
-
-    # It appears that you need to load calendar appointments COM Object into a list since the 
-    # calendar object does not seem to behave like a real list
-    # load what's left into a list
-    cal_items = []
-    for item in calendar:
-        cal_items.append({
-            "start":item.start, 
-            "subject": item.subject, 
-            "resp_stat":ResponseStatus[item.responseStatus],
-            "importance":Importance[item.Importance],
-            "meeting_status":MeetingStatus[item.MeetingStatus],
-            "duration": item.duration})
-    appt_count = len(cal_items)
-    logging.debug("Appts list size %d", appt_count)
-
-    if appt_count > 1:
-        subject = MULTIPLE_APPTS_STR
-        start = int(cal_items[0]["start"].timestamp())
-        response_status = "None"
-        meeting_status = "None"
-        duration = None
-    elif appt_count == 1:
-        subject = cal_items[0]["subject"]
-        start = int(cal_items[0]["start"].timestamp())
-        response_status = cal_items[0]["resp_stat"]
-        meeting_status = cal_items[0]["meeting_status"]
-        duration = cal_items[0]["duration"]
-    else:  # handle nothing in Outlook to return at this point
-        subject = ""
-        # make up a valid time but with a value that won't be sent to AIO every time
-        no_meeting_time = time.localtime()
-        start = int(time.mktime((no_meeting_time.tm_year,
-                                no_meeting_time.tm_mon,
-                                no_meeting_time.tm_mday,
-                                0,0,0,
-                                no_meeting_time.tm_wday,
-                                no_meeting_time.tm_yday,
-                                no_meeting_time.tm_isdst)))
-        response_status = "No meeting"
-        meeting_status = ""
-        duration = 0
-
-    return subject, start, response_status, meeting_status, duration
-
-
-def send_to_aio(key: str, data: str) -> None:
-    """Send data to AIO. Will not send anything if UPLOAD is not True
+        with open(STATE_FILE) as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_published(state: dict) -> None:
+    """
+    Write the record of the last value sent to each feed
+
+    :param dict state: dict of feed key to a dict with value, id and sent_at, see load_published()
+    """
+    with open(STATE_FILE, "w") as state_file:
+        json.dump(state, state_file)
+
+
+def mqtt_loop(timeout_sec: float) -> None:
+    """Process the MQTT traffic. A lost connection is left for mqtt_client() to reconnect
+    :param float timeout_sec: how long to wait for traffic
+    """
+    try:
+        mqtt.loop(timeout_sec=timeout_sec)
+    except MQTTError as e:
+        logging.warning("MQTT connection lost: %s", e)
+
+
+def mqtt_client() -> MQTTClient:
+    """
+    Returns the MQTT client, connecting it if it is not connected. The broker is AIO unless
+    secrets has mqtt_host, with mqtt_secure False for a local broker without TLS on port 1883
+
+    :raise ConnectionError: if the broker does not answer within MQTT_TIMEOUT_SECS
+    """
+    global mqtt
+    if mqtt is None:
+        mqtt = MQTTClient(secrets["aio_username"], secrets["aio_key"],
+                          service_host=secrets.get("mqtt_host", "io.adafruit.com"),
+                          secure=secrets.get("mqtt_secure", True))
+    else:
+        # pick up a dropped connection
+        mqtt_loop(0)
+    if not mqtt.is_connected():
+        mqtt.connect()
+        deadline = time.monotonic() + MQTT_TIMEOUT_SECS
+        while not mqtt.is_connected():
+            if time.monotonic() > deadline:
+                raise ConnectionError("MQTT broker did not answer")
+            mqtt_loop(0.1)
+    return mqtt
+
+
+def publish_to_mqtt(key: str, data: str) -> None:
+    """Publish data to the feed topic
     :param str key: the feed name
     :param str data: the data to send
     """
-    if UPLOAD:
-        # need to send as JSON
-        aio.send_data(key, data)
+    with mqtt_lock:
+        client = mqtt_client()
+        client.publish(key, data)
+        # there is no background thread, so write the message out now
+        mqtt_loop(0.1)
 
-        data = aio.receive(key)
-        logging.debug("Latest value from OL_Event: %s", data.value)
-        logging.debug(
-            "Recieved value from OL_Event feed has the following metadata: %s", data)
-    else:
-        logging.debug("*** DEBUG MODE: AIO send SKIPPED ***")
 
+def idle(secs: float) -> None:
+    """Wait, keeping the MQTT connection alive if there is one
+    :param float secs: how long to wait
+    """
+    if mqtt is None or not mqtt.is_connected():
+        time.sleep(secs)
+        return
+    deadline = time.monotonic() + secs
+    while time.monotonic() < deadline:
+        with mqtt_lock:
+            mqtt_loop(min(1.0, max(0.0, deadline - time.monotonic())))
 
-def main():
-    # get the Outlook calendar entries from now back 30 minutes and one day ahead
-    now = dt.datetime.now()
 
-    logging.debug("formatted from: %s", datetime.strftime(
-        now - dt.timedelta(minutes=MINUTES_BACK), "%Y-%m-%d %I:%M %p"))
+def send_to_aio(key: str, data: str):
+    """Send data to AIO over FEED_TRANSPORT. Will not send anything if UPLOAD is not True
+    :param str key: the feed name
+    :param str data: the data to send
+    :return: the Data sent, or None if the send was skipped. An MQTT publish returns no item
+        id, publish_feed() looks the item up when it is to be replaced
+    """
+    if UPLOAD and FEED_TRANSPORT == "mqtt":
+        try:
+            aio_request(publish_to_mqtt, key, data)
+            logging.debug("Published value to the %s feed topic", key)
+            return Data(value=data)
+        except (OSError, MQTTError) as e:
+            logging.warning("MQTT publish failed, sending over HTTP: %s", e)
+    if UPLOAD:
+        sent = aio_request(aio.send_data, key, data)
+        logging.debug(
+            "Sent value to OL_Event feed has the following metadata: %s", sent)
+        return sent
+    logging.debug("*** DEBUG MODE: AIO send SKIPPED ***")
+    return None
+
 
-    logging.debug("formatted to: %s", datetime.strftime(
-        now + dt.timedelta(days=DAYS_AHEAD), "%Y-%m-%d %I:%M %p"))
+def delete_items(feed_key: str, item_ids: List[str]) -> List[str]:
+    """
+    Delete old items from a feed
 
-    # get the next appointment
-    subject, start_time, resp_stat, meeting_status, duration = get_outlook_appts(\
-        dt.datetime.now() - dt.timedelta(minutes=MINUTES_BACK), \
-        dt.datetime.now() + dt.timedelta(days=DAYS_AHEAD))
+    :param str feed_key: the feed
+    :param list item_ids: the ids of the items to delete
+    :return: the ids still to delete, after the rate limit or an error stopped the deletes
+    """
+    for index, item_id in enumerate(item_ids):
+        try:
+            aio_request(aio.delete, feed_key, item_id)
+        except RequestError as e:
+            # already gone, e.g. deleted by hand
+            logging.warning("Could not delete old item %s: %s", item_id, e)
+        except Exception as e:
+            logging.warning("Old items %s not deleted, trying again at the next check: %s",
+                            item_ids[index:], e)
+            return item_ids[index:]
+    return []
+
+
+def publish_feed(feed_key: str, appts: List[dict], upload: str, last_sent: dict):
+    """
+    Send a feed value to AIO if it changed
+
+    Old items a delete did not get to are kept in the record as "stale" and deleted at a
+    later check.
+
+    :param str feed_key: the feed to send to
+    :param list appts: the feed entries in the value, for the log
+    :param str upload: the feed value
+    :param dict last_sent: the STATE_FILE record for the feed, None if there is none
+    :return: the new STATE_FILE record for the feed, or None if nothing changed
+    :raise RateLimitError: if the send was put off because no AIO request was allowed in time
+    :raise ThrottlingError: if AIO refused the send because the account is throttled
+    """
+    stale = list(last_sent.get("stale", [])) if last_sent else []
+    # compare the decoded lists so a change of FEED_ENCODING alone is not a change
+    if last_sent and decode_appts(last_sent["value"]) == decode_appts(upload) \
+            and time.time() - last_sent["sent_at"] < REPUBLISH_SECS:
+        if stale and DELETE_OLD and UPLOAD:
+            logging.debug("%s unchanged, deleting the old items %s", feed_key, stale)
+            record = {key: value for key, value in last_sent.items() if key != "stale"}
+            stale = delete_items(feed_key, stale)
+            if stale:
+                record["stale"] = stale
+            return record
+        logging.debug("SKIPPING SEND to %s: latest and current are the same", feed_key)
+        return None
+
+    logging.debug("different appointment processing for %s", feed_key)
+    try:
+        if DELETE_OLD and UPLOAD and not (last_sent and last_sent.get("id")):
+            # no local record yet, or the last value was published over MQTT which gives no
+            # item id, so look up the item to replace
+            try:
+                old = aio_request(aio.receive, feed_key)
+                last_sent = dict(last_sent or {"value": old.value, "sent_at": 0}, id=old.id)
+            except RequestError:
+                logging.warning("No entries in AdafruitIO feed %s", feed_key)
+
+        sent = send_to_aio(feed_key, upload)
+        if sent is None:
+            return None
+        logging.info("sent %s to %s", ", ".join(appt["subject"] for appt in appts), feed_key)
+    except RequestError as re:
+        logging.error("%s: %s", feed_key, re)
+        return None
+
+    record = {"value": upload, "id": sent.id, "sent_at": time.time()}
+    if DELETE_OLD and last_sent and last_sent.get("id"):
+        stale.append(last_sent["id"])
+    stale = delete_items(feed_key, stale) if DELETE_OLD else []
+    if stale:
+        record["stale"] = stale
+    return record
+
+
+def debounce(feed_key: str, appts: List[dict], upload: str, record: dict, now: float) -> bool:
+    """
+    Hold a changed feed value back until it settles, see DEBOUNCE_SECS
+
+    The value waiting to be sent is kept in the feed's STATE_FILE record as "pending", with
+    when it first and last changed and how many changes were merged into it, so the debounce
+    also works when the script is restarted for every check.
+
+    :param str feed_key: the feed, for the log
+    :param list appts: the feed entries in the value
+    :param str upload: the feed value
+    :param dict record: the STATE_FILE record for the feed, updated in place. None if there is none
+    :param float now: the current time, the same local epoch as the appointment starts
+    :return: True if the value should go to publish_feed() now
+    """
+    if record is None:
+        # nothing sent yet to compare with
+        return True
+    pending = record.get("pending")
+    if decode_appts(record["value"]) == decode_appts(upload):
+        if pending:
+            logging.info("%s: %d changes dropped, the calendar went back to the sent value",
+                         feed_key, pending["merged"] + 1)
+            queue_stats["dropped"] += pending["merged"] + 1
+            del record["pending"]
+        # publish_feed() decides whether it is time to send it again
+        return True
+    if pending is None:
+        record["pending"] = {"value": upload, "first_at": now, "changed_at": now, "merged": 0}
+    elif pending["value"] != upload:
+        pending.update(value=upload, changed_at=now, merged=pending["merged"] + 1)
+        queue_stats["merged"] += 1
+    pending = record["pending"]
+    if appts and appts[0]["start"] - now < URGENT_SECS:
+        return True
+    return now - pending["changed_at"] >= DEBOUNCE_SECS or now - pending["first_at"] >= DEBOUNCE_MAX_SECS
+
+
+def main(sources=None):
+    """
+    Send the next appointments to each AIO feed whose appointments changed
 
-    # strip the subject in case a subject has trailing spaces
-    curr_latest = {"start": start_time,
-                   "subject": subject.strip(), 
-                   "responseStatus": resp_stat,
-                   "meeting_status" : meeting_status,
-                   "duration" : duration}
-    upload = json.dumps(curr_latest)
-    logging.debug("JSON to AIO: %s", upload)
+    What was last sent is kept in STATE_FILE per feed, so an unchanged appointment list costs no
+    AIO requests and a changed one costs one send, plus one delete of the old item if DELETE_OLD.
+    The calendars are read one after the other, since the Outlook COM objects belong to this
+    thread, and the changed feeds are then sent in parallel on up to PUBLISH_THREADS threads.
+    A changed value waits in the publish queue until it settles, see debounce(), and every AIO
+    request waits for the shared AIO_RATE_PER_MIN rate limit.
 
-    logging.debug("Sending to AIO")
-    # Create an instance of the REST client
+    :param sources: dict of feed key to CalendarSource, or a single CalendarSource for the
+        first of the FEEDS. Default is None to open Outlook for the FEEDS
+    """
+    if sources is None:
+        sources = calendar_sources(FEEDS)
+    elif isinstance(sources, CalendarSource):
+        sources = {FEEDS[0]["feed"]: sources}
 
-    # Set up the AIO feed
-    try:
-        aio_appt_feed = aio.feeds(secrets["feed_name"])
-    except RequestError as re:  # Doesn't exist, print error message
-        logging.error(re)
-        exit()
+    # get the Outlook calendar entries from now back MINUTES_BACK and DAYS_AHEAD ahead
+    now = dt.datetime.now()
+    begin = now - dt.timedelta(minutes=MINUTES_BACK)
+    end = now + dt.timedelta(days=DAYS_AHEAD)
+    logging.debug("formatted from: %s", datetime.strftime(begin, "%Y-%m-%d %I:%M %p"))
+    logging.debug("formatted to: %s", datetime.strftime(end, "%Y-%m-%d %I:%M %p"))
+
+    # get the next appointments, once per calendar when feeds share a calendar
+    feeds = {}
+    scanned = {}
+    for feed_key, source in sources.items():
+        if id(source) not in scanned:
+            appts = get_appt_list(source, begin, end)
+            scanned[id(source)] = (appts, encode_appts(appts))
+        feeds[feed_key] = scanned[id(source)]
+        logging.debug("Value to AIO %s: %s", feed_key, feeds[feed_key][1])
+
+    state = load_published()
+    before = json.dumps(state, sort_keys=True)
+    # the requests of the last runs still count against the rate limit
+    aio_bucket.restore(state.get(RATE_STATE_KEY))
+    changes = aio_bucket.changes
+    # the appointment starts are local time marked as UTC, see appt_entry()
+    local_now = calendar.timegm(time.localtime())
+    ready = {feed_key: feed for feed_key, feed in feeds.items()
+             if debounce(feed_key, feed[0], feed[1], state.get(feed_key), local_now)}
+    with ThreadPoolExecutor(max_workers=max(1, min(PUBLISH_THREADS, len(ready) or 1))) as pool:
+        sends = {feed_key: pool.submit(publish_feed, feed_key, appts, upload, state.get(feed_key))
+                 for feed_key, (appts, upload) in ready.items()}
+    sent = 0
+    for feed_key, send in sends.items():
+        try:
+            record = send.result()
+        except (RateLimitError, ThrottlingError) as e:
+            logging.warning("%s send put off to the next check: %s", feed_key, e)
+            queue_stats["deferred"] += 1
+            continue
+        except Exception:
+            # e.g. the connection dropped, still keep the records of the feeds that were sent
+            logging.exception("%s send failed", feed_key)
+            continue
+        if record:
+            if record["sent_at"] != state.get(feed_key, {}).get("sent_at"):
+                sent += 1
+            state[feed_key] = record
+    waiting = [feed_key for feed_key in feeds if state.get(feed_key, {}).get("pending")]
+    if sent or waiting:
+        logging.info("Publish queue: %d sent, %d waiting %s, %d merged, %d dropped, %d put off by the "
+                     "rate limit since start, %.1f AIO requests free", sent, len(waiting), waiting,
+                     queue_stats["merged"], queue_stats["dropped"], queue_stats["deferred"],
+                     max(aio_bucket.tokens, 0))
+    if aio_bucket.changes != changes:
+        state[RATE_STATE_KEY] = aio_bucket.save()
+    if json.dumps(state, sort_keys=True) != before:
+        save_published(state)
+
+
+def calendar_sources(feeds: List[dict]) -> dict:
+    """
+    Open the calendars for the feeds, one source per calendar. The Outlook calendars share one
+    Outlook session, which is only opened if a feed needs it
 
-    # get the latest value
-    try:
-        aio_latest = aio.receive(secrets["feed_name"])
-        logging.debug(
-            "Recieved value from OL_Event feed has the following metadata: %s", aio_latest)
-        # Tip: to replace double quotes as single to load as a JSON into a dict
-        # value_dict = json.loads(latest.value.replace("'", '"'))
-
-        aio_latest_dict = json.loads(aio_latest.value)
-        logging.debug("The value parameter as a dict: is %s", aio_latest_dict)
-        logging.debug("display start is %s", curr_latest["start"])
-        logging.debug("returned start is %s", aio_latest_dict["start"])
-        logging.debug("display subject is %s", curr_latest["subject"])
-        logging.debug("returned subject is %s", aio_latest_dict["subject"])
-        logging.debug("id for AIO item is %s", aio_latest.id)
-
-        if aio_latest_dict["start"] == curr_latest["start"] \
-            and aio_latest_dict["subject"] == curr_latest["subject"] \
-            and aio_latest_dict["responseStatus"] == curr_latest["responseStatus"]:
-            logging.debug("SKIPPING SEND: latest and current are the same")
+    :param list feeds: dicts with the feed key and the calendar owner or ics location, see FEEDS
+    :return: dict of feed key to CalendarSource
+    """
+    namespace = None
+    calendars = {}
+    sources = {}
+    for feed in feeds:
+        if feed.get("ics"):
+            source_spec = ("ics", feed["ics"])
+            if source_spec not in calendars:
+                auth = (feed["username"], feed["password"]) if feed.get("username") else None
+                calendars[source_spec] = ICSSource(feed["ics"], owner=feed.get("owner"), auth=auth)
         else:
-            logging.debug("different appointment processing")
+            source_spec = ("outlook", feed.get("calendar"))
+            if source_spec not in calendars:
+                namespace = namespace or outlook_namespace()
+                calendars[source_spec] = OutlookSource(owner=feed.get("calendar"), namespace=namespace)
+        sources[feed["feed"]] = calendars[source_spec]
+    return sources
 
-            resp = aio.delete(aio_appt_feed.key, aio_latest.id)
-            logging.debug("delete response %s", resp)
 
-            # need to send as JSON
-            logging.info("sent %s", curr_latest["subject"])
-            send_to_aio(aio_appt_feed.key, upload)
+def run_daemon(sources) -> None:
+    """
+    Keep the calendar sources open and check for changes every POLL_SECS
 
-    except RequestError:
-        logging.warning("No entries in AdafruitIO")
-        # this happens when it is a new feed or you delete all the entries
-        send_to_aio(aio_appt_feed.key, upload)
-    except JSONDecodeError as e:
-        logging.warning("JSON error from AdafruitIO")
-        logging.error("Exception: %s", e)
-    except Exception as e:
-        logging.error("Exception: %s", e)
-        exit()
+    :param sources: dict of feed key to CalendarSource, or a single CalendarSource for the first of the FEEDS
+    """
+    if isinstance(sources, CalendarSource):
+        sources = {FEEDS[0]["feed"]: sources}
+    while True:
+        try:
+            for source in set(sources.values()):
+                source.poll()
+            main(sources)
+        except Exception:
+            # e.g. the network, the ics server or Outlook is away for a moment
+            logging.exception("Check failed, trying again in %d seconds", POLL_SECS)
+        idle(POLL_SECS)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Send the next appointments to an AIO feed")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and check the calendar every POLL_SECS seconds")
+    parser.add_argument("--ics", metavar="FILE_OR_URL",
+                        help="read the first of the FEEDS from an iCalendar file or URL instead of Outlook")
+    args = parser.parse_args()
+    feeds = FEEDS
+    if args.ics:
+        feeds = [dict(FEEDS[0], ics=args.ics)] + FEEDS[1:]
+    if args.daemon:
+        run_daemon(calendar_sources(feeds))
+    else:
+        main(calendar_sources(feeds))
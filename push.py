@@ -0,0 +1,79 @@
+"""
+Feed updates pushed over MQTT
+
+Polling the feed over HTTPS costs a request every poll even when nothing changed. The
+FeedSubscriber subscribes to the feed topic instead, so a new value arrives within a
+second of the PC client publishing it and an idle display makes no requests. When the
+connection drops the app goes back to polling over HTTP until a reconnect succeeds.
+"""
+import time
+
+
+class FeedSubscriber:
+    """Receive the feed values published to an MQTT topic
+
+    :param client: an adafruit_minimqtt MQTT client, not connected yet
+    :param str topic: the feed topic, 'username/feeds/feed key' for Adafruit IO
+    :param int retry_secs: how long to wait before reconnecting after a failure. Default is 30
+    :param float loop_timeout: how long each loop() waits for a message. Default is 0.01.
+        Newer adafruit_minimqtt releases refuse a loop timeout shorter than the client's
+        socket_timeout, so it is raised to that; make the client with a socket_timeout as
+        short as this so the loop does not hold up the display
+    """
+
+    def __init__(self, client, topic, retry_secs=30, loop_timeout=0.01):
+        self._client = client
+        self._client.on_message = self._on_message
+        self.topic = topic
+        self.retry_secs = retry_secs
+        self.loop_timeout = max(loop_timeout, getattr(client, '_socket_timeout', 0))
+        self.connected = False
+        self.messages = 0
+        self.connects = 0
+        self._value = None
+        self._retry_at = 0
+
+    def _on_message(self, client, topic, message) -> None:
+        if topic == self.topic:
+            # only the latest value matters
+            self._value = message
+            self.messages += 1
+
+    def _drop(self) -> None:
+        self.connected = False
+        self._retry_at = time.monotonic() + self.retry_secs
+        try:
+            self._client.disconnect()
+        except Exception:
+            pass
+
+    def connect(self) -> bool:
+        """Connect and subscribe unless it is too soon after a failure. Returns True if it
+        connected, the caller should then poll once to catch up on anything missed
+        """
+        if self.connected or time.monotonic() < self._retry_at:
+            return False
+        try:
+            self._client.connect()
+            self._client.subscribe(self.topic)
+        except Exception:
+            self._drop()
+            return False
+        self.connected = True
+        self.connects += 1
+        return True
+
+    def loop(self):
+        """Process the MQTT traffic. Returns the latest value received since the last call,
+        None if there was none or the connection dropped
+        """
+        if not self.connected:
+            return None
+        try:
+            self._client.loop(self.loop_timeout)
+        except Exception:
+            self._drop()
+            return None
+        value = self._value
+        self._value = None
+        return value
@@ -0,0 +1,96 @@
+"""
+Dirty-region rendering for the Matrix Portal text boxes
+
+The MatrixPortal text boxes re-layout their label every time set_text() or
+set_text_color() is called, even when the value is the same. The TextRenderer
+remembers what was last pushed to each text box and only forwards real changes.
+"""
+import time
+
+
+class TextRenderer:
+    """Cache the last rendered text and color per text box and only push label updates
+    when the value actually changes. Also keeps a simple frame-time counter.
+
+    :param portal: the MatrixPortal (or anything with set_text/set_text_color)
+    :param dict labels: labels made outside the portal, e.g. with a font add_text can not load,
+        by text box index. Default is None to send every text box to the portal
+    """
+
+    def __init__(self, portal, labels=None):
+        self._portal = portal
+        self._labels = labels or {}
+        self._text = {}
+        self._color = {}
+        self._frame_start = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Clear the update and frame-time counters"""
+        self.updates = 0
+        self.skipped = 0
+        self.frames = 0
+        self.frame_ns_total = 0
+        self.frame_ns_max = 0
+
+    def set_text(self, text: str, index: int) -> bool:
+        """Set the text of a text box if it changed. Returns True if the label was updated
+        :param str text: the text to display
+        :param int index: the text box index
+        """
+        if self._text.get(index) == text:
+            self.skipped += 1
+            return False
+        if index in self._labels:
+            self._labels[index].text = text
+        else:
+            self._portal.set_text(text, index)
+        self._text[index] = text
+        self.updates += 1
+        return True
+
+    def set_text_color(self, color: int, index: int) -> bool:
+        """Set the color of a text box if it changed. Returns True if the label was updated
+        :param int color: the RGB color
+        :param int index: the text box index
+        """
+        if self._color.get(index) == color:
+            self.skipped += 1
+            return False
+        if index in self._labels:
+            self._labels[index].color = color
+        else:
+            self._portal.set_text_color(color, index)
+        self._color[index] = color
+        self.updates += 1
+        return True
+
+    def invalidate(self, index=None) -> None:
+        """Forget the cached value so the next set_text/set_text_color is always pushed
+        :param int index: the text box index to forget. Default is None for all text boxes
+        """
+        if index is None:
+            self._text.clear()
+            self._color.clear()
+        else:
+            self._text.pop(index, None)
+            self._color.pop(index, None)
+
+    def begin_frame(self) -> None:
+        """Mark the start of a render loop pass"""
+        self._frame_start = time.monotonic_ns()
+
+    def end_frame(self) -> None:
+        """Mark the end of a render loop pass and accumulate the frame time"""
+        frame_ns = time.monotonic_ns() - self._frame_start
+        self.frames += 1
+        self.frame_ns_total += frame_ns
+        if frame_ns > self.frame_ns_max:
+            self.frame_ns_max = frame_ns
+
+    def stats(self) -> str:
+        """Returns the frame and label update counters formatted for a debug print"""
+        avg_ms = self.frame_ns_total / self.frames / 1000000 if self.frames else 0
+        return 'frames: {fr} avg: {avg:.2f}ms max: {mx:.2f}ms label updates: {up} skipped: {sk}'.format(
+            fr=self.frames, avg=avg_ms, mx=self.frame_ns_max / 1000000,
+            up=self.updates, sk=self.skipped)
@@ -0,0 +1,408 @@
+""" Replay a calendar trace through the display logic on a virtual clock, under CPython.
+
+simdata cycles through a few canned start times on the real clock, so checking a whole day
+means watching the panel for a day. The replay engine takes a trace of appointments, with
+the times they were added, canceled or removed, plays the PC client publishing it to the feed
+every nextCalAppt.POLL_SECS, through a calsource.FakeSource and the client's own
+get_appt_list() and encode_appts(), and drives app.NextMeetingApp against a virtual clock: count down ticks,
+feed polls on the app's own schedule and clock resyncs, as fast as the CPU allows. Every
+display change and poll is recorded, and the run is checked for meetings that were never
+shown and for how long each feed change took to reach the display.
+
+    python replay.py                      replay a generated day
+    python replay.py --days 7 --seed 3    replay a generated week
+    python replay.py trace.json           replay a recorded trace
+    python replay.py --save-trace t.json  save the generated trace to replay or edit later
+    python replay.py --record out.jsonl   also save every display change and poll
+
+A trace is a JSON list of appointments:
+
+    {"start": unix epoch, "duration": minutes, "subject": "...", "responseStatus": "Accepted",
+     "meeting_status": "Meeting", "added": epoch, "canceled": epoch, "removed": epoch}
+
+added, canceled and removed are optional: the appointment is in the calendar from added
+(default always), its meeting_status turns "Canceled" at canceled and it is gone at removed.
+
+nextCalAppt.py is imported for the replay, so it needs the secrets.py of the PC client. No
+requests are made.
+"""
+from typing import Dict, List, Optional
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import logging
+import random
+import time
+
+import app as app_module
+import feed as feed_module
+import simdata
+from app import NextMeetingApp
+from calsource import FakeSource, make_item
+from feed import FeedPoller
+
+STATUS_MSG = {status: {'icon': status, 'color': 0x808080, 'text': status}
+              for status in ['Accepted', 'Canceled', 'None', 'Not Responded', 'Organizer',
+                             'Tentative', 'No meeting']}
+
+
+class VirtualClock:
+    """Simulated time, standing in for the DriftClock passed to the app
+
+    :param float start: the unix epoch to start at
+    :param int sync_secs: the seconds between clock resyncs. Default is 21600
+    """
+
+    def __init__(self, start: float, sync_secs: int = 21600):
+        self.start = float(start)
+        self.t = float(start)
+        self.interval = sync_secs
+        self.syncs = 0
+        self.last_error = 0
+        self.rate = 1.0
+
+    def now(self) -> float:
+        return self.t
+
+    def monotonic(self) -> float:
+        return self.t - self.start
+
+    def next_sync_secs(self) -> int:
+        return self.interval
+
+    def sync(self) -> None:
+        self.syncs += 1
+
+
+class VirtualTime:
+    """The parts of the time module the display logic reads, on a VirtualClock. Anything
+    else is passed through to the time module
+    """
+
+    def __init__(self, clock: VirtualClock):
+        self._clock = clock
+
+    def time(self) -> float:
+        return self._clock.now()
+
+    def monotonic(self) -> float:
+        return self._clock.monotonic()
+
+    def monotonic_ns(self) -> int:
+        return int(self._clock.monotonic() * 1000000000)
+
+    def localtime(self, secs: float = None) -> "time.struct_time":
+        return time.localtime(self._clock.now() if secs is None else secs)
+
+    def __getattr__(self, name: str):
+        return getattr(time, name)
+
+
+@contextlib.contextmanager
+def virtual_time(clock: VirtualClock):
+    """Run the app and feed modules on the virtual clock. The renderer keeps the real clock so
+    its frame times are real work
+    """
+    modules = (app_module, feed_module)
+    saved = [module.time for module in modules]
+    for module in modules:
+        module.time = VirtualTime(clock)
+    try:
+        yield
+    finally:
+        for module, saved_time in zip(modules, saved):
+            module.time = saved_time
+
+
+def generate_trace(day_start: int, days: int = 1, seed: int = 0) -> List[dict]:
+    """
+    Returns a made up trace of working days, with the subjects and statuses from simdata
+
+    Meetings start on the half hour from 8:00 to 17:30 and last 15 to 90 minutes, so some
+    overlap. Some start at the same time as another, some are added during the day, canceled
+    before they start or removed.
+
+    :param int day_start: unix epoch of midnight on the first day
+    :param int days: the number of days. Default is 1
+    :param int seed: the random seed, the same seed gives the same trace. Default is 0
+    """
+    rand = random.Random(seed)
+    sim = simdata.sim()
+    trace = []
+    for day in range(days):
+        midnight = day_start + day * 86400
+        for slot in range(16, 36):
+            if rand.random() > 0.45:
+                continue
+            start = midnight + slot * 1800
+            for _ in range(2 if rand.random() < 0.1 else 1):
+                appt = {'start': start,
+                        'duration': rand.choice([15, 30, 30, 60, 90]),
+                        'subject': rand.choice(sim.subjects),
+                        'responseStatus': rand.choice(sim.resp_statuses),
+                        'meeting_status': 'Meeting'}
+                chance = rand.random()
+                if chance < 0.1:
+                    appt['added'] = start - rand.randint(600, 14400)
+                elif chance < 0.17:
+                    appt['canceled'] = start - rand.randint(60, 7200)
+                elif chance < 0.2:
+                    appt['removed'] = start - rand.randint(60, 7200)
+                trace.append(appt)
+    trace.sort(key=lambda appt: appt['start'])
+    return trace
+
+
+def calendar_at(trace: List[dict], now: float) -> FakeSource:
+    """Returns the calendar of the trace at a time, with the start times marked as UTC like
+    the Outlook times nextCalAppt.appt_entry() turns into the feed epochs
+    :param list trace: the trace appointments
+    :param float now: the unix epoch time
+    """
+    items = []
+    for appt in trace:
+        if not appt.get('added', 0) <= now < appt.get('removed', float('inf')):
+            continue
+        canceled = now >= appt.get('canceled', float('inf'))
+        items.append(make_item(dt.datetime.fromtimestamp(appt['start'], dt.timezone.utc), appt['duration'],
+                               appt['subject'], appt['responseStatus'],
+                               'Canceled' if canceled else appt['meeting_status']))
+    return FakeSource(items)
+
+
+class TraceFeed:
+    """The AIO feed as the PC client would publish the trace, checked every
+    nextCalAppt.POLL_SECS and only published when the value changes
+
+    :param list trace: the trace appointments
+    :param VirtualClock clock: the virtual clock
+    :param str encoding: "packed" or "frames". Default is "packed"
+    """
+
+    def __init__(self, trace: List[dict], clock: VirtualClock, encoding: str = 'packed'):
+        # imported here so the display stand-ins above work without the PC client secrets.py
+        import nextCalAppt
+        self._client = nextCalAppt
+        self.trace = sorted(trace, key=lambda appt: appt['start'])
+        self.clock = clock
+        self.encoding = encoding
+        # (publish time, item) for every value published
+        self.published = []
+        self._checked = None
+
+    def _check(self) -> None:
+        # the PC client checks the calendar on the minute, catch up to the latest check
+        client = self._client
+        check = self.clock.now() - (self.clock.now() - self.clock.start) % client.POLL_SECS
+        if check == self._checked:
+            return
+        self._checked = check
+        # the client works in naive datetimes of the calendar times
+        now = dt.datetime.fromtimestamp(check, dt.timezone.utc).replace(tzinfo=None)
+        appts = client.get_appt_list(calendar_at(self.trace, check),
+                                     now - dt.timedelta(minutes=client.MINUTES_BACK),
+                                     now + dt.timedelta(days=client.DAYS_AHEAD))
+        encoding = client.FEED_ENCODING
+        client.FEED_ENCODING = self.encoding
+        try:
+            value = client.encode_appts(appts)
+        finally:
+            client.FEED_ENCODING = encoding
+        if not self.published or self.published[-1][1]['value'] != value:
+            self.published.append((check, {'id': str(len(self.published)), 'value': value}))
+
+    def fetch(self) -> List[dict]:
+        """Returns the latest feed item, like get_io_data()"""
+        self._check()
+        return [self.published[-1][1]]
+
+
+class RecordingPortal:
+    """Display stand-in that records every text, color and icon change with the virtual time
+
+    :param VirtualClock clock: the virtual clock
+    """
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.changes = []
+        self.scrolls = 0
+
+    def set_text(self, val, index=0):
+        self.changes.append((self.clock.now(), 'text', index, val))
+
+    def set_text_color(self, color, index=0):
+        self.changes.append((self.clock.now(), 'color', index, color))
+
+    def set_background(self, file_or_color, position=None):
+        self.changes.append((self.clock.now(), 'icon', None, file_or_color))
+
+    def scroll(self):
+        self.scrolls += 1
+
+
+def replay(trace: List[dict], start: float, secs: float, tick_secs: float = 1.0, frames: bool = False,
+           encoding: str = 'packed', seed: int = 0) -> Dict:
+    """
+    Replay a trace through NextMeetingApp on a virtual clock and check the result
+
+    :param list trace: the trace appointments
+    :param float start: the unix epoch to start at
+    :param float secs: how long to replay in virtual seconds
+    :param float tick_secs: the virtual seconds between count down ticks. Default is 1.0,
+        the count down row only changes once a second
+    :param bool frames: also run the scroll frames, every scroll_delay. Default is False
+    :param str encoding: the feed encoding, "packed" or "frames". Default is "packed"
+    :param int seed: seeds the poll jitter. Default is 0
+    :return: dict with the counts, the checks, the polls and the display changes
+    """
+    random.seed(seed)
+    clock = VirtualClock(start)
+    trace_feed = TraceFeed(trace, clock, encoding)
+    portal = RecordingPortal(clock)
+    poller = FeedPoller(trace_feed.fetch)
+    app = NextMeetingApp(portal, poller, lambda: None, STATUS_MSG, clock=clock)
+
+    polls = []
+    shown = []
+    next_tick = next_poll = next_frame = start
+    next_sync = start + clock.next_sync_secs()
+    end = start + secs
+    wall = time.perf_counter()
+    with virtual_time(clock):
+        while True:
+            clock.t = min(next_tick, next_poll, next_sync, next_frame if frames else end)
+            if clock.t >= end:
+                break
+            if clock.t == next_poll:
+                poll_secs = app.poll_once()
+                polls.append((clock.t, poller.changes, poll_secs))
+                next_poll = clock.t + poll_secs
+            if clock.t == next_sync:
+                clock.sync()
+                next_sync = clock.t + clock.next_sync_secs()
+            if clock.t == next_tick:
+                app.tick()
+                next_tick = clock.t + tick_secs
+            if frames and clock.t == next_frame:
+                app.renderer.begin_frame()
+                app.portal.scroll()
+                app.renderer.end_frame()
+                next_frame = clock.t + app.scroll_delay
+            current = app.queue.current
+            if not shown or shown[-1][1] is not current:
+                shown.append((clock.t, current))
+    wall = time.perf_counter() - wall
+
+    return {'virtual_secs': secs,
+            'wall_secs': wall,
+            'speedup': secs / wall if wall else float('inf'),
+            'polls': len(polls),
+            'feed_changes': poller.changes,
+            'published': len(trace_feed.published),
+            'label_updates': app.renderer.updates,
+            'label_skips': app.renderer.skipped,
+            'display_changes': len(portal.changes),
+            'frames': app.renderer.frames,
+            'frame_ms_avg': app.renderer.frame_ns_total / app.renderer.frames / 1000000 if app.renderer.frames else 0,
+            'missed': missed_appts(trace, shown, start, end),
+            'latency': feed_latency(trace_feed.published, polls, start),
+            'poll_log': polls,
+            'display_log': portal.changes}
+
+
+def missed_appts(trace: List[dict], shown: list, start: float, end: float) -> List[dict]:
+    """Returns the trace appointments in the replay that were in the feed when they started,
+    not canceled, and never shown before they ended
+    :param list trace: the trace appointments
+    :param list shown: (time, appointment) for each change of the current appointment
+    :param float start: the replay start, unix epoch
+    :param float end: the replay end, unix epoch
+    """
+    missed = []
+    for appt in trace:
+        appt_end = appt['start'] + appt['duration'] * 60
+        if appt['start'] < start or appt_end > end:
+            continue
+        if not appt.get('added', 0) <= appt['start'] < appt.get('removed', float('inf')):
+            continue
+        if appt.get('canceled', float('inf')) <= appt['start']:
+            continue
+        if not any(when < appt_end and shown_appt.get('start') == appt['start']
+                   for when, shown_appt in shown):
+            missed.append(appt)
+    return missed
+
+
+def feed_latency(published: list, polls: list, start: float) -> Dict[str, Optional[float]]:
+    """Returns the mean and worst seconds from a feed value being published to the display
+    polling it
+    :param list published: (time, item) for each value published by the TraceFeed
+    :param list polls: (time, changes so far, seconds to the next poll) for each poll
+    :param float start: the replay start, the first value is not counted
+    """
+    delays = []
+    poll_index = 0
+    for when, _ in published:
+        if when <= start:
+            continue
+        while poll_index < len(polls) and polls[poll_index][0] < when:
+            poll_index += 1
+        if poll_index < len(polls):
+            delays.append(polls[poll_index][0] - when)
+    if not delays:
+        return {'mean': None, 'max': None, 'count': 0}
+    return {'mean': sum(delays) / len(delays), 'max': max(delays), 'count': len(delays)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a calendar trace through the display logic")
+    parser.add_argument("trace", nargs="?", help="a JSON trace file. Default is a generated trace")
+    parser.add_argument("--days", type=int, default=1, help="the days to generate and replay")
+    parser.add_argument("--seed", type=int, default=0, help="the random seed for the trace and poll jitter")
+    parser.add_argument("--encoding", choices=["packed", "frames"], default="packed", help="the feed encoding")
+    parser.add_argument("--tick", type=float, default=1.0, help="virtual seconds between count down ticks")
+    parser.add_argument("--frames", action="store_true", help="also run the scroll frames, much slower")
+    parser.add_argument("--save-trace", help="save the trace as JSON")
+    parser.add_argument("--record", help="save every poll and display change as JSON lines")
+    args = parser.parse_args()
+    # before nextCalAppt is imported, so its debug logging stays off
+    logging.basicConfig(level=logging.WARNING)
+
+    midnight = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+    if args.trace:
+        with open(args.trace) as trace_file:
+            trace = json.load(trace_file)
+        start = min(appt['start'] for appt in trace) - 3600 if trace else midnight
+        end = max(appt['start'] + appt['duration'] * 60 for appt in trace) + 3600 if trace else midnight
+        secs = max(end - start, 3600)
+    else:
+        trace = generate_trace(int(midnight), args.days, args.seed)
+        start, secs = midnight, args.days * 86400
+    if args.save_trace:
+        with open(args.save_trace, "w") as trace_file:
+            json.dump(trace, trace_file, indent=1)
+
+    # the app prints each appointment it shows
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = replay(trace, start, secs, tick_secs=args.tick, frames=args.frames,
+                        encoding=args.encoding, seed=args.seed)
+    for key in ('virtual_secs', 'wall_secs', 'speedup', 'polls', 'published', 'feed_changes',
+                'label_updates', 'label_skips', 'display_changes', 'frames', 'frame_ms_avg', 'latency'):
+        value = result[key]
+        print('{:16} {}'.format(key, '{:.2f}'.format(value) if isinstance(value, float) else value))
+    print('{:16} {}'.format('missed', len(result['missed'])))
+    for appt in result['missed']:
+        print('    {} {!r}'.format(time.strftime('%a %H:%M', time.localtime(appt['start'])), appt['subject']))
+    if args.record:
+        with open(args.record, "w") as record:
+            for when, changes, poll_secs in result['poll_log']:
+                record.write(json.dumps({'t': when, 'poll': changes, 'next': poll_secs}) + "\n")
+            for when, kind, index, value in result['display_log']:
+                record.write(json.dumps({'t': when, kind: value, 'index': index}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Pick the next feed poll interval from how far away the appointment is
+
+Polling rarely when the next meeting is a day away and more often inside the
+warning and alert bands keeps the Adafruit IO request count down while the
+display stays fresh when it matters.
+"""
+import random
+from constants import poll_schedule
+
+
+def next_poll_secs(band: str, schedule=poll_schedule) -> int:
+    """Returns the number of seconds to wait before the next feed poll
+    :param str band: the time_display_colors key of the current count down band, None if unknown
+    :param dict schedule: the poll intervals, jitter and bounds. Default is constants.poll_schedule
+    """
+    poll_secs = schedule['bands'].get(band, schedule['min'])
+    # spread the polls so several displays do not hit AIO at the same moment
+    poll_secs *= 1 + random.uniform(-schedule['jitter'], schedule['jitter'])
+    return int(min(max(poll_secs, schedule['min']), schedule['max']))
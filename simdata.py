@@ -2,8 +2,13 @@ from constants import time_display_colors
 import time
 
 class sim:
+    """Canned appointments cycling through the start time bands, subjects and statuses
 
-    def __init__(self):
+    :param now: callable returning the current unix epoch, e.g. a virtual clock for a replay. Default is None for time.time
+    """
+
+    def __init__(self, now=None):
+        self.now = now or time.time
         self.start_times_ctr = 0
         self.start_times = [">1 day", 
                             ">1hr <1day", 
@@ -26,14 +31,14 @@ class sim:
         self.meeting_statuses = ["None", "Canceled"]
 
         self.SIM_DATA_TIME = "in progress"
-        self.appt_data = {"start":time.time(),"subject": "","responseStatus" : "", "meeting_status" : ""}
+        self.appt_data = {"start":self.now(),"subject": "","responseStatus" : "", "meeting_status" : ""}
 
     def print(self):
         print(self.appt_data)
 
     def get_sim_data(self, subject=None, resp_stat=None, meet_stat = None, ttime=None):
         # get the current time to start
-        sim_test_time = time.time()
+        sim_test_time = self.now()
 
         # set the subject
         if subject==None:
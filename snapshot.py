@@ -0,0 +1,101 @@
+"""
+Appointment snapshot kept across reboots
+
+After a power cut or reset the display used to stay on "Setting time..." until the network
+came up and the feed was polled. The Snapshot keeps the last appointments, packed with
+apptcodec, and the time they were saved in non-volatile memory so the next boot can show
+them straight away and carry on while the network warms up and the time syncs.
+
+Layout, big endian:
+
+    4 bytes  MAGIC
+    uint32   time saved, unix epoch
+    uint16   length of the packed appointments
+    uint32   CRC32 of the packed appointments, to reject a write cut short by a brownout
+    bytes    the packed appointments, see apptcodec.pack_appts()
+
+Every write erases flash, so the appointments are only saved when they change and the time
+on its own at most every time_secs.
+"""
+import binascii
+import struct
+import time
+from apptcodec import FRAMES_VERSION, PACKED_VERSION, pack_appts, unpack_appts
+
+MAGIC = b'NMS1'
+_HEADER = '>4sIHI'
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_TIME_OFFSET = 4
+
+
+class Snapshot:
+    """The last appointments and the time, in non-volatile memory
+
+    :param nvm: the byte array to keep them in, e.g. microcontroller.nvm
+    :param int time_secs: the fewest seconds between saves of the time on its own. Default is 3600
+    """
+
+    def __init__(self, nvm, time_secs=3600):
+        self._nvm = nvm
+        self.time_secs = time_secs
+        self.saves = 0
+        self._packed = None
+        self._saved_at = 0
+
+    def load(self):
+        """Returns the saved appointments and the unix epoch they were saved at, or None and 0
+        if nothing valid was saved
+        """
+        magic, saved_at, length, crc = struct.unpack(_HEADER, bytes(self._nvm[0:_HEADER_SIZE]))
+        if magic != MAGIC or _HEADER_SIZE + length > len(self._nvm):
+            return None, 0
+        packed = bytes(self._nvm[_HEADER_SIZE:_HEADER_SIZE + length])
+        if binascii.crc32(packed) != crc:
+            return None, 0
+        try:
+            appts = unpack_appts(packed.decode('ascii'))
+        except ValueError:
+            return None, 0
+        self._packed = packed
+        self._saved_at = saved_at
+        return appts, saved_at
+
+    def save(self, appts, now) -> bool:
+        """Save the appointments and the time if the appointments changed. Returns True if it
+        wrote to the memory. Raises ValueError if the appointments can not be packed or are too
+        big for the memory
+        :param list appts: the appointments from the FeedPoller
+        :param int now: the current unix epoch time
+        """
+        frames = all('status' in appt and 'label' in appt and 'edges' in appt for appt in appts)
+        packed = pack_appts(appts, FRAMES_VERSION if frames and appts else PACKED_VERSION).encode('ascii')
+        if packed == self._packed:
+            return self.save_time(now)
+        if _HEADER_SIZE + len(packed) > len(self._nvm):
+            raise ValueError('{} byte snapshot does not fit in {} bytes'.format(len(packed), len(self._nvm)))
+        self._nvm[0:_HEADER_SIZE + len(packed)] = \
+            struct.pack(_HEADER, MAGIC, int(now), len(packed), binascii.crc32(packed)) + packed
+        self._packed = packed
+        self._saved_at = int(now)
+        self.saves += 1
+        return True
+
+    def save_time(self, now) -> bool:
+        """Save the time if time_secs has passed since it was last saved. Returns True if it
+        wrote to the memory
+        :param int now: the current unix epoch time
+        """
+        if self._packed is None or now - self._saved_at < self.time_secs:
+            return False
+        self._nvm[_TIME_OFFSET:_TIME_OFFSET + 4] = struct.pack('>I', int(now))
+        self._saved_at = int(now)
+        self.saves += 1
+        return True
+
+    @staticmethod
+    def set_time(epoch) -> None:
+        """Set the real time clock, which starts from its reset time after a power cut
+        :param int epoch: the unix epoch time to set
+        """
+        import rtc
+        rtc.RTC().datetime = time.localtime(epoch)
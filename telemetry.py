@@ -0,0 +1,136 @@
+"""
+Heap and latency telemetry for the Matrix Portal
+
+Named timers and counters with the most recent timer samples kept in a fixed-size ring
+buffer, so recording does not grow the heap. The summary can be printed with dump() or
+sent to its own feed with publish(). When disabled every call returns straight away.
+
+    telemetry = Telemetry()
+    start = telemetry.start()
+    ...
+    telemetry.stop('fetch', start)
+    telemetry.count('polls')
+    telemetry.sample_heap()
+"""
+import gc
+import json
+import time
+
+
+class Telemetry:
+    """Named timers, counters, frame rate, minimum free heap and GC count
+
+    :param bool enabled: record anything at all. Default is True
+    :param int size: the number of recent timer samples to keep. Default is 32
+    """
+
+    def __init__(self, enabled=True, size=32):
+        self.enabled = enabled
+        self.size = size
+        # the ring buffer of recent timer samples, allocated once
+        self._names = [None] * size
+        self._ms = [0.0] * size
+        self._next = 0
+        self.timers = {}
+        self.counters = {}
+        self.min_free = None
+        self.gc_count = 0
+        self.frames = 0
+        self._frames_since = time.monotonic()
+
+    def start(self) -> int:
+        """Returns a start time to pass to stop()"""
+        if not self.enabled:
+            return 0
+        return time.monotonic_ns()
+
+    def stop(self, name: str, start: int) -> None:
+        """Record the time since start() for a named timer
+        :param str name: the timer name, e.g. 'fetch'
+        :param int start: the value returned by start()
+        """
+        if not self.enabled:
+            return
+        ms = (time.monotonic_ns() - start) / 1000000
+        self._names[self._next] = name
+        self._ms[self._next] = ms
+        self._next = (self._next + 1) % self.size
+        # count, total and max for the summary
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, ms, ms]
+        else:
+            timer[0] += 1
+            timer[1] += ms
+            if ms > timer[2]:
+                timer[2] = ms
+
+    def count(self, name: str, amount=1) -> None:
+        """Add to a named counter
+        :param str name: the counter name, e.g. 'polls'
+        :param int amount: how much to add. Default is 1
+        """
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def frame(self) -> None:
+        """Count a display frame for the frames per second"""
+        if self.enabled:
+            self.frames += 1
+
+    def sample_heap(self) -> None:
+        """Record the free heap if it is the lowest seen. Only CircuitPython has gc.mem_free()"""
+        if not self.enabled or not hasattr(gc, 'mem_free'):
+            return
+        free = gc.mem_free()
+        if self.min_free is None or free < self.min_free:
+            self.min_free = free
+
+    def collect(self) -> None:
+        """Run the garbage collector and count it. Always collects, even when disabled"""
+        if self.enabled:
+            self.sample_heap()
+            self.gc_count += 1
+        gc.collect()
+
+    def recent(self) -> list:
+        """Returns the recent timer samples as (name, ms) tuples, oldest first"""
+        samples = []
+        for offset in range(self.size):
+            index = (self._next + offset) % self.size
+            if self._names[index] is not None:
+                samples.append((self._names[index], self._ms[index]))
+        return samples
+
+    def summary(self) -> dict:
+        """Returns the counters, timer averages and maximums, frame rate, heap and GC count.
+        Starts a new frame rate period
+        """
+        now = time.monotonic()
+        elapsed = now - self._frames_since
+        fps = self.frames / elapsed if elapsed > 0 else 0
+        self.frames = 0
+        self._frames_since = now
+        result = {'fps': round(fps, 1), 'min_free': self.min_free, 'gc': self.gc_count}
+        for name, timer in self.timers.items():
+            result[name + '_ms'] = round(timer[1] / timer[0], 1)
+            result[name + '_max_ms'] = round(timer[2], 1)
+        for name, value in self.counters.items():
+            result[name] = value
+        return result
+
+    def dump(self) -> None:
+        """Print the summary and the recent timer samples"""
+        if not self.enabled:
+            return
+        print(f'telemetry: {self.summary()}')
+        print('recent: ' + ' '.join(f'{name}={ms:.1f}' for name, ms in self.recent()))
+
+    def publish(self, send) -> None:
+        """Send the summary as JSON, e.g. to its own AIO feed
+        :param send: callable taking the JSON string
+        """
+        if not self.enabled:
+            return
+        send(json.dumps(self.summary()))
@@ -0,0 +1,6 @@
+""" Shared setup for the tests, run with `python -m pytest` from the repo root. """
+import os
+import sys
+
+# appended, code.py would hide the standard library code module that pytest uses
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
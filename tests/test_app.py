@@ -0,0 +1,156 @@
+""" Tests for the display tasks with the replay stand-ins for the display, feed and clock. """
+from apptcodec import pack_appts
+from app import ERROR_COLOR, ERROR_DISPLAY_SECS, NextMeetingApp
+from feed import FeedPoller
+from replay import STATUS_MSG, RecordingPortal, VirtualClock, virtual_time
+
+START = 1767600000
+
+
+def appt(subject, start, duration=30, status="Accepted"):
+    return {"start": start, "subject": subject, "responseStatus": status,
+            "meeting_status": "Meeting", "duration": duration}
+
+
+class Feed:
+    """The feed items to return, or the error to raise"""
+
+    def __init__(self, appts):
+        self.value = pack_appts(appts)
+        self.error = None
+
+    def fetch(self):
+        if self.error:
+            raise self.error
+        return [{"value": self.value}]
+
+
+class Snapshot:
+    def __init__(self, appts, saved_at):
+        self.appts = appts
+        self.saved_at = saved_at
+        self.set_to = None
+        self.saved = []
+
+    def load(self):
+        return self.appts, self.saved_at
+
+    def set_time(self, epoch):
+        self.set_to = epoch
+
+    def save(self, appts, now):
+        self.saved.append((appts, now))
+
+    def save_time(self, now):
+        pass
+
+
+def make_app(appts, **kwargs):
+    clock = VirtualClock(START)
+    portal = RecordingPortal(clock)
+    feed = Feed(appts)
+    app = NextMeetingApp(portal, FeedPoller(feed.fetch), lambda: None, STATUS_MSG, clock=clock,
+                         error_text={OSError: "Feed error"}, **kwargs)
+    return app, clock, portal, feed
+
+
+def shown(portal, index, kind="text"):
+    """The last value set on a text box"""
+    values = [change[3] for change in portal.changes if change[1] == kind and change[2] == index]
+    return values[-1] if values else None
+
+
+def test_poll_shows_the_next_appointment():
+    app, clock, portal, feed = make_app([appt("Standup", START + 3600, status="Tentative")])
+    with virtual_time(clock):
+        app.poll_once()
+        app.tick()
+    assert shown(portal, 3) == "Standup"
+    assert shown(portal, 2) == "Tentative"
+    assert shown(portal, None, "icon") == "Tentative"
+    assert shown(portal, 1) is not None
+
+
+def test_error_is_shown_then_cleared():
+    app, clock, portal, feed = make_app([appt("Standup", START + 3600)])
+    with virtual_time(clock):
+        app.poll_once()
+        app.tick()
+        count_down = shown(portal, 1)
+        feed.error = OSError("no Wi-Fi")
+        app.poll_once()
+        assert (shown(portal, 1), shown(portal, 1, "color")) == ("Feed error", ERROR_COLOR)
+        clock.t += ERROR_DISPLAY_SECS - 5
+        app.tick()
+        assert shown(portal, 1) == "Feed error"
+        clock.t += 10
+        app.tick()
+    assert shown(portal, 1) not in ("Feed error", None)
+    assert shown(portal, 1, "color") != ERROR_COLOR
+    assert count_down != "Feed error"
+
+
+def test_queue_moves_on_when_the_appointment_ends():
+    app, clock, portal, feed = make_app([appt("Standup", START + 60, duration=15),
+                                         appt("Review", START + 3600)])
+    with virtual_time(clock):
+        app.poll_once()
+        assert shown(portal, 3) == "Standup"
+        clock.t = START + 60 + 14 * 60
+        app.tick()
+        assert shown(portal, 3) == "Standup"
+        clock.t = START + 60 + 15 * 60 + 1
+        app.tick()
+    assert shown(portal, 3) == "Review"
+    # no poll was needed to move on
+    assert app.poller.polls == 1
+
+
+def test_pushed_value_is_shown_and_a_bad_one_ignored():
+    app, clock, portal, feed = make_app([appt("Standup", START + 3600)])
+    with virtual_time(clock):
+        app.poll_once()
+        app.accept_push(pack_appts([appt("Moved up", START + 600)]))
+        assert shown(portal, 3) == "Moved up"
+        app.accept_push("not a feed value")
+    assert shown(portal, 3) == "Moved up"
+    assert app.poller.polls == 1
+
+
+def test_restore_shows_the_snapshot_before_the_network():
+    saved_at = START + 7200
+    snapshot = Snapshot([appt("Standup", START + 9000)], saved_at)
+    app, clock, portal, feed = make_app([], snapshot=snapshot)
+    feed.error = OSError("network not up yet")
+    with virtual_time(clock):
+        assert app.restore()
+    assert shown(portal, 3) == "Standup"
+    # the clock was behind the saved time, so it goes on from there with only the start label
+    assert snapshot.set_to == saved_at
+    assert app.time_estimated
+    assert app.count_down.label
+    assert shown(portal, 1) == app.count_down.label
+
+
+def test_restore_without_a_snapshot():
+    app, clock, portal, feed = make_app([], snapshot=Snapshot(None, 0))
+    with virtual_time(clock):
+        assert not app.restore()
+    assert portal.changes == []
+
+
+def test_malformed_pushes_keep_the_current_appointment():
+    app, clock, portal, feed = make_app([appt("Standup", START + 3600)])
+    with virtual_time(clock):
+        app.poll_once()
+        # a JSON value without the fields, and one with a status the display has no message for
+        app.accept_push('{"start": 1}')
+        app.accept_push(pack_appts([appt("Declined one", START + 600, status="Declined")]))
+        assert shown(portal, 3) == "Standup"
+        assert app.queue.current["subject"] == "Standup"
+        app.tick()
+        # the next poll parses the feed again
+        assert app.poll_once()
+        assert app.poller.polls == 2
+    assert shown(portal, 3) == "Standup"
+    assert app.poller.appts[0]["subject"] == "Standup"
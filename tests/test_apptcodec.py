@@ -0,0 +1,87 @@
+""" Tests for the packed feed value encoding. """
+import binascii
+import json
+
+import pytest
+
+from apptcodec import FRAMES_VERSION, decode_appts, pack_appts, unpack_appts
+
+
+def appt(**fields):
+    entry = {"start": 1767600000, "subject": "Standup", "responseStatus": "Accepted",
+             "meeting_status": "Meeting", "duration": 30}
+    entry.update(fields)
+    return entry
+
+
+def test_round_trip():
+    appts = [appt(), appt(start=1767603600, subject="Lunch ☕", duration=None)]
+    assert decode_appts(pack_appts(appts)) == appts
+
+
+def test_long_subject_is_cut_on_a_character_boundary():
+    packed = decode_appts(pack_appts([appt(subject="é" * 200)]))
+    assert packed[0]["subject"] == "é" * 127
+
+
+@pytest.mark.parametrize("fields", [{"duration": 65535}, {"duration": 100000}, {"duration": -5},
+                                    {"start": -1}, {"start": 2 ** 32}])
+def test_out_of_range_values_raise_value_error(fields):
+    with pytest.raises(ValueError):
+        pack_appts([appt(**fields)])
+
+
+def test_unknown_status_raises_value_error():
+    with pytest.raises(ValueError):
+        pack_appts([appt(responseStatus="Maybe")])
+
+
+def test_frame_edges_out_of_range_raise_value_error():
+    frame = appt(status="Accepted", label="9:00a", edges=[0, 1, 2, 3, 2 ** 32])
+    with pytest.raises(ValueError):
+        pack_appts([frame], FRAMES_VERSION)
+
+
+def with_byte(value, offset, byte):
+    """Returns a packed value with one byte changed"""
+    buf = bytearray(binascii.a2b_base64(value))
+    buf[offset] = byte
+    return binascii.b2a_base64(buf).decode("ascii").strip()
+
+
+# header 2 bytes, then start 4, duration 2, responseStatus 1, meeting_status 1, subject length 1
+@pytest.mark.parametrize("offset", [8, 9])
+def test_status_byte_outside_its_table_raises_value_error(offset):
+    with pytest.raises(ValueError):
+        unpack_appts(with_byte(pack_appts([appt()]), offset, 9))
+
+
+def test_display_status_byte_outside_its_table_raises_value_error():
+    frame = appt(status="Accepted", label="9:00a", edges=[0, 1, 2, 3, 4])
+    packed = pack_appts([frame], FRAMES_VERSION)
+    assert unpack_appts(packed)[0]["status"] == "Accepted"
+    # the status byte follows the 7 byte subject
+    with pytest.raises(ValueError):
+        unpack_appts(with_byte(packed, 11 + len("Standup"), 200))
+
+
+def test_json_round_trip():
+    appts = [appt(), appt(duration=None)]
+    assert decode_appts(json.dumps({"appts": appts})) == appts
+    assert decode_appts(json.dumps(appt())) == [appt()]
+    assert decode_appts(json.dumps({"responseStatus": "No meeting"})) == []
+
+
+@pytest.mark.parametrize("value", [
+    '{"start": 1}',
+    '{"appts": {"start": 1}}',
+    '{"appts": [1]}',
+    json.dumps({"appts": [appt(subject=None)]}),
+    json.dumps(appt(start="9:00")),
+    json.dumps(appt(start=True)),
+    json.dumps(appt(duration="30")),
+    '{"start": ',
+])
+def test_json_without_the_appointment_fields_raises_value_error(value):
+    with pytest.raises(ValueError):
+        decode_appts(value)
@@ -0,0 +1,97 @@
+""" Tests for the network backoff and circuit breaker with a fake monotonic clock. """
+import pytest
+
+import breaker
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def monotonic(self):
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breaker.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def fail():
+    raise OSError("no Wi-Fi")
+
+
+def failures(circuit, count):
+    for _ in range(count):
+        with pytest.raises(OSError):
+            circuit.call(fail)
+
+
+def test_failures_grow_the_backoff(clock):
+    circuit = CircuitBreaker("feed", base_secs=15, max_secs=100, jitter=0, threshold=10)
+    waits = []
+    for _ in range(5):
+        failures(circuit, 1)
+        waits.append(circuit.retry_secs())
+    assert waits == [15, 30, 60, 100, 100]
+    assert circuit.state == CLOSED
+    assert circuit.degraded
+
+
+def test_jitter_spreads_the_wait(clock):
+    circuit = CircuitBreaker("feed", base_secs=100, jitter=0.25)
+    failures(circuit, 1)
+    waits = [circuit.retry_secs() for _ in range(50)]
+    assert all(75 <= wait <= 125 for wait in waits)
+    assert len(set(waits)) > 1
+
+
+def test_circuit_opens_at_the_threshold(clock):
+    circuit = CircuitBreaker("feed", threshold=3, open_secs=600)
+    failures(circuit, 2)
+    assert circuit.state == CLOSED
+    failures(circuit, 1)
+    assert circuit.state == OPEN
+    assert circuit.opens == 1
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        circuit.call(calls.append, 1)
+    assert calls == []
+    assert circuit.rejected == 1
+    clock.t += 100
+    assert circuit.retry_secs() == 500
+
+
+def test_one_trial_after_the_cool_down(clock):
+    circuit = CircuitBreaker("feed", threshold=2, open_secs=600)
+    failures(circuit, 2)
+    clock.t += 599
+    with pytest.raises(CircuitOpenError):
+        circuit.call(fail)
+    clock.t += 1
+    states = []
+    with pytest.raises(OSError):
+        circuit.call(lambda: states.append(circuit.state) or fail())
+    assert states == [HALF_OPEN]
+    # the failed trial opens the circuit again for the full cool-down
+    assert circuit.state == OPEN
+    assert circuit.opens == 2
+    with pytest.raises(CircuitOpenError):
+        circuit.call(fail)
+    assert circuit.rejected == 2
+
+
+def test_success_resets_the_state(clock):
+    circuit = CircuitBreaker("feed", base_secs=15, jitter=0, threshold=2, open_secs=600)
+    failures(circuit, 2)
+    clock.t += 600
+    assert circuit.call(lambda: "value") == "value"
+    assert circuit.state == CLOSED
+    assert circuit.failures == 0
+    assert not circuit.degraded
+    failures(circuit, 1)
+    assert circuit.state == CLOSED
+    assert circuit.retry_secs() == 15
@@ -0,0 +1,191 @@
+""" Tests for the calendar sources: the Outlook series expansion with stand-ins for the Outlook
+COM objects, and the FakeSource.
+
+The expected series dates are what Outlook shows for the same recurrence patterns.
+"""
+import datetime as dt
+
+from calsource import (OL_RECURS_DAILY, OL_RECURS_MONTH_NTH, OL_RECURS_MONTHLY, OL_RECURS_WEEKLY,
+                       OL_RECURS_YEAR_NTH, OL_RECURS_YEARLY, FakeSource, OutlookSource, make_item)
+
+UTC = dt.timezone.utc
+MON, TUE, WED, THU, FRI, SAT, SUN = 2, 4, 8, 16, 32, 64, 1
+WEEKDAYS = MON | TUE | WED | THU | FRI
+
+
+class Pattern:
+    def __init__(self, recurrence, first, interval=1, day_of_month=0, mask=0, instance=0,
+                 until=None, exceptions=()):
+        self.RecurrenceType = recurrence
+        self.Interval = interval
+        self.DayOfMonth = day_of_month
+        self.DayOfWeekMask = mask
+        self.Instance = instance
+        self.PatternStartDate = first.replace(hour=0, minute=0, tzinfo=UTC)
+        self.StartTime = first.replace(tzinfo=UTC)
+        self.Duration = 30
+        self.NoEndDate = until is None
+        self.PatternEndDate = (until or dt.datetime(4500, 8, 31)).replace(tzinfo=UTC)
+        self.Exceptions = list(exceptions)
+
+
+class Appointment:
+    def __init__(self, subject, start, pattern=None, entry_id=None):
+        self.subject = subject
+        self.start = start.replace(tzinfo=UTC)
+        self.end = self.start + dt.timedelta(minutes=30)
+        self.duration = 30
+        self.responseStatus = 3
+        self.Importance = 1
+        self.MeetingStatus = 1
+        self.EntryID = entry_id or subject
+        self.LastModificationTime = dt.datetime(2026, 1, 1, tzinfo=UTC)
+        self.pattern = pattern
+        self.pattern_reads = 0
+
+    def GetRecurrencePattern(self):
+        self.pattern_reads += 1
+        return self.pattern
+
+
+class Items(list):
+    def __init__(self, folder):
+        super().__init__()
+        self.folder = folder
+        self.IncludeRecurrences = False
+
+    def Sort(self, key):
+        pass
+
+    def Restrict(self, query):
+        self.folder.queries.append(query)
+        if "[IsRecurring] = True" not in query:
+            return []
+        if self.IncludeRecurrences:
+            return self.folder.occurrences
+        return self.folder.masters
+
+
+class Folder:
+    def __init__(self, masters, occurrences=()):
+        self.masters = masters
+        self.occurrences = list(occurrences)
+        self.queries = []
+
+    @property
+    def Items(self):
+        return Items(self)
+
+
+def source(folder=None):
+    """An OutlookSource without the COM session, only the series expansion is used"""
+    outlook = OutlookSource.__new__(OutlookSource)
+    outlook.window_slack = dt.timedelta(hours=1)
+    outlook.owner = None
+    outlook._folder = folder
+    outlook._series = {}
+    outlook.series_hits = 0
+    outlook.series_misses = 0
+    return outlook
+
+
+def dates(pattern, begin=dt.datetime(2026, 1, 1), end=dt.datetime(2026, 7, 1)):
+    master = Appointment("Series", pattern.StartTime, pattern)
+    occurrences = source()._expand_series(master, pattern, begin, end)
+    return [item["start"].replace(tzinfo=None).date().isoformat() for item in occurrences]
+
+
+def test_monthly_31st_is_the_last_day_of_short_months():
+    pattern = Pattern(OL_RECURS_MONTHLY, dt.datetime(2026, 1, 31, 9), day_of_month=31)
+    assert dates(pattern) == ["2026-01-31", "2026-02-28", "2026-03-31", "2026-04-30",
+                              "2026-05-31", "2026-06-30"]
+
+
+def test_monthly_30th_in_a_leap_february():
+    pattern = Pattern(OL_RECURS_MONTHLY, dt.datetime(2028, 1, 30, 9), day_of_month=30)
+    assert dates(pattern, dt.datetime(2028, 1, 1), dt.datetime(2028, 4, 1)) == \
+        ["2028-01-30", "2028-02-29", "2028-03-30"]
+
+
+def test_last_weekday_of_the_month():
+    pattern = Pattern(OL_RECURS_MONTH_NTH, dt.datetime(2026, 1, 30, 9), mask=WEEKDAYS, instance=5)
+    assert dates(pattern) == ["2026-01-30", "2026-02-27", "2026-03-31", "2026-04-30",
+                              "2026-05-29", "2026-06-30"]
+
+
+def test_first_weekend_day_every_second_month():
+    pattern = Pattern(OL_RECURS_MONTH_NTH, dt.datetime(2026, 1, 3, 9), interval=2,
+                      mask=SAT | SUN, instance=1)
+    assert dates(pattern) == ["2026-01-03", "2026-03-01", "2026-05-02"]
+
+
+def test_fourth_thursday_of_november():
+    pattern = Pattern(OL_RECURS_YEAR_NTH, dt.datetime(2026, 11, 26, 12), interval=12,
+                      mask=THU, instance=4)
+    assert dates(pattern, dt.datetime(2026, 1, 1), dt.datetime(2029, 1, 1)) == \
+        ["2026-11-26", "2027-11-25", "2028-11-23"]
+
+
+def test_yearly_29th_february_is_the_28th_in_other_years():
+    pattern = Pattern(OL_RECURS_YEARLY, dt.datetime(2028, 2, 29, 9), interval=1, day_of_month=29)
+    assert dates(pattern, dt.datetime(2028, 1, 1), dt.datetime(2031, 1, 1)) == \
+        ["2028-02-29", "2029-02-28", "2030-02-28"]
+
+
+def test_every_other_week_until():
+    pattern = Pattern(OL_RECURS_WEEKLY, dt.datetime(2026, 1, 5, 9), interval=2, mask=MON | FRI,
+                      until=dt.datetime(2026, 2, 2))
+    assert dates(pattern) == ["2026-01-05", "2026-01-09", "2026-01-19", "2026-01-23", "2026-02-02"]
+
+
+def test_every_weekday():
+    pattern = Pattern(OL_RECURS_DAILY, dt.datetime(2026, 1, 1, 9), mask=WEEKDAYS)
+    assert dates(pattern, end=dt.datetime(2026, 1, 8)) == \
+        ["2026-01-01", "2026-01-02", "2026-01-05", "2026-01-06", "2026-01-07"]
+
+
+def test_ended_series_is_not_expanded_again():
+    ended = Appointment("Ended", dt.datetime(2019, 1, 1, 9),
+                        Pattern(OL_RECURS_DAILY, dt.datetime(2019, 1, 1, 9), until=dt.datetime(2020, 1, 1)))
+    daily = Appointment("Daily", dt.datetime(2026, 1, 1, 9),
+                        Pattern(OL_RECURS_DAILY, dt.datetime(2026, 1, 1, 9)))
+    outlook = source(Folder([ended, daily]))
+    begin = dt.datetime(2026, 3, 2)
+    items = outlook._scan_series(begin, begin + dt.timedelta(days=1))
+    assert [item["subject"] for item in items] == ["Daily"]
+    items = outlook._scan_series(begin + dt.timedelta(days=10), begin + dt.timedelta(days=11))
+    assert [item["subject"] for item in items] == ["Daily"]
+    assert ended.pattern_reads == 1
+    assert outlook.series_hits == 1
+
+
+def test_unmapped_pattern_is_expanded_by_outlook():
+    odd = Appointment("Odd", dt.datetime(2026, 1, 1, 9), Pattern(7, dt.datetime(2026, 1, 1, 9)))
+    occurrence = Appointment("Odd", dt.datetime(2026, 3, 2, 9))
+    folder = Folder([odd], [occurrence, Appointment("Other", dt.datetime(2026, 3, 2, 10))])
+    begin = dt.datetime(2026, 3, 2)
+    items = source(folder)._scan_series(begin, begin + dt.timedelta(days=1))
+    assert [(item["subject"], item["start"].hour) for item in items] == [("Odd", 9)]
+
+
+def test_fake_source_window():
+    begin = dt.datetime(2026, 3, 2, 9)
+    fake = FakeSource([make_item(begin + dt.timedelta(hours=2), 30, "Later"),
+                       make_item(begin - dt.timedelta(minutes=10), 30, "Started"),
+                       make_item(begin, 60, "Standup")])
+    items = fake.get_items(begin, begin + dt.timedelta(hours=2, minutes=30))
+    assert [item["subject"] for item in items] == ["Standup", "Later"]
+    assert items[0]["end"] == begin + dt.timedelta(hours=1)
+    assert fake.scans == 1
+
+
+def test_fake_source_add_and_remove():
+    begin = dt.datetime(2026, 3, 2, 9)
+    fake = FakeSource()
+    fake.add(make_item(begin + dt.timedelta(hours=1), 30, "Review", resp_stat="Tentative"))
+    fake.add(make_item(begin, 30, "Standup"))
+    end = begin + dt.timedelta(days=1)
+    assert [item["subject"] for item in fake.get_items(begin, end)] == ["Standup", "Review"]
+    assert fake.get_items(begin, end)[1]["resp_stat"] == "Tentative"
+    fake.remove("Standup")
+    assert [item["subject"] for item in fake.get_items(begin, end)] == ["Review"]
@@ -0,0 +1,99 @@
+""" Tests for the drift corrected clock with a fake monotonic source and network time. """
+import pytest
+
+import clock as clock_module
+from clock import DriftClock
+
+NS = 1000000000
+
+
+class Device:
+    """A device clock running at 1 / rate of network time. sync() sets time.time() to the
+    network time, like get_local_time, and a jump moves the network time
+    """
+
+    def __init__(self, rate=1.0):
+        self.rate = rate
+        self.mono = 0.0
+        self.network = 1767600000.0
+        self.wall = 0.0
+        self.jump = 0
+        self.error = None
+
+    def advance(self, secs):
+        self.mono += secs
+        self.network += secs * self.rate
+
+    def sync(self):
+        if self.error:
+            raise self.error
+        self.wall = self.network + self.jump
+
+    def monotonic_ns(self):
+        return int(self.mono * NS)
+
+    def time(self):
+        return self.wall
+
+
+@pytest.fixture
+def device(monkeypatch):
+    device = Device(rate=1.001)
+    monkeypatch.setattr(clock_module.time, "monotonic_ns", device.monotonic_ns)
+    monkeypatch.setattr(clock_module.time, "time", device.time)
+    return device
+
+
+def sync_after(clock, device, secs):
+    device.advance(secs)
+    clock.sync()
+
+
+def test_rate_is_estimated_across_syncs(device):
+    clock = DriftClock(device.sync, min_interval=300)
+    clock.sync()
+    assert clock.rate == 1.0
+    sync_after(clock, device, 300)
+    assert clock.rate == pytest.approx(1.001)
+    assert clock.last_error == pytest.approx(0.3)
+    # between syncs the corrected time follows the network time, not the device seconds
+    device.advance(1000)
+    assert clock.now() == pytest.approx(device.network)
+
+
+def test_interval_doubles_while_the_rate_holds(device):
+    clock = DriftClock(device.sync, min_interval=300, max_interval=2400)
+    clock.sync()
+    intervals = []
+    for _ in range(5):
+        sync_after(clock, device, clock.next_sync_secs())
+        intervals.append(clock.next_sync_secs())
+    assert intervals == [600, 1200, 2400, 2400, 2400]
+    assert clock.syncs == 6
+
+
+def test_interval_resets_after_a_large_jump(device):
+    clock = DriftClock(device.sync, min_interval=300)
+    clock.sync()
+    for _ in range(3):
+        sync_after(clock, device, clock.next_sync_secs())
+    assert clock.next_sync_secs() == 2400
+    rate = clock.rate
+    device.jump = 60
+    sync_after(clock, device, clock.next_sync_secs())
+    assert clock.last_error == pytest.approx(60, abs=0.1)
+    assert clock.next_sync_secs() == 300
+    # a jump is not a believable drift, so the rate is kept
+    assert clock.rate == rate
+    assert clock.now() == pytest.approx(device.network + 60)
+
+
+def test_failed_sync_drops_back_to_the_min_interval(device):
+    clock = DriftClock(device.sync, min_interval=300)
+    clock.sync()
+    sync_after(clock, device, 300)
+    assert clock.next_sync_secs() == 600
+    device.error = OSError("no Wi-Fi")
+    with pytest.raises(OSError):
+        clock.sync()
+    assert clock.next_sync_secs() == 300
@@ -0,0 +1,96 @@
+""" Tests compiling the BDF font into a glyph subset file and loading it with GlyphFont, with
+stand-ins for the CircuitPython displayio and fontio modules. """
+import collections
+import sys
+import types
+
+import pytest
+
+from fontsubset import compile_subset, display_chars, read_bdf
+from glyphfont import GlyphFont
+
+BDF = "fonts/Minecraftia-Regular-8-mod.bdf"
+
+Glyph = collections.namedtuple("Glyph", "bitmap tile_index width height dx dy shift_x shift_y")
+
+
+class Bitmap:
+    def __init__(self, width, height, value_count):
+        self.width = width
+        self.height = height
+        self.pixels = set()
+
+    def __getitem__(self, xy):
+        return int(xy in self.pixels)
+
+    def __setitem__(self, xy, value):
+        if value:
+            self.pixels.add(xy)
+        else:
+            self.pixels.discard(xy)
+
+
+@pytest.fixture
+def circuitpython(monkeypatch):
+    displayio = types.ModuleType("displayio")
+    displayio.Bitmap = Bitmap
+    fontio = types.ModuleType("fontio")
+    fontio.Glyph = Glyph
+    monkeypatch.setitem(sys.modules, "displayio", displayio)
+    monkeypatch.setitem(sys.modules, "fontio", fontio)
+    monkeypatch.setitem(sys.modules, "bitmaptools", None)
+
+
+@pytest.fixture
+def bdf(request):
+    return read_bdf(str(request.config.rootpath / BDF))
+
+
+def glyph_pixels(glyph):
+    """The set pixels of a subset glyph, relative to its tile"""
+    left = glyph.tile_index * glyph.width
+    return {(x - left, y) for x, y in glyph.bitmap.pixels if left <= x < left + glyph.width}
+
+
+def bdf_pixels(bdf_glyph, cell):
+    """The set pixels of a BDF glyph placed in the subset cell"""
+    cell_width, cell_height, cell_x, cell_y = cell
+    _, (width, height, x_off, y_off), rows = bdf_glyph
+    first_row = cell_y + cell_height - (y_off + height)
+    return {(x_off - cell_x + col, first_row + row)
+            for row, bits in enumerate(rows) for col in range(width) if bits & (1 << (width - 1 - col))}
+
+
+def test_compile_then_load_round_trip(circuitpython, bdf, tmp_path):
+    props, glyphs = bdf
+    chars = display_chars()
+    path = tmp_path / "font.glf"
+    path.write_bytes(compile_subset(props, glyphs, chars))
+    font = GlyphFont(str(path))
+    assert font.get_bounding_box() == props["FONTBOUNDINGBOX"]
+    assert (font.ascent, font.descent) == (props["FONT_ASCENT"][0], props["FONT_DESCENT"][0])
+    for char in chars:
+        glyph = font.get_glyph(ord(char))
+        advance = glyphs[ord(char)][0]
+        assert glyph.shift_x == advance, char
+        cell = (glyph.width, glyph.height, glyph.dx, glyph.dy)
+        assert glyph_pixels(glyph) == bdf_pixels(glyphs[ord(char)], cell), char
+    # no fallback font, so a character outside the subset has no glyph
+    assert font.get_glyph(ord("Z")) is None
+
+
+def test_checked_in_subset_is_up_to_date(bdf, request):
+    glf = request.config.rootpath / BDF.replace(".bdf", ".glf")
+    assert glf.read_bytes() == compile_subset(*bdf, display_chars())
+
+
+def test_not_a_subset_file(circuitpython, tmp_path):
+    path = tmp_path / "font.glf"
+    path.write_bytes(b"STARTFONT 2.1\n" + bytes(32))
+    with pytest.raises(ValueError):
+        GlyphFont(str(path))
+
+
+def test_no_characters_in_the_font(bdf):
+    with pytest.raises(ValueError):
+        compile_subset(*bdf, "☃")
@@ -0,0 +1,53 @@
+""" Tests running the shared frames.TEST_VECTORS on the PC side and through the display. """
+import time
+
+import pytest
+
+from app import NextMeetingApp
+from apptcodec import FRAMES_VERSION, decode_appts, pack_appts
+from constants import time_display_colors
+from countdown import CountDown
+from feed import FeedPoller
+from frames import TEST_VECTORS, compute_status, make_frame, self_check
+from replay import STATUS_MSG, RecordingPortal, VirtualClock, virtual_time
+
+
+def entry(start, resp_status, meeting_status):
+    # an hour long, so the display still shows the vectors timed at the half hour
+    return {"start": start, "subject": "Vector", "responseStatus": resp_status,
+            "meeting_status": meeting_status, "duration": 60}
+
+
+def test_self_check_passes():
+    assert self_check() == []
+
+
+@pytest.mark.parametrize("start, resp_status, meeting_status, now, status, text, name", TEST_VECTORS)
+def test_pc_frame(start, resp_status, meeting_status, now, status, text, name):
+    assert compute_status(resp_status, meeting_status) == status
+    frame = make_frame(entry(start, resp_status, meeting_status), time.gmtime)
+    assert frame["status"] == status
+    count_down = CountDown(start, resp_status, frame["label"], frame["edges"])
+    assert count_down.update(now) == (text, time_display_colors[name]["color"])
+    assert count_down.band_name(now) == name
+
+
+@pytest.mark.parametrize("start, resp_status, meeting_status, now, status, text, name", TEST_VECTORS)
+def test_display_decodes_the_frame(start, resp_status, meeting_status, now, status, text, name):
+    value = pack_appts([make_frame(entry(start, resp_status, meeting_status))], FRAMES_VERSION)
+    appt, = decode_appts(value)
+    assert appt["status"] == status
+    count_down = CountDown(appt["start"], appt["responseStatus"], appt["label"], appt["edges"])
+    assert count_down.update(now) == (text, time_display_colors[name]["color"])
+
+    clock = VirtualClock(now)
+    portal = RecordingPortal(clock)
+    app = NextMeetingApp(portal, FeedPoller(lambda: [{"value": value}]), lambda: None, STATUS_MSG,
+                         clock=clock)
+    with virtual_time(clock):
+        app.poll_once()
+        app.tick()
+    changes = [(change[1], change[2], change[3]) for change in portal.changes]
+    assert ("text", 2, STATUS_MSG[status]["text"]) in changes
+    assert ("text", 1, text) in changes
+    assert ("color", 1, time_display_colors[name]["color"]) in changes
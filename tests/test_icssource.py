@@ -0,0 +1,81 @@
+""" Tests for the iCalendar source with the .ics files in tests/ics. """
+import datetime as dt
+import os
+from zoneinfo import ZoneInfo
+
+from calsource import naive
+from icssource import ICSSource, expand_rrule
+
+ICS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ics")
+
+
+def items(name, begin, end, owner="me@example.com"):
+    source = ICSSource(os.path.join(ICS, name), owner=owner)
+    return source.get_items(begin, end)
+
+
+def starts(found):
+    return [naive(item["start"]) for item in found]
+
+
+def local(zone, *when):
+    """The local wall clock time of a time in another time zone"""
+    return dt.datetime(*when, tzinfo=ZoneInfo(zone)).astimezone().replace(tzinfo=None)
+
+
+def test_weekly_byday_with_exdate_and_a_moved_occurrence():
+    found = items("weekly.ics", dt.datetime(2026, 1, 1), dt.datetime(2026, 2, 7))
+    assert starts(found) == [dt.datetime(2026, 1, day, 10) for day in (5, 7, 9, 19)] + \
+        [dt.datetime(2026, 1, 23, 15)] + [dt.datetime(2026, 2, day, 10) for day in (2, 4, 6)]
+    moved = found[4]
+    assert (moved["subject"], moved["duration"], moved["resp_stat"]) == ("Team sync (moved)", 60, "Tentative")
+    assert (found[0]["subject"], found[0]["duration"], found[0]["resp_stat"]) == ("Team sync", 30, "Accepted")
+    assert found[0]["meeting_status"] == "Meeting"
+
+
+def test_until_date_includes_the_whole_day():
+    found = items("until.ics", dt.datetime(2026, 1, 1), dt.datetime(2026, 1, 31))
+    assert starts(found) == [dt.datetime(2026, 1, day, 9) for day in (5, 6, 7, 8)]
+    assert found[0]["duration"] == 15
+
+
+def test_utc_until_in_a_time_zone_across_dst():
+    found = items("until.ics", dt.datetime(2026, 3, 1), dt.datetime(2026, 3, 31))
+    # the wall clock time stays 9:00 in New York after the change on March 8th, and the
+    # last occurrence is the one at the UTC UNTIL
+    assert starts(found) == [local("America/New_York", 2026, 3, day, 9) for day in range(5, 11)]
+
+
+def test_count_is_counted_from_the_first_occurrence():
+    found = items("count.ics", dt.datetime(2026, 1, 1), dt.datetime(2026, 3, 31))
+    assert [naive(item["start"]) for item in found if item["subject"] == "Monthly review"] == \
+        [dt.datetime(2026, 1, 15, 14), dt.datetime(2026, 2, 15, 14)]
+
+
+def test_old_open_ended_series_in_the_window():
+    found = items("count.ics", dt.datetime(2026, 3, 2), dt.datetime(2026, 3, 4))
+    assert starts(found) == [dt.datetime(2026, 3, 2, 8), dt.datetime(2026, 3, 3, 8)]
+
+
+def test_expansion_starts_near_begin_without_count():
+    start = dt.datetime(2015, 6, 1, 8)
+    until = dt.datetime(2026, 3, 4)
+    for rule in ({"FREQ": "DAILY"}, {"FREQ": "WEEKLY", "BYDAY": "MO,TH"},
+                 {"FREQ": "MONTHLY", "INTERVAL": "2"}, {"FREQ": "YEARLY"}):
+        full = expand_rrule(start, rule, until)
+        near = expand_rrule(start, rule, until, begin=dt.datetime(2026, 3, 1))
+        assert 0 < len(near) < 8
+        assert near == full[len(full) - len(near):]
+        assert near[0] <= dt.datetime(2026, 3, 1)
+    counted = expand_rrule(start, {"FREQ": "DAILY", "COUNT": "3"}, until, begin=dt.datetime(2026, 1, 1))
+    assert counted == [start + dt.timedelta(days=day) for day in range(3)]
+
+
+def test_all_day_event_and_a_cancelled_meeting_in_a_time_zone():
+    found = items("allday.ics", dt.datetime(2026, 1, 6), dt.datetime(2026, 1, 8))
+    assert starts(found) == sorted([dt.datetime(2026, 1, 6), local("Europe/Berlin", 2026, 1, 6, 17)])
+    holiday = next(item for item in found if item["subject"] == "Holiday")
+    assert holiday["duration"] == 24 * 60
+    assert holiday["resp_stat"] == "None"
+    call = next(item for item in found if item["subject"] == "Berlin call, cancelled")
+    assert (call["resp_stat"], call["meeting_status"], call["duration"]) == ("Organizer", "Canceled", 60)
@@ -0,0 +1,87 @@
+""" Tests for the glyph copy into the subject strip on each CircuitPython version. """
+import sys
+import types
+
+import pytest
+
+from marquee import _copy_glyph
+
+
+class Bitmap:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = {}
+
+    def __getitem__(self, xy):
+        return self.pixels.get(xy, 0)
+
+    def __setitem__(self, xy, value):
+        self.pixels[xy] = value
+
+
+class Glyph:
+    def __init__(self, bitmap, tile_index, width, height):
+        self.bitmap = bitmap
+        self.tile_index = tile_index
+        self.width = width
+        self.height = height
+
+
+def sheet():
+    """Two 2x2 tiles, the second with a diagonal"""
+    source = Bitmap(4, 2)
+    source[2, 0] = 1
+    source[3, 1] = 1
+    return source
+
+
+def copied(monkeypatch, module):
+    if module is None:
+        monkeypatch.delitem(sys.modules, "bitmaptools", raising=False)
+        monkeypatch.setattr("builtins.__import__", _no_bitmaptools(__import__))
+    else:
+        monkeypatch.setitem(sys.modules, "bitmaptools", module)
+    strip = Bitmap(10, 2)
+    _copy_glyph(strip, Glyph(sheet(), 1, 2, 2), 5, 0)
+    return sorted(xy for xy, value in strip.pixels.items() if value)
+
+
+def _no_bitmaptools(real_import):
+    def fake_import(name, *args, **kwargs):
+        if name == "bitmaptools":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+    return fake_import
+
+
+def test_pixel_loop_without_bitmaptools(monkeypatch):
+    assert copied(monkeypatch, None) == [(5, 0), (6, 1)]
+
+
+def test_circuitpython_8_has_no_blit(monkeypatch):
+    # bitmaptools imports but has no blit, and the test Bitmap has no blit either
+    assert copied(monkeypatch, types.ModuleType("bitmaptools")) == [(5, 0), (6, 1)]
+
+
+def test_circuitpython_9_blit_keywords(monkeypatch):
+    calls = []
+    module = types.ModuleType("bitmaptools")
+
+    def blit(dest, source, x, y, *, x1, y1, x2, y2, skip_source_index=None, skip_dest_index=None):
+        calls.append((x, y, x1, y1, x2, y2, skip_source_index))
+
+    module.blit = blit
+    assert copied(monkeypatch, module) == []
+    assert calls == [(5, 0, 2, 0, 4, 2, 0)]
+
+
+@pytest.mark.parametrize("error", [TypeError, AttributeError])
+def test_blit_error_falls_back(monkeypatch, error):
+    module = types.ModuleType("bitmaptools")
+
+    def blit(*args, **kwargs):
+        raise error("skip_index")
+
+    module.blit = blit
+    assert copied(monkeypatch, module) == [(5, 0), (6, 1)]
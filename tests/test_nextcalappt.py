@@ -0,0 +1,288 @@
+""" Tests for the PC client against the fake Adafruit IO server in fakeaio.py. """
+import datetime as dt
+import sys
+import types
+
+import pytest
+from Adafruit_IO import Client
+
+from calsource import FakeSource, make_item
+from fakeaio import FakeAIO
+
+FEED = "appts"
+SECRETS = {"aio_username": "user", "aio_key": "key", "aio_feed": FEED}
+
+
+@pytest.fixture(scope="module")
+def nca():
+    """The nextCalAppt module, imported with test secrets in place of secrets.py"""
+    saved = sys.modules.get("secrets")
+    sys.modules["secrets"] = types.SimpleNamespace(secrets=SECRETS)
+    try:
+        import nextCalAppt
+    finally:
+        if saved is None:
+            del sys.modules["secrets"]
+        else:
+            sys.modules["secrets"] = saved
+    return nextCalAppt
+
+
+@pytest.fixture
+def server(nca, monkeypatch, tmp_path):
+    """A FakeAIO the client sends to, with a fresh state file and rate limit"""
+    fake = FakeAIO()
+    fake.start()
+    monkeypatch.setattr(nca, "aio", Client("user", "key", base_url=fake.base_url))
+    monkeypatch.setattr(nca, "STATE_FILE", str(tmp_path / "last_published.json"))
+    monkeypatch.setattr(nca, "aio_bucket", nca.TokenBucket(nca.AIO_RATE_PER_MIN))
+    monkeypatch.setattr(nca, "queue_stats", {"merged": 0, "dropped": 0, "deferred": 0})
+    monkeypatch.setattr(nca, "DEBOUNCE_SECS", 0)
+    yield fake
+    fake.stop()
+
+
+def soon(minutes=60):
+    """A start time minutes from now, local time marked as UTC like Outlook times"""
+    now = dt.datetime.now().replace(second=0, microsecond=0, tzinfo=dt.timezone.utc)
+    return now + dt.timedelta(minutes=minutes)
+
+
+def test_mqtt_publish_is_replaced_on_the_next_send(nca, server, monkeypatch):
+    def publish_to_mqtt(key, data):
+        # AIO keeps a value published to the feed topic as a new item
+        with server.lock:
+            server.handle("POST", key, ["data"], {"value": data})
+
+    monkeypatch.setattr(nca, "FEED_TRANSPORT", "mqtt")
+    monkeypatch.setattr(nca, "publish_to_mqtt", publish_to_mqtt)
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    nca.main(source)
+    source.add(make_item(soon(90), 30, "Review"))
+    nca.main(source)
+    assert len(server.feeds[FEED]) == 1
+    assert server.count("DELETE") == 1
+
+
+class Stop(Exception):
+    pass
+
+
+def test_daemon_keeps_running_after_a_failed_check(nca, server, monkeypatch):
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    checks = []
+    main = nca.main
+
+    def flaky_main(sources):
+        checks.append(sources)
+        if len(checks) == 1:
+            raise ConnectionError("network away")
+        main(sources)
+
+    def idle(secs):
+        if len(checks) >= 3:
+            raise Stop
+
+    monkeypatch.setattr(nca, "main", flaky_main)
+    monkeypatch.setattr(nca, "idle", idle)
+    with pytest.raises(Stop):
+        nca.run_daemon(source)
+    assert len(checks) == 3
+    assert server.count("POST") == 1
+    assert [appt["subject"] for appt in nca.decode_appts(server.feeds[FEED][0]["value"])] == ["Standup"]
+
+
+def test_failed_feed_does_not_lose_the_other_records(nca, server, monkeypatch):
+    send_to_aio = nca.send_to_aio
+
+    def flaky_send(key, data):
+        if key == "room":
+            raise ConnectionError("connection reset")
+        return send_to_aio(key, data)
+
+    monkeypatch.setattr(nca, "send_to_aio", flaky_send)
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    nca.main({FEED: source, "room": source})
+    state = nca.load_published()
+    assert [key for key in state if key != nca.RATE_STATE_KEY] == [FEED]
+    assert state[FEED]["id"] == server.feeds[FEED][-1]["id"]
+
+
+def test_rate_limit_carries_over_to_the_next_run(nca):
+    bucket = nca.TokenBucket(3)
+    assert all(bucket.take(0) for _ in range(3))
+    next_run = nca.TokenBucket(3)
+    next_run.restore(bucket.save())
+    assert not next_run.take(0)
+
+
+def test_throttled_wait_carries_over_to_the_next_run(nca):
+    bucket = nca.TokenBucket(30)
+    bucket.drain(60)
+    saved = bucket.save()
+    next_run = nca.TokenBucket(30)
+    next_run.restore(dict(saved, at=saved["at"] - 30))
+    assert not next_run.take(0)
+    assert next_run.tokens == pytest.approx(-15, abs=0.5)
+
+
+def test_one_shot_runs_share_the_rate_limit(nca, server, monkeypatch):
+    monkeypatch.setattr(nca, "RATE_WAIT_SECS", 0)
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    nca.main(source)
+    # the next run of send_appts.bat starts with a new bucket
+    monkeypatch.setattr(nca, "aio_bucket", nca.TokenBucket(nca.AIO_RATE_PER_MIN))
+    nca.main(source)
+    assert nca.aio_bucket.tokens == pytest.approx(nca.AIO_RATE_PER_MIN - 2, abs=0.1)
+
+
+def test_old_item_is_deleted_at_a_later_check(nca, server, monkeypatch):
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    nca.main(source)
+    first_id = server.feeds[FEED][0]["id"]
+    delete = nca.aio.delete
+
+    def rate_limited(*args):
+        raise nca.RateLimitError("no AIO request allowed")
+
+    monkeypatch.setattr(nca.aio, "delete", rate_limited)
+    source.add(make_item(soon(90), 30, "Review"))
+    nca.main(source)
+    assert len(server.feeds[FEED]) == 2
+    assert nca.load_published()[FEED]["stale"] == [first_id]
+
+    monkeypatch.setattr(nca.aio, "delete", delete)
+    posts = server.count("POST")
+    nca.main(source)
+    assert [item["id"] for item in server.feeds[FEED]] == [nca.load_published()[FEED]["id"]]
+    assert "stale" not in nca.load_published()[FEED]
+    assert server.count("POST") == posts
+
+
+def test_only_rate_limited_sends_are_counted_as_put_off(nca, server, monkeypatch):
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+
+    def refused(key, data):
+        raise nca.RequestError(type("Response", (), {"status_code": 400, "reason": "Bad Request",
+                                                     "json": lambda self: {}})())
+
+    monkeypatch.setattr(nca, "send_to_aio", refused)
+    nca.main(source)
+    assert nca.queue_stats["deferred"] == 0
+
+    def rate_limited(key, data):
+        raise nca.RateLimitError("no AIO request allowed")
+
+    monkeypatch.setattr(nca, "send_to_aio", rate_limited)
+    nca.main(source)
+    assert nca.queue_stats["deferred"] == 1
+    assert FEED not in nca.load_published()
+
+
+def age_record(nca, secs, pending=False):
+    """Move the STATE_FILE record of the feed secs into the past"""
+    state = nca.load_published()
+    if pending:
+        state[FEED]["pending"]["changed_at"] -= secs
+        state[FEED]["pending"]["first_at"] -= secs
+    else:
+        state[FEED]["sent_at"] -= secs
+    nca.save_published(state)
+
+
+def test_unchanged_value_makes_no_requests(nca, server):
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    nca.main(source)
+    # one receive to find the item to replace, then the send
+    assert (server.count("GET"), server.count("POST")) == (1, 1)
+    requests = server.count()
+    nca.main(source)
+    nca.main(source)
+    assert server.count() == requests
+
+
+def test_changed_value_is_sent_and_the_old_item_deleted(nca, server):
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    nca.main(source)
+    requests = server.count()
+    source.add(make_item(soon(90), 30, "Review"))
+    nca.main(source)
+    assert server.count() - requests == 2
+    assert server.requests[-2][0] == "POST" and server.requests[-1][0] == "DELETE"
+    assert len(server.feeds[FEED]) == 1
+
+
+def test_unchanged_value_is_sent_again_after_republish_secs(nca, server):
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    nca.main(source)
+    age_record(nca, nca.REPUBLISH_SECS - 60)
+    requests = server.count()
+    nca.main(source)
+    assert server.count() == requests
+    age_record(nca, 120)
+    nca.main(source)
+    assert (server.count("POST"), server.count("DELETE")) == (2, 1)
+    assert len(server.feeds[FEED]) == 1
+
+
+def test_change_is_held_until_it_settles(nca, server, monkeypatch):
+    monkeypatch.setattr(nca, "DEBOUNCE_SECS", 45)
+    source = FakeSource([make_item(soon(), 30, "Standup")])
+    nca.main(source)
+    requests = server.count()
+    source.add(make_item(soon(90), 30, "Review"))
+    nca.main(source)
+    source.add(make_item(soon(120), 30, "Lunch"))
+    nca.main(source)
+    assert server.count() == requests
+    assert nca.load_published()[FEED]["pending"]["merged"] == 1
+    age_record(nca, 60, pending=True)
+    nca.main(source)
+    assert server.count() - requests == 2
+    assert [appt["subject"] for appt in nca.decode_appts(server.feeds[FEED][0]["value"])] == \
+        ["Standup", "Review", "Lunch"]
+    assert "pending" not in nca.load_published()[FEED]
+
+
+def test_change_to_a_meeting_starting_soon_is_not_held(nca, server, monkeypatch):
+    monkeypatch.setattr(nca, "DEBOUNCE_SECS", 45)
+    source = FakeSource([make_item(soon(60), 30, "Standup")])
+    nca.main(source)
+    requests = server.count()
+    source.add(make_item(soon(10), 10, "Quick chat"))
+    nca.main(source)
+    assert server.count() - requests == 2
+
+
+def test_value_the_packed_format_can_not_hold_is_sent_as_json(nca):
+    entry = {"start": 1767600000, "subject": "Offsite", "responseStatus": "Accepted",
+             "meeting_status": "Meeting", "duration": 3 * 24 * 60 * 20}
+    value = nca.encode_appts([entry])
+    assert value.startswith("{")
+    assert nca.decode_appts(value) == [entry]
+
+
+@pytest.mark.parametrize("encoding", ["packed", "frames"])
+def test_replay_publishes_through_the_client(nca, encoding):
+    import replay
+
+    start = 1767571200
+    trace = replay.generate_trace(start, seed=3)
+    trace.append(dict(trace[0], subject="Same start"))
+    result = replay.replay(trace, start, 86400, encoding=encoding)
+    assert result["missed"] == []
+    assert result["feed_changes"] == result["published"] > 1
+    assert nca.FEED_ENCODING == "packed"
+    # the scrolling and the fixed subject text boxes
+    subjects = {change[3] for change in result["display_log"] if change[1:3] in (("text", 0), ("text", 3))}
+    assert nca.MULTIPLE_APPTS_STR in subjects
+
+
+def test_feeds_reading_one_calendar_share_the_source(nca):
+    sources = nca.calendar_sources([{"feed": "desk", "ics": "tests/ics/weekly.ics"},
+                                    {"feed": "door", "ics": "tests/ics/weekly.ics"},
+                                    {"feed": "room", "ics": "tests/ics/count.ics"}])
+    assert sources["desk"] is sources["door"]
+    assert sources["room"] is not sources["desk"]
+    # the calendar module is still the one main() uses
+    assert nca.calendar.timegm((2026, 1, 5, 0, 0, 0)) == 1767571200
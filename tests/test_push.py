@@ -0,0 +1,133 @@
+""" Tests for the MQTT feed subscriber with a stand-in for the adafruit_minimqtt client,
+and through the fakemqtt.py broker with paho. """
+import time
+
+import paho.mqtt.client as mqtt
+import paho.mqtt.publish as publish
+
+from app import NextMeetingApp
+from apptcodec import pack_appts
+from fakemqtt import FakeMQTT
+from feed import FeedPoller
+from push import FeedSubscriber
+from replay import STATUS_MSG, RecordingPortal, VirtualClock, virtual_time
+
+TOPIC = "user/feeds/appts"
+
+
+class Client:
+    """Checks the loop timeout like adafruit_minimqtt 7 and later"""
+
+    def __init__(self, socket_timeout=1):
+        self._socket_timeout = socket_timeout
+        self.on_message = None
+        self.pending = []
+        self.loops = []
+
+    def connect(self):
+        pass
+
+    def subscribe(self, topic):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def loop(self, timeout=1.0):
+        if timeout < self._socket_timeout:
+            raise ValueError("loop timeout must be >= socket timeout")
+        self.loops.append(timeout)
+        for topic, message in self.pending:
+            self.on_message(self, topic, message)
+        self.pending = []
+
+
+def test_short_socket_timeout_loops_without_blocking():
+    client = Client(socket_timeout=0.01)
+    push = FeedSubscriber(client, TOPIC)
+    assert push.connect()
+    client.pending.append((TOPIC, "value"))
+    assert push.loop() == "value"
+    assert push.loop() is None
+    assert push.connected
+    assert client.loops == [0.01, 0.01]
+
+
+def test_loop_timeout_is_not_shorter_than_the_socket_timeout():
+    client = Client(socket_timeout=1)
+    push = FeedSubscriber(client, TOPIC)
+    push.connect()
+    assert push.loop() is None
+    assert push.connected
+    assert client.loops == [1]
+
+
+def test_other_topics_are_ignored():
+    client = Client(socket_timeout=0.01)
+    push = FeedSubscriber(client, TOPIC)
+    push.connect()
+    client.pending.append(("user/feeds/other", "value"))
+    assert push.loop() is None
+    assert push.messages == 0
+
+
+class PahoClient:
+    """The adafruit_minimqtt calls FeedSubscriber makes, on a paho client"""
+
+    def __init__(self, port):
+        self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self._client.on_message = lambda client, userdata, msg: self.on_message(
+            self, msg.topic, msg.payload.decode())
+        self._client.on_subscribe = lambda *args: setattr(self, "subscribed", True)
+        self._socket_timeout = 0.01
+        self.port = port
+        self.on_message = None
+        self.subscribed = False
+
+    def connect(self):
+        self._client.connect("127.0.0.1", self.port)
+
+    def subscribe(self, topic):
+        self._client.subscribe(topic)
+
+    def disconnect(self):
+        self._client.disconnect()
+
+    def loop(self, timeout=1.0):
+        self._client.loop(timeout)
+
+
+def wait_for(check, secs=5):
+    deadline = time.monotonic() + secs
+    while time.monotonic() < deadline:
+        value = check()
+        if value:
+            return value
+    return None
+
+
+def test_value_published_to_fakemqtt_reaches_the_app():
+    start = 1767600000
+    broker = FakeMQTT()
+    broker.start()
+    try:
+        client = PahoClient(broker.port)
+        push = FeedSubscriber(client, TOPIC)
+        assert push.connect()
+        assert wait_for(lambda: push.loop() is None and client.subscribed)
+        value = pack_appts([{"start": start + 600, "subject": "Pushed", "responseStatus": "Accepted",
+                             "meeting_status": "Meeting", "duration": 30}])
+        publish.single(TOPIC, value, hostname="127.0.0.1", port=broker.port)
+        received = wait_for(push.loop)
+        client.disconnect()
+    finally:
+        broker.stop()
+    assert received == value
+    assert broker.count(TOPIC) == 1
+
+    clock = VirtualClock(start)
+    portal = RecordingPortal(clock)
+    app = NextMeetingApp(portal, FeedPoller(lambda: []), lambda: None, STATUS_MSG, clock=clock, push=push)
+    with virtual_time(clock):
+        app.accept_push(received)
+    assert [change[3] for change in portal.changes if change[1:3] == ("text", 3)][-1] == "Pushed"
@@ -0,0 +1,86 @@
+""" Tests for the appointment snapshot in a bytearray standing in for microcontroller.nvm. """
+import pytest
+
+from app import NextMeetingApp
+from feed import FeedPoller
+from replay import STATUS_MSG, RecordingPortal, VirtualClock, virtual_time
+from snapshot import MAGIC, Snapshot
+
+START = 1767600000
+# the header is the magic, time, length and CRC32 of the packed appointments
+HEADER = 14
+LENGTH = slice(8, 10)
+CRC = 12
+APPTS = [{"start": START + 3600, "subject": "Standup", "responseStatus": "Accepted",
+          "meeting_status": "Meeting", "duration": 30}]
+
+
+def saved(size=256):
+    nvm = bytearray(size)
+    assert Snapshot(nvm).save(APPTS, START)
+    return nvm
+
+
+def test_round_trip():
+    nvm = saved()
+    assert nvm[:4] == MAGIC
+    assert Snapshot(nvm).load() == (APPTS, START)
+
+
+def test_unchanged_appointments_only_save_the_time():
+    nvm = bytearray(256)
+    snapshot = Snapshot(nvm, time_secs=3600)
+    snapshot.save(APPTS, START)
+    image = bytes(nvm)
+    assert not snapshot.save(APPTS, START + 60)
+    assert bytes(nvm) == image
+    assert snapshot.save(APPTS, START + 3600)
+    assert Snapshot(nvm).load() == (APPTS, START + 3600)
+    assert snapshot.saves == 2
+
+
+def test_blank_memory_loads_nothing():
+    assert Snapshot(bytearray(256)).load() == (None, 0)
+
+
+def test_corrupted_crc_is_rejected():
+    nvm = saved()
+    nvm[CRC] ^= 0xFF
+    assert Snapshot(nvm).load() == (None, 0)
+
+
+def test_corrupted_appointments_are_rejected():
+    nvm = saved()
+    nvm[HEADER + 5] ^= 0x01
+    assert Snapshot(nvm).load() == (None, 0)
+
+
+def test_truncated_image_is_rejected():
+    nvm = saved()
+    length = int.from_bytes(nvm[LENGTH], "big")
+    assert Snapshot(nvm[:HEADER + length - 1]).load() == (None, 0)
+
+
+def test_write_cut_short_is_rejected():
+    nvm = saved()
+    length = int.from_bytes(nvm[LENGTH], "big")
+    nvm[HEADER + length // 2:HEADER + length] = bytes(length - length // 2)
+    assert Snapshot(nvm).load() == (None, 0)
+
+
+def test_too_big_for_the_memory():
+    with pytest.raises(ValueError):
+        Snapshot(bytearray(32)).save(APPTS, START)
+
+
+def test_app_cold_starts_from_a_corrupted_snapshot():
+    nvm = saved()
+    nvm[CRC] ^= 0xFF
+    clock = VirtualClock(START)
+    portal = RecordingPortal(clock)
+    app = NextMeetingApp(portal, FeedPoller(lambda: []), lambda: None, STATUS_MSG, clock=clock,
+                         snapshot=Snapshot(nvm))
+    with virtual_time(clock):
+        assert not app.restore()
+    assert not app.time_estimated
+    assert [change for change in portal.changes if change[1] == "text" and change[3] == "Standup"] == []